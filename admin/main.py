@@ -1,35 +1,58 @@
 # admin/main.py
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
+from contextlib import asynccontextmanager
 from database_client import DatabaseClient
-import aiosqlite
+from delivery_signal import notify_affiliate_added
+from metrics import registry, fetch_metrics, render_prometheus
+from config import Config
 import os
 
-app = FastAPI()
-templates = Jinja2Templates(directory="admin/templates")
 db_client = DatabaseClient()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep one pooled connection set open for the lifetime of the app
+    await db_client.open()
+    yield
+    await db_client.close()
+
+app = FastAPI(lifespan=lifespan)
+templates = Jinja2Templates(directory="admin/templates")
+
 @app.get("/", response_class=HTMLResponse)
 async def read_pending(request: Request):
     """
     Fetches responses that are awaiting affiliate links. 
     Only entries where 'affiliate_link' is NULL and status is 'pending' are retrieved.
+    Responses still being generated are listed separately, without actions,
+    as are sends that never confirmed delivery, which can be requeued.
+    """
+    try:
+        rows = await db_client.fetch_pending_responses()
+        drafts = await db_client.fetch_draft_responses()
+        stranded = await db_client.fetch_unconfirmed_sends()
+        return templates.TemplateResponse("pending.html", {
+            "request": request, 
+            "responses": rows,
+            "drafts": drafts,
+            "stranded": stranded,
+            "message": request.query_params.get("message"),
+            "message_type": request.query_params.get("type")
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/drafts", response_class=HTMLResponse)
+async def read_drafts(request: Request):
+    """
+    Renders just the table of responses being generated. The pending page
+    polls it, so drafts update without reloading the affiliate link forms.
     """
     try:
-        async with aiosqlite.connect(db_client.db_path) as db:
-            cursor = await db.execute("""
-                SELECT unique_number, contact, message_text, generated_response
-                FROM final_response_table
-                WHERE affiliate_link IS NULL AND status = 'pending';
-            """)
-            rows = await cursor.fetchall()
-            return templates.TemplateResponse("pending.html", {
-                "request": request, 
-                "responses": rows,
-                "message": request.query_params.get("message"),
-                "message_type": request.query_params.get("type")
-            })
+        drafts = await db_client.fetch_draft_responses()
+        return templates.TemplateResponse("drafts.html", {"request": request, "drafts": drafts})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -51,6 +74,8 @@ async def add_affiliate(
     # Update the affiliate link in the database
     try:
         await db_client.update_affiliate_link(unique_number, affiliate_link)
+        # Wake the bot so the response goes out now rather than on its next check
+        notify_affiliate_added(Config.DELIVERY_NOTIFY_PORT)
         # Redirect with success message
         return RedirectResponse(url="/?message=Affiliate link added successfully.&type=success", status_code=303)
     except Exception as e:
@@ -72,3 +97,35 @@ async def delete_response(
     except Exception as e:
         # Redirect with error message
         return RedirectResponse(url=f"/?message=Error deleting response: {str(e)}&type=error", status_code=303)
+
+@app.post("/requeue_send/")
+async def requeue_send(
+    request: Request,
+    unique_number: int = Form(...)
+):
+    """
+    Puts a response stuck in 'sending' back in line for delivery. The
+    operator should check the group first, as it may already have gone out.
+    """
+    try:
+        if not await db_client.release_claimed_response(unique_number):
+            return RedirectResponse(url="/?message=Response is no longer waiting on a send.&type=error", status_code=303)
+        notify_affiliate_added(Config.DELIVERY_NOTIFY_PORT)
+        return RedirectResponse(url="/?message=Response requeued for sending.&type=success", status_code=303)
+    except Exception as e:
+        return RedirectResponse(url=f"/?message=Error requeueing response: {str(e)}&type=error", status_code=303)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Exposes the metrics of every running bot instance, as written to the
+    'metrics' table, and of this app, in the Prometheus text format.
+    """
+    try:
+        series = await fetch_metrics(db_client, Config.METRICS_STALE_SECONDS)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    for entry in registry.snapshot():
+        entry["labels"]["bot_instance"] = "admin"
+        series.append(entry)
+    return PlainTextResponse(render_prometheus(series), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,119 @@
+# audit_log_writer.py
+
+import asyncio
+import logging
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+GROQ_LOG_INSERT = """
+    INSERT INTO groq_logs (message_text, classification)
+    VALUES (?, ?);
+"""
+
+PERPLEXITY_LOG_INSERT = """
+    INSERT INTO perplexity_logs (query, contact, response)
+    VALUES (?, ?, ?);
+"""
+
+class AuditLogWriter:
+    def __init__(self, db_client, max_queue_size: int = 10000, batch_size: int = 200,
+        flush_interval: float = 1.0):
+        """
+        Buffers groq_logs and perplexity_logs rows and writes them from a
+        background task with executemany, so API call paths never wait on the
+        database.
+
+        Args:
+            db_client (DatabaseClient): Database the rows are written to.
+            max_queue_size (int): Records buffered before new ones are dropped.
+            batch_size (int): Records that trigger a flush.
+            flush_interval (float): Seconds after which a partial batch is flushed.
+        """
+        self.db_client = db_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flushes everything still buffered and stops the background task.
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(f"Audit log writer stopped ({self.written} written, {self.dropped} dropped)")
+
+    def submit(self, query: str, params: tuple) -> bool:
+        """
+        Queues one row without blocking.
+
+        Returns:
+            bool: False if the buffer was full and the row was dropped.
+        """
+        try:
+            self._queue.put_nowait((query, params))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Audit log buffer full, dropped a record ({self.dropped} so far)")
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                if deadline is None:
+                    item = await self._queue.get()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+            if stopping:
+                # Drain whatever was queued before stop()
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        rows_by_query = {}
+        for query, params in batch:
+            rows_by_query.setdefault(query, []).append(params)
+        try:
+            with registry.timer("db_operation_seconds", errors="db_errors_total", operation="flush_audit_logs"):
+                async with self.db_client.transaction() as db:
+                    for query, rows in rows_by_query.items():
+                        await db.executemany(query, rows)
+            self.written += len(batch)
+            logger.debug(f"Flushed {len(batch)} audit log records")
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} audit log records: {e}")
@@ -0,0 +1,49 @@
+# benchmark_database_client.py
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from database_client import DatabaseClient
+from dedup import hash_message_id
+from initialize_db import initialize_db
+
+async def run_inserts(db_client: DatabaseClient, count: int, concurrency: int, offset: int) -> float:
+    """
+    Inserts `count` processed messages from `concurrency` coroutines and
+    returns the achieved inserts per second.
+    """
+    async def worker(worker_id: int):
+        for i in range(worker_id, count, concurrency):
+            await db_client.insert_processed_message(hash_message_id(f"bench_{offset + i}"), offset + i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return count / (time.perf_counter() - start)
+
+async def benchmark(count: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "benchmark.db")
+        await initialize_db(db_path)
+
+        results = {}
+        results["connect-per-call"] = await run_inserts(DatabaseClient(db_path), count, concurrency, 0)
+        async with DatabaseClient(db_path) as db_client:
+            results["pooled"] = await run_inserts(db_client, count, concurrency, count)
+        async with DatabaseClient(db_path, group_commit=True) as db_client:
+            results["pooled + group commit"] = await run_inserts(db_client, count, concurrency, 2 * count)
+
+    baseline = results["connect-per-call"]
+    print(f"{count} inserts, {concurrency} concurrent coroutines")
+    for name, rate in results.items():
+        print(f"{name:>24}: {rate:10.0f} inserts/sec ({rate / baseline:.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare DatabaseClient insert throughput.")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(benchmark(args.count, args.concurrency))
@@ -0,0 +1,110 @@
+# benchmark_message_ids.py
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import aiosqlite
+from database_client import DatabaseClient
+from dedup import compact_message_id
+from initialize_db import migrate_processed_messages
+
+# The layout used before message IDs were compacted
+LEGACY_SCHEMA = """
+    CREATE TABLE processed_messages (
+        message_id TEXT PRIMARY KEY,
+        unique_number INTEGER NOT NULL
+    );
+"""
+
+def legacy_id(i: int) -> str:
+    return hashlib.sha256(f"bench_{i}".encode()).hexdigest()
+
+def build_legacy_db(db_path: str, rows: int, chunk: int = 100000):
+    """
+    Fills a database with `rows` hex message IDs in the legacy layout. IDs
+    arrive in hash order, as they do from the scraper.
+    """
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA journal_mode = OFF;")
+    db.execute("PRAGMA synchronous = OFF;")
+    db.execute(LEGACY_SCHEMA)
+    for first in range(0, rows, chunk):
+        db.executemany("INSERT INTO processed_messages (message_id, unique_number) VALUES (?, ?);",
+                       [(legacy_id(i), i + 1) for i in range(first, min(first + chunk, rows))])
+        db.commit()
+    db.execute("VACUUM;")  # Compared with the migrated table, which is vacuumed too
+    db.close()
+
+def size_on_disk(db_path: str) -> int:
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    db.close()
+    return sum(os.path.getsize(path) for path in (db_path, db_path + "-wal") if os.path.exists(path))
+
+async def run_lookups(db_path: str, batches: list) -> float:
+    """
+    Looks the batches up with DatabaseClient.filter_processed_messages, as
+    the deduplicator does for each poll, and returns IDs checked per second.
+    """
+    async with DatabaseClient(db_path) as db_client:
+        await db_client.filter_processed_messages(batches[0])  # Opens the connection outside the timing
+        start = time.perf_counter()
+        found = 0
+        for batch in batches:
+            processed = await db_client.filter_processed_messages(batch)
+            found += sum(message_id in processed for message_id in batch)
+        elapsed = time.perf_counter() - start
+    checked = sum(len(batch) for batch in batches)
+    assert found == checked // 2, "half of the looked up IDs should be known"
+    return checked / elapsed
+
+async def migrate(db_path: str) -> float:
+    async with aiosqlite.connect(db_path) as db:
+        start = time.perf_counter()
+        await migrate_processed_messages(db)
+        elapsed = time.perf_counter() - start
+        await db.execute("VACUUM;")  # Let the file shrink to the new table's size
+    return elapsed
+
+async def benchmark(rows: int, lookups: int, batch_size: int, directory: str, seed: int):
+    rng = random.Random(seed)
+    # Half known IDs, half never seen, like a poll of mostly old messages with some new ones
+    ids = [legacy_id(rng.randrange(rows)) if n % 2 == 0 else legacy_id(rows + n) for n in range(lookups)]
+    rng.shuffle(ids)
+    batches = [ids[first:first + batch_size] for first in range(0, len(ids), batch_size)]
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        db_path = os.path.join(tmp, "benchmark.db")
+        start = time.perf_counter()
+        build_legacy_db(db_path, rows)
+        print(f"Built {rows} rows in {time.perf_counter() - start:.1f}s; {lookups} lookups in batches of {batch_size}")
+
+        results = {}
+        results["hex TEXT, rowid table"] = (size_on_disk(db_path), await run_lookups(db_path, batches))
+        migration_seconds = await migrate(db_path)
+        compact_batches = [[compact_message_id(message_id) for message_id in batch] for batch in batches]
+        results["16-byte BLOB, WITHOUT ROWID"] = (size_on_disk(db_path), await run_lookups(db_path, compact_batches))
+
+    baseline_size, baseline_rate = results["hex TEXT, rowid table"]
+    for name, (size, rate) in results.items():
+        print(f"{name:>28}: {size / 2**20:9.1f} MiB ({size / rows:5.1f} B/row, {size / baseline_size:.2f}x)  "
+              f"{rate:10.0f} lookups/sec ({rate / baseline_rate:.2f}x)")
+    print(f"Migration took {migration_seconds:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the size and lookup speed of the hex and compact processed_messages layouts.")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Processed messages in the table")
+    parser.add_argument("--lookups", type=int, default=200_000, help="Message IDs looked up")
+    parser.add_argument("--batch-size", type=int, default=50, help="IDs per lookup, like one poll")
+    parser.add_argument("--dir", default=None, help="Where to build the database; it needs a few GB at 10M rows")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(benchmark(args.rows, args.lookups, args.batch_size, args.dir, args.seed))
@@ -0,0 +1,40 @@
+# benchmark_perplexity_client.py
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from perplexity_client import PerplexityClient
+from stub_servers import StubPerplexityServer
+
+async def measure(client: PerplexityClient, count: int) -> list:
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        await client.fetch_recommendation(f"need a kettle {i}", "Bob")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def summarize(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:>22}: p50 {p50:7.2f} ms, p95 {p95:7.2f} ms, mean {statistics.mean(latencies) * 1000:7.2f} ms")
+
+async def benchmark(count: int, latency: float):
+    async with StubPerplexityServer(latency=latency) as server:
+        per_request = PerplexityClient(db_client=None, base_url=server.base_url)
+        summarize("session per request", await measure(per_request, count))
+
+        async with PerplexityClient(db_client=None, base_url=server.base_url) as shared:
+            summarize("shared session", await measure(shared, count))
+            print(f"shared session stats: {shared.connection_stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-request and shared aiohttp sessions against a local stub.")
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server think time in seconds")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(benchmark(args.count, args.latency))
@@ -0,0 +1,428 @@
+# benchmark_pipeline.py
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from config import Config
+from database_client import DatabaseClient
+from delivery_signal import notify_affiliate_added
+from fake_whatsapp import ReplayDriver, TranscriptMessage
+from initialize_db import initialize_db
+from stub_servers import StubGroqServer, StubPerplexityServer, is_need
+from whatsapp_automation import WhatsAppBot
+from work_queue import ACTIVE_STATES
+
+RESULTS_PATH = os.path.join("benchmark_results", "pipeline.jsonl")
+AFFILIATE_LINK = "https://example.com/p/{}"
+AFFILIATE_LINK_PATTERN = re.compile(r"https://example\.com/p/(\d+)")
+
+NEED_TEMPLATES = [
+    "any good {product} under {price}?",
+    "need a {product} for {purpose}",
+    "can someone suggest a {product}?",
+    "looking for the best {product} under {price}",
+    "which {product} should I buy for {purpose}?",
+]
+CHATTER_TEMPLATES = [
+    "good morning everyone",
+    "lol",
+    "haha so true",
+    "ok",
+    "thanks!",
+    "see you at {hour} then",
+    "did anyone watch the match yesterday",
+    "congrats {name}!",
+    "happy birthday {name}",
+    "sending the photos now",
+    "traffic is terrible today",
+    "{name} are you coming tonight",
+]
+PRODUCTS = ["earphones", "laptop bag", "air fryer", "trimmer", "running shoes", "phone", "kettle", "backpack",
+            "sunscreen", "office chair", "water bottle", "smartwatch"]
+PURPOSES = ["travel", "my dad", "college", "the gym", "daily use", "gifting", "work from home"]
+PRICES = ["1k", "2k", "5k", "10k", "20k"]
+NAMES = ["Asha", "Ravi", "Meera", "Kabir", "Priya", "Arjun", "Neha", "Vikram"]
+
+def synthetic_transcript(count: int, groups, rate: float, need_ratio: float, seed: int = 1) -> list:
+    """
+    Generates `count` group messages with Poisson arrivals at `rate` messages
+    per second, a `need_ratio` share of them product needs.
+    """
+    rng = random.Random(seed)
+    members = [f"+91 9{rng.randrange(10 ** 8, 10 ** 9)}" for _ in range(300)]
+    transcript = []
+    at = 0.0
+    for _ in range(count):
+        at += rng.expovariate(rate) if rate else 0.0
+        minute = int(at // 60)
+        stamp = f"{10 + minute // 60 % 14}:{minute % 60:02d}, 01/01/2025"
+        need = rng.random() < need_ratio
+        template = rng.choice(NEED_TEMPLATES if need else CHATTER_TEMPLATES)
+        text = template.format(product=rng.choice(PRODUCTS), purpose=rng.choice(PURPOSES), price=rng.choice(PRICES),
+                               name=rng.choice(NAMES), hour=rng.randrange(5, 11))
+        transcript.append(TranscriptMessage(round(at, 3), rng.choice(groups), f"[{stamp}] {rng.choice(members)}: ",
+                                            text, need))
+    return transcript
+
+def load_transcript(path: str) -> list:
+    """
+    Reads a recorded transcript: one JSON object per line with 'at' (seconds
+    from the start), 'group', 'metadata' (WhatsApp's data-pre-plain-text,
+    e.g. "[10:01, 01/01/2025] Bob: "), 'text' and optionally 'need'.
+    """
+    with open(path) as f:
+        return [TranscriptMessage(entry["at"], entry["group"], entry["metadata"], entry["text"], entry.get("need"))
+                for entry in map(json.loads, filter(str.strip, f))]
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def percentile(p: float) -> float:
+        return round(1000 * values[min(len(values) - 1, int(p * len(values)))], 1)
+
+    return {"count": len(values), "p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+
+class StatementCounter:
+    """
+    Counts the SQL statements run on a DatabaseClient's pooled connections,
+    by leading keyword.
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str):
+        keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        with self._lock:
+            self.counts[keyword] += 1
+
+    def attach(self, db_client: DatabaseClient):
+        connect = db_client._connect
+
+        async def traced_connect():
+            db = await connect()
+            await db.set_trace_callback(self.record)
+            return db
+
+        db_client._connect = traced_connect
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+@contextmanager
+def configured(**overrides):
+    """
+    Temporarily overrides Config attributes.
+    """
+    saved = {name: getattr(Config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def approve_responses(admin: DatabaseClient, approved_at: dict, delay: float):
+    """
+    Plays the admin: adds an affiliate link to every pending response `delay`
+    seconds after it shows up, and notifies the bot.
+    """
+    first_seen = {}
+    while True:
+        now = time.time()
+        for row in await admin.fetch_pending_responses():
+            unique_number = row[0]
+            first_seen.setdefault(unique_number, now)
+            if now - first_seen[unique_number] >= delay and unique_number not in approved_at:
+                await admin.update_affiliate_link(unique_number, AFFILIATE_LINK.format(unique_number))
+                approved_at[unique_number] = time.time()
+                notify_affiliate_added(Config.DELIVERY_NOTIFY_PORT)
+        await asyncio.sleep(0.02)
+
+async def wait_for_completion(bot: WhatsAppBot, driver: ReplayDriver, admin: DatabaseClient, run_task, expected: int,
+    timeout: float):
+    """
+    Waits until the whole transcript has been replayed, all `expected`
+    distinct messages are recorded, every work item is finished and every
+    final response is sent. Returns False on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if run_task.done():
+            run_task.result()
+            raise RuntimeError("The bot stopped before the replay finished")
+        if driver.finished and not bot.outbound.qsize():
+            async with admin.connection() as db:
+                cursor = await db.execute("SELECT COUNT(*) FROM processed_messages;")
+                processed = (await cursor.fetchone())[0]
+                cursor = await db.execute("SELECT COUNT(*) FROM final_response_table WHERE status != 'sent';")
+                unsent = (await cursor.fetchone())[0]
+            counts = await bot.work_queue.counts()
+            if processed >= expected and not unsent and not any(counts.get(state) for state in ACTIVE_STATES):
+                return True
+        await asyncio.sleep(0.02)
+    return False
+
+async def run_replay(transcript, speed: float = 1.0, groq_profile: dict = None, perplexity_profile: dict = None,
+    approve_delay: float = 0.5, command_latency: float = 0.0, poll_interval: float = None, ingestion_mode: str = None,
+    production_limits: bool = False, timeout: float = 300) -> dict:
+    """
+    Runs WhatsAppBot end to end against a replayed transcript, stub Groq and
+    Perplexity servers and a temporary database, and measures it.
+
+    Args:
+        transcript: TranscriptMessage entries.
+        speed (float): Replay speed-up; 0 makes the whole transcript visible at once.
+        groq_profile (dict): StubGroqServer latency and error settings.
+        perplexity_profile (dict): StubPerplexityServer latency, streaming and error settings.
+        approve_delay (float): Seconds the simulated admin takes to add an affiliate link.
+        command_latency (float): Seconds each WebDriver command takes.
+        poll_interval (float): Chat polling interval. Defaults to Config.POLL_INTERVAL_SECONDS.
+        ingestion_mode (str): 'observer' or 'poll'. Defaults to Config.MESSAGE_INGESTION_MODE.
+        production_limits (bool): Keep the configured API quotas and send pacing instead of
+            lifting them, to measure the pipeline as deployed rather than its capacity.
+        timeout (float): Seconds to wait for the pipeline to finish after the replay starts.
+
+    Returns:
+        dict: Throughput, stage latencies in ms, DB statements per message and counters.
+    """
+    labels = {message.text: message.need for message in transcript if message.need is not None}
+    groups = list(dict.fromkeys(message.group for message in transcript))
+    limits = {} if production_limits else {"GROQ_REQUESTS_PER_MINUTE": 0, "PERPLEXITY_REQUESTS_PER_MINUTE": 0}
+
+    async with StubGroqServer(classify=lambda text: labels.get(text, is_need(text)), **(groq_profile or {})) as groq, \
+            StubPerplexityServer(**(perplexity_profile or {})) as perplexity:
+        with tempfile.TemporaryDirectory() as tmp, configured(
+                GROQ_API_KEY=Config.GROQ_API_KEY or "replay-key", GROQ_BASE_URL=groq.base_url,
+                PERPLEXITY_BASE_URL=perplexity.base_url, DELIVERY_NOTIFY_PORT=free_udp_port(),
+                SHARDING_ENABLED=False, MESSAGE_INGESTION_MODE=ingestion_mode or Config.MESSAGE_INGESTION_MODE,
+                **limits):
+            db_path = os.path.join(tmp, "replay.db")
+            await initialize_db(db_path)
+            driver = ReplayDriver(transcript, speed=speed, command_latency=command_latency)
+            bot = WhatsAppBot(groups, driver=driver)
+            bot.database_client.db_path = db_path
+            bot.chat_switch_settle = 0
+            if poll_interval is not None:
+                bot.poll_interval = poll_interval
+            if not production_limits:
+                bot.outbound.interval = bot.outbound.min_interval = 0
+                bot.outbound.max_per_minute = 0
+
+            # Transcript messages by the ID the bot gives them; repeats collapse into one
+            messages = {}
+            for message in transcript:
+                contact = bot.extract_contact_details_from_metadata(message.metadata)
+                timestamp = bot.extract_timestamp_from_metadata(message.metadata)
+                message_id = bot.generate_unique_message_id(contact, timestamp, message.text, message.group)
+                messages.setdefault(message_id, message)
+
+            statements = StatementCounter()
+            statements.attach(bot.database_client)
+            classified_at, responded_at, approved_at = {}, {}, {}
+            needs = set()
+
+            classify = bot.classify_incoming_message
+            async def timed_classify(contact, message_text, unique_number, group_name=None):
+                result = await classify(contact, message_text, unique_number, group_name)
+                classified_at[unique_number] = time.time()
+                if result:
+                    needs.add(unique_number)
+                return result
+            bot.classify_incoming_message = timed_classify
+
+            respond = bot.perplexity_client.get_response_async
+            async def timed_respond(query, contact, unique_number, group_name=None):
+                try:
+                    return await respond(query, contact, unique_number, group_name)
+                finally:
+                    responded_at[unique_number] = time.time()
+            bot.perplexity_client.get_response_async = timed_respond
+
+            async with DatabaseClient(db_path) as admin:
+                run_task = asyncio.create_task(bot.run())
+                approver = asyncio.create_task(approve_responses(admin, approved_at, approve_delay))
+                try:
+                    completed = await wait_for_completion(bot, driver, admin, run_task, len(messages), timeout)
+                    finished_wall = time.time()
+                finally:
+                    approver.cancel()
+                    run_task.cancel()
+                    await asyncio.gather(approver, run_task, return_exceptions=True)
+
+                async with admin.connection() as db:
+                    cursor = await db.execute("SELECT message_id, unique_number FROM processed_messages;")
+                    numbers = dict(await cursor.fetchall())
+                    cursor = await db.execute("SELECT unique_number, created_at FROM work_items;")
+                    queued_at = dict(await cursor.fetchall())
+                    cursor = await db.execute("SELECT COUNT(*) FROM final_response_table;")
+                    responses = (await cursor.fetchone())[0]
+
+    delivered_at = {}
+    for _, text, sent_at in driver.sent:
+        for unique_number in AFFILIATE_LINK_PATTERN.findall(text):
+            delivered_at.setdefault(int(unique_number), sent_at)
+
+    # Stage timings per transcript message, matched to the bot's records by message ID
+    stages = {"ingest": [], "classify": [], "respond": [], "deliver": [], "end_to_end": []}
+    for message_id, message in messages.items():
+        unique_number = numbers.get(message_id)
+        visible = driver.visible_at.get((message.group, message.metadata, message.text))
+        if unique_number is None or visible is None:
+            continue
+        queued = queued_at.get(unique_number)
+        classified = classified_at.get(unique_number)
+        responded = responded_at.get(unique_number)
+        if queued is not None:
+            stages["ingest"].append(queued - visible)
+            if classified is not None:
+                stages["classify"].append(classified - queued)
+        if classified is not None and responded is not None:
+            stages["respond"].append(responded - classified)
+            stages["end_to_end"].append(responded - visible)
+        if unique_number in approved_at and unique_number in delivered_at:
+            stages["deliver"].append(delivered_at[unique_number] - approved_at[unique_number])
+
+    elapsed = finished_wall - driver.started_wall if driver.started_wall else 0.0
+    replay_span = max((message.at for message in transcript), default=0.0)
+    return {
+        "completed": completed,
+        "messages": len(messages),
+        "processed": len(numbers),
+        "needs_labelled": sum(1 for message in messages.values() if message.need),
+        "needs_detected": len(needs),
+        "responses": responses,
+        "delivered": len(delivered_at),
+        "elapsed_seconds": round(elapsed, 3),
+        "replay_seconds": round(replay_span / speed if speed else 0.0, 3),
+        "messages_per_sec": round(len(numbers) / elapsed, 2) if elapsed else 0.0,
+        "stages_ms": {name: percentiles(values) for name, values in stages.items()},
+        "db_ops_per_message": round(statements.total / len(numbers), 2) if numbers else 0.0,
+        "db_ops": dict(statements.counts.most_common()),
+        "groq": groq.stats(),
+        "perplexity": perplexity.stats(),
+        "driver_commands": dict(driver.commands),
+        "outbound": bot.outbound.stats(),
+    }
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        return subprocess.run(["git", *args], capture_output=True, text=True, timeout=30).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None,
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+def save_result(path: str, scenario: dict, result: dict) -> dict:
+    """
+    Appends a run to the JSON lines results file and returns the previous
+    run of the same scenario, if any.
+    """
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for entry in map(json.loads, filter(str.strip, f)):
+                if entry["scenario"] == scenario:
+                    previous = entry
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    entry = {"recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), **git_revision(),
+             "scenario": scenario, "result": result}
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return previous
+
+def report(result: dict, previous: dict = None):
+    print(f"{result['processed']} of {result['messages']} messages processed in {result['elapsed_seconds']:.2f}s "
+          f"({result['messages_per_sec']:.2f} msg/s, replay span {result['replay_seconds']:.2f}s)"
+          + ("" if result["completed"] else " -- TIMED OUT"))
+    print(f"needs: {result['needs_detected']} detected ({result['needs_labelled']} labelled), "
+          f"{result['responses']} responses, {result['delivered']} delivered")
+    for name, stage in result["stages_ms"].items():
+        print(f"{name:>12}: p50 {stage['p50']:9.1f} ms  p95 {stage['p95']:9.1f} ms  p99 {stage['p99']:9.1f} ms  "
+              f"(n={stage['count']})")
+    print(f"DB statements per message: {result['db_ops_per_message']:.2f} {result['db_ops']}")
+    print(f"Groq stub: {result['groq']}, Perplexity stub: {result['perplexity']}")
+    if previous is not None:
+        before = previous["result"]
+        print(f"vs {previous.get('commit')} ({previous['recorded_at']}): "
+              f"msg/s {before['messages_per_sec']:.2f} -> {result['messages_per_sec']:.2f}, "
+              f"end-to-end p95 {before['stages_ms']['end_to_end']['p95']:.1f} -> "
+              f"{result['stages_ms']['end_to_end']['p95']:.1f} ms, "
+              f"DB statements/msg {before['db_ops_per_message']:.2f} -> {result['db_ops_per_message']:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay a group transcript through the whole bot against a fake browser and stub APIs.")
+    parser.add_argument("--transcript", help="Recorded transcript (JSON lines); synthetic traffic if omitted")
+    parser.add_argument("--messages", type=int, default=200, help="Synthetic messages")
+    parser.add_argument("--groups", type=int, default=2, help="Synthetic groups")
+    parser.add_argument("--rate", type=float, default=5.0, help="Synthetic messages per second")
+    parser.add_argument("--need-ratio", type=float, default=0.2, help="Share of synthetic messages that are needs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up, 0 to release everything at once")
+    parser.add_argument("--groq-latency", type=float, default=0.3)
+    parser.add_argument("--groq-jitter", type=float, default=0.1)
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--perplexity-latency", type=float, default=2.0)
+    parser.add_argument("--perplexity-jitter", type=float, default=0.5)
+    parser.add_argument("--perplexity-error-rate", type=float, default=0.0)
+    parser.add_argument("--perplexity-chunk-delay", type=float, default=0.0,
+                        help="Seconds between streamed Perplexity chunks")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected stub errors")
+    parser.add_argument("--approve-delay", type=float, default=0.5, help="Seconds the admin takes per link")
+    parser.add_argument("--command-latency", type=float, default=0.005, help="Seconds per WebDriver command")
+    parser.add_argument("--poll-interval", type=float, default=Config.POLL_INTERVAL_SECONDS)
+    parser.add_argument("--ingestion", choices=["observer", "poll"], default=Config.MESSAGE_INGESTION_MODE)
+    parser.add_argument("--production-limits", action="store_true",
+                        help="Keep the configured API quotas and send pacing")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", default=RESULTS_PATH, help="Results file to append to")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.transcript:
+        transcript = load_transcript(args.transcript)
+    else:
+        transcript = synthetic_transcript(args.messages, [f"group{i + 1}" for i in range(args.groups)], args.rate,
+                                          args.need_ratio, args.seed)
+    scenario = {name: value for name, value in vars(args).items() if name not in ("output", "no_save", "timeout")}
+    result = asyncio.run(run_replay(
+        transcript,
+        speed=args.speed,
+        groq_profile=dict(latency=args.groq_latency, jitter=args.groq_jitter, error_rate=args.groq_error_rate,
+                          error_status=args.error_status, seed=args.seed),
+        perplexity_profile=dict(latency=args.perplexity_latency, jitter=args.perplexity_jitter,
+                                error_rate=args.perplexity_error_rate, error_status=args.error_status,
+                                chunk_delay=args.perplexity_chunk_delay, seed=args.seed),
+        approve_delay=args.approve_delay,
+        command_latency=args.command_latency,
+        poll_interval=args.poll_interval,
+        ingestion_mode=args.ingestion,
+        production_limits=args.production_limits,
+        timeout=args.timeout,
+    ))
+    previous = None if args.no_save else save_result(args.output, scenario, result)
+    report(result, previous)
@@ -0,0 +1,117 @@
+# benchmark_work_queue.py
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from work_queue import DurableWorkQueue, QUEUED, CLASSIFYING, AWAITING_RESPONSE, RESPONDING, DONE
+
+async def run_in_memory(count: int, poll_size: int, batch_size: int, classifiers: int, responders: int,
+    classify_latency: float, respond_latency: float) -> float:
+    """
+    Pushes `count` messages, arriving `poll_size` at a time, through the
+    classifier and responder stages over two in-memory queues and returns
+    messages per second.
+    """
+    incoming, responses = asyncio.Queue(), asyncio.Queue()
+
+    async def classifier():
+        while True:
+            batch = [await incoming.get()]
+            while len(batch) < batch_size and not incoming.empty():
+                batch.append(incoming.get_nowait())
+            await asyncio.sleep(classify_latency)
+            for item in batch:
+                responses.put_nowait(item)
+                incoming.task_done()
+
+    async def responder():
+        while True:
+            await responses.get()
+            await asyncio.sleep(respond_latency)
+            responses.task_done()
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(classifier()) for _ in range(classifiers)]
+    tasks += [asyncio.create_task(responder()) for _ in range(responders)]
+    for i in range(count):
+        await incoming.put((i, f"member{i}", f"need a gift idea number {i}"))
+        if i % poll_size == poll_size - 1:
+            await asyncio.sleep(0)
+    await incoming.join()
+    await responses.join()
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return count / elapsed
+
+async def run_durable(db_path: str, count: int, poll_size: int, batch_size: int, classifiers: int, responders: int,
+    classify_latency: float, respond_latency: float) -> float:
+    """
+    Same pipeline over the 'work_items' table, with batched claims for the
+    classifier stage.
+    """
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, poll_interval=0.05)
+
+        async def classifier():
+            while True:
+                batch = await queue.get(QUEUED, CLASSIFYING, batch_size)
+                await asyncio.sleep(classify_latency)
+                await queue.advance(CLASSIFYING, {AWAITING_RESPONSE: [item[0] for item in batch]})
+
+        async def responder():
+            while True:
+                [(unique_number, _, _, _)] = await queue.get(AWAITING_RESPONSE, RESPONDING, 1)
+                await asyncio.sleep(respond_latency)
+                await queue.advance(RESPONDING, {DONE: [unique_number]})
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(classifier()) for _ in range(classifiers)]
+        tasks += [asyncio.create_task(responder()) for _ in range(responders)]
+        for first in range(0, count, poll_size):
+            await queue.enqueue([
+                (i, f"member{i}", f"need a gift idea number {i}", 0) for i in range(first, min(first + poll_size, count))
+            ])
+        await queue.wait_until_idle()
+        elapsed = time.perf_counter() - start
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return count / elapsed
+
+async def benchmark(count: int, poll_size: int, batch_size: int, classifiers: int, responders: int,
+    classify_latency: float, respond_latency: float):
+    print(f"{count} messages in polls of {poll_size}, {classifiers} classifiers (batch {batch_size}, {classify_latency * 1000:.0f} ms), "
+          f"{responders} responders ({respond_latency * 1000:.0f} ms)")
+    results = {}
+    results["in-memory"] = await run_in_memory(count, poll_size, batch_size, classifiers, responders,
+                                               classify_latency, respond_latency)
+    for name, size in (("sqlite, batched claims", batch_size), ("sqlite, single claims", 1)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "benchmark.db")
+            await initialize_db(db_path)
+            results[name] = await run_durable(db_path, count, poll_size, size, classifiers, responders,
+                                              classify_latency, respond_latency)
+    baseline = results["in-memory"]
+    for name, rate in results.items():
+        print(f"{name:>24}: {rate:9.1f} messages/sec ({rate / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the durable work queue with the in-memory queues.")
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--poll-size", type=int, default=10, help="Messages scraped per poll")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--classifiers", type=int, default=2)
+    parser.add_argument("--responders", type=int, default=4)
+    parser.add_argument("--classify-latency", type=float, default=0.05, help="Seconds per classified batch")
+    parser.add_argument("--respond-latency", type=float, default=0.25, help="Seconds per response")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(benchmark(args.count, args.poll_size, args.batch_size, args.classifiers, args.responders,
+                          args.classify_latency, args.respond_latency))
@@ -0,0 +1,71 @@
+# chat_scheduler.py
+
+import logging
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+class ChatVisitScheduler:
+    def __init__(self, groups, max_staleness: float = 60.0):
+        """
+        Decides which monitored chat the single browser should have open,
+        driven by the unread badges in the WhatsApp Web sidebar rather than
+        plain round-robin.
+
+        Args:
+            groups: Names of the monitored groups.
+            max_staleness (float): Seconds after which a group without an unread
+                badge is visited anyway, in case a badge was missed.
+        """
+        self.groups = list(groups)
+        self.max_staleness = max_staleness
+        self.last_visit = {group: None for group in self.groups}
+        self.visits = Counter()
+        self.switches = 0
+
+    def set_groups(self, groups):
+        """
+        Replaces the groups to choose from, keeping the visit history.
+        """
+        self.groups = list(groups)
+        for group in self.groups:
+            self.last_visit.setdefault(group, None)
+
+    def record_visit(self, group: str, now: float = None):
+        self.last_visit[group] = time.monotonic() if now is None else now
+        self.visits[group] += 1
+
+    def staleness(self, group: str, now: float) -> float:
+        last_visit = self.last_visit.get(group)
+        return float("inf") if last_visit is None else now - last_visit
+
+    def choose(self, current: str, unread: dict, now: float = None) -> str:
+        """
+        Picks the chat to visit next.
+
+        Args:
+            current (str): The chat that is open now. WhatsApp shows no badge for it.
+            unread (dict): Chat title -> unread count for the chats rendered in the sidebar.
+
+        Returns:
+            str: The group with the most unread messages (the longest unvisited
+            one on ties); failing that, the stalest group if it has gone
+            max_staleness seconds without a visit; otherwise `current`.
+        """
+        now = time.monotonic() if now is None else now
+        others = [group for group in self.groups if group != current]
+        waiting = [group for group in others if unread.get(group, 0) > 0]
+        if waiting:
+            choice = max(waiting, key=lambda group: (unread[group], self.staleness(group, now)))
+        else:
+            choice = max(others, key=lambda group: self.staleness(group, now), default=current)
+            if self.staleness(choice, now) < self.max_staleness:
+                choice = current
+        if choice != current:
+            self.switches += 1
+            logger.debug(f"Switching from '{current}' to '{choice}' ({unread.get(choice, 0)} unread)")
+        return choice
+
+    def stats(self) -> dict:
+        return {"visits": dict(self.visits), "switches": self.switches}
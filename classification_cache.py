@@ -0,0 +1,143 @@
+# classification_cache.py
+
+import logging
+import time
+from collections import OrderedDict
+from text_normalization import normalize_message_text
+
+logger = logging.getLogger(__name__)
+
+class ClassificationCache:
+    def __init__(self, db_client, capacity: int = 10000, ttl: float = 7 * 24 * 3600):
+        """
+        Two-tier cache of Groq classifications keyed on normalized message
+        text: an in-process LRU in front of the 'classification_cache' table.
+
+        Args:
+            db_client (DatabaseClient): Database holding the persistent tier.
+            capacity (int): Maximum entries kept in memory; least recently used entries are evicted.
+            ttl (float): Seconds a classification stays valid in either tier.
+        """
+        self.db_client = db_client
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": self.hit_rate,
+        }
+
+    def _remember(self, key: str, result: bool, expires_at: float):
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, message_text: str):
+        """
+        Looks up a cached classification.
+
+        Returns:
+            bool or None: The cached result, or None on a miss.
+        """
+        key = normalize_message_text(message_text)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            del self._entries[key]
+
+        async with self.db_client.connection() as db:
+            cursor = await db.execute("""
+                SELECT classification, expires_at FROM classification_cache
+                WHERE normalized_text = ? AND expires_at > ?;
+            """, (key, now))
+            row = await cursor.fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        result = row[0] == 'Yes'
+        self._remember(key, result, row[1])
+        return result
+
+    async def put(self, message_text: str, result: bool):
+        """
+        Stores a classification in both tiers.
+        """
+        key = normalize_message_text(message_text)
+        expires_at = time.time() + self.ttl
+        self._remember(key, result, expires_at)
+        async with self.db_client.transaction() as db:
+            await db.execute("""
+                INSERT INTO classification_cache (normalized_text, classification, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (normalized_text) DO UPDATE
+                SET classification = excluded.classification, expires_at = excluded.expires_at;
+            """, (key, 'Yes' if result else 'No', expires_at))
+
+    async def purge_expired(self) -> int:
+        """
+        Deletes expired rows from the persistent tier.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        async with self.db_client.transaction() as db:
+            cursor = await db.execute("""
+                DELETE FROM classification_cache WHERE expires_at <= ?;
+            """, (time.time(),))
+            removed = cursor.rowcount
+        logger.info(f"Purged {removed} expired classification cache entries")
+        return removed
+
+    async def warm_from_logs(self, limit: int = 50000):
+        """
+        Pre-populates both tiers from the most recent groq_logs entries that
+        are still within the TTL; the latest classification of a text wins.
+        """
+        async with self.db_client.connection() as db:
+            cursor = await db.execute("""
+                SELECT message_text, classification, CAST(strftime('%s', timestamp) AS REAL)
+                FROM groq_logs ORDER BY id DESC LIMIT ?;
+            """, (limit,))
+            rows = await cursor.fetchall()
+
+        now = time.time()
+        latest = {}
+        for message_text, classification, logged_at in reversed(rows):
+            expires_at = (logged_at or now) + self.ttl
+            if expires_at > now:
+                latest[normalize_message_text(message_text)] = (classification, expires_at)
+
+        async with self.db_client.transaction() as db:
+            await db.executemany("""
+                INSERT INTO classification_cache (normalized_text, classification, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (normalized_text) DO UPDATE
+                SET classification = excluded.classification, expires_at = excluded.expires_at
+                WHERE excluded.expires_at > classification_cache.expires_at;
+            """, [(key, classification, expires_at) for key, (classification, expires_at) in latest.items()])
+        for key, (classification, expires_at) in list(latest.items())[-self.capacity:]:
+            self._remember(key, classification == 'Yes', expires_at)
+        logger.info(f"Warmed classification cache with {len(latest)} entries from groq_logs")
@@ -11,3 +11,146 @@ class Config:
     CHROME_PROFILE_PATH = os.getenv('CHROME_PROFILE_PATH')
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
     PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
+    # API endpoints, overridable to point the bot at local stand-ins (see stub_servers.py)
+    GROQ_BASE_URL = os.getenv('GROQ_BASE_URL')
+    PERPLEXITY_BASE_URL = os.getenv('PERPLEXITY_BASE_URL')
+
+    # 'script' pulls all new messages in one execute_script round trip;
+    # 'elements' uses the per-message find_element calls
+    MESSAGE_EXTRACTION_MODE = os.getenv('MESSAGE_EXTRACTION_MODE', 'script')
+    POLL_INTERVAL_SECONDS = float(os.getenv('POLL_INTERVAL_SECONDS', '5'))
+
+    # 'observer' buffers new messages in the page with a MutationObserver and
+    # long-polls for them, falling back to 'poll' if it cannot be installed
+    MESSAGE_INGESTION_MODE = os.getenv('MESSAGE_INGESTION_MODE', 'observer')
+    OBSERVER_LONG_POLL_SECONDS = float(os.getenv('OBSERVER_LONG_POLL_SECONDS', '1'))
+
+    # Number of processed message IDs remembered in memory for deduplication
+    SEEN_MESSAGE_CACHE_SIZE = int(os.getenv('SEEN_MESSAGE_CACHE_SIZE', '50000'))
+
+    # Unique numbers reserved from message_unique_number_seq per database round trip
+    UNIQUE_NUMBER_BLOCK_SIZE = int(os.getenv('UNIQUE_NUMBER_BLOCK_SIZE', '1000'))
+
+    # Micro-batching for Groq classification: up to GROQ_BATCH_SIZE messages
+    # arriving within GROQ_BATCH_WINDOW_SECONDS are classified in one request
+    GROQ_BATCHING = os.getenv('GROQ_BATCHING', 'true').lower() == 'true'
+    GROQ_BATCH_SIZE = int(os.getenv('GROQ_BATCH_SIZE', '16'))
+    GROQ_BATCH_WINDOW_SECONDS = float(os.getenv('GROQ_BATCH_WINDOW_SECONDS', '0.5'))
+
+    # Local prefilter ahead of Groq: settles obvious negatives (and, if
+    # allowed, obvious positives) without an API call
+    PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'true').lower() == 'true'
+    PREFILTER_ALLOW_POSITIVE = os.getenv('PREFILTER_ALLOW_POSITIVE', 'false').lower() == 'true'
+    PREFILTER_TRAIN_FROM_LOGS = os.getenv('PREFILTER_TRAIN_FROM_LOGS', 'true').lower() == 'true'
+
+    # Cache of Groq classifications keyed on normalized message text
+    CLASSIFICATION_CACHE_ENABLED = os.getenv('CLASSIFICATION_CACHE_ENABLED', 'true').lower() == 'true'
+    CLASSIFICATION_CACHE_SIZE = int(os.getenv('CLASSIFICATION_CACHE_SIZE', '10000'))
+    CLASSIFICATION_CACHE_TTL_SECONDS = float(os.getenv('CLASSIFICATION_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+    # Near-duplicate Perplexity queries (SimHash distance within the limit)
+    # share one in-flight or recent recommendation
+    COALESCE_RECOMMENDATIONS = os.getenv('COALESCE_RECOMMENDATIONS', 'true').lower() == 'true'
+    COALESCE_MAX_DISTANCE = int(os.getenv('COALESCE_MAX_DISTANCE', '3'))
+    COALESCE_REUSE_WINDOW_SECONDS = float(os.getenv('COALESCE_REUSE_WINDOW_SECONDS', '300'))
+
+    # Connector tuning for the shared Perplexity HTTP session
+    PERPLEXITY_CONNECTION_LIMIT = int(os.getenv('PERPLEXITY_CONNECTION_LIMIT', '10'))
+    PERPLEXITY_KEEPALIVE_SECONDS = float(os.getenv('PERPLEXITY_KEEPALIVE_SECONDS', '60'))
+    PERPLEXITY_DNS_CACHE_TTL_SECONDS = int(os.getenv('PERPLEXITY_DNS_CACHE_TTL_SECONDS', '300'))
+
+    # Stream Perplexity recommendations: drafts are saved for the admin page
+    # every PERPLEXITY_DRAFT_INTERVAL_SECONDS, and with PERPLEXITY_EARLY_STOP
+    # generation stops once the link and reviews are in
+    PERPLEXITY_STREAMING = os.getenv('PERPLEXITY_STREAMING', 'true').lower() == 'true'
+    PERPLEXITY_DRAFT_INTERVAL_SECONDS = float(os.getenv('PERPLEXITY_DRAFT_INTERVAL_SECONDS', '1'))
+    PERPLEXITY_EARLY_STOP = os.getenv('PERPLEXITY_EARLY_STOP', 'true').lower() == 'true'
+
+    # Native async Groq calls: concurrent requests and per-call timeout
+    GROQ_MAX_CONCURRENCY = int(os.getenv('GROQ_MAX_CONCURRENCY', '4'))
+    GROQ_TIMEOUT_SECONDS = float(os.getenv('GROQ_TIMEOUT_SECONDS', '10'))
+
+    # Resilience for Groq and Perplexity calls: each call gets a deadline
+    # covering its retries; 429/5xx responses and dropped connections are
+    # retried with jittered exponential backoff, or after Retry-After. A
+    # second request is sent if the first has not answered within the hedge
+    # delay (0 disables; Perplexity hedging only applies without streaming).
+    # After BREAKER_FAILURE_THRESHOLD consecutive failures calls fail fast for
+    # BREAKER_RESET_SECONDS and the work waits in the queue
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_BACKOFF_BASE_SECONDS', '0.5'))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '10'))
+    GROQ_DEADLINE_SECONDS = float(os.getenv('GROQ_DEADLINE_SECONDS', '30'))
+    GROQ_HEDGE_AFTER_SECONDS = float(os.getenv('GROQ_HEDGE_AFTER_SECONDS', '0'))
+    PERPLEXITY_TIMEOUT_SECONDS = float(os.getenv('PERPLEXITY_TIMEOUT_SECONDS', '60'))
+    PERPLEXITY_DEADLINE_SECONDS = float(os.getenv('PERPLEXITY_DEADLINE_SECONDS', '120'))
+    PERPLEXITY_HEDGE_AFTER_SECONDS = float(os.getenv('PERPLEXITY_HEDGE_AFTER_SECONDS', '0'))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+    BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+
+    # Concurrent workers per pipeline stage and the API quotas they share
+    CLASSIFIER_WORKERS = int(os.getenv('CLASSIFIER_WORKERS', '2'))
+    RESPONDER_WORKERS = int(os.getenv('RESPONDER_WORKERS', '4'))
+    GROQ_REQUESTS_PER_MINUTE = float(os.getenv('GROQ_REQUESTS_PER_MINUTE', '30'))
+    PERPLEXITY_REQUESTS_PER_MINUTE = float(os.getenv('PERPLEXITY_REQUESTS_PER_MINUTE', '50'))
+    SEND_DELAY_SECONDS = float(os.getenv('SEND_DELAY_SECONDS', '2'))
+
+    # Outbound scheduler: the gap between sends starts at SEND_DELAY_SECONDS and
+    # adapts within [SEND_MIN_INTERVAL_SECONDS, SEND_MAX_INTERVAL_SECONDS];
+    # queued replies to the same group can be merged into one message
+    SEND_MIN_INTERVAL_SECONDS = float(os.getenv('SEND_MIN_INTERVAL_SECONDS', '1'))
+    SEND_MAX_INTERVAL_SECONDS = float(os.getenv('SEND_MAX_INTERVAL_SECONDS', '30'))
+    SEND_MAX_PER_MINUTE = int(os.getenv('SEND_MAX_PER_MINUTE', '20'))
+    COALESCE_OUTBOUND = os.getenv('COALESCE_OUTBOUND', 'true').lower() == 'true'
+    OUTBOUND_MAX_MESSAGE_CHARS = int(os.getenv('OUTBOUND_MAX_MESSAGE_CHARS', '3000'))
+
+    # Bounds for the pipeline queue stages. QUEUE_FULL_POLICY is 'block',
+    # 'drop_oldest' or 'drop_expired', which sheds items older than
+    # QUEUE_MAX_AGE_SECONDS before the oldest. Items older than that are
+    # dropped whatever the policy (0 keeps them forever)
+    INCOMING_QUEUE_SIZE = int(os.getenv('INCOMING_QUEUE_SIZE', '500'))
+    RESPONSE_QUEUE_SIZE = int(os.getenv('RESPONSE_QUEUE_SIZE', '100'))
+    QUEUE_FULL_POLICY = os.getenv('QUEUE_FULL_POLICY', 'block')
+    QUEUE_MAX_AGE_SECONDS = float(os.getenv('QUEUE_MAX_AGE_SECONDS', '900'))
+    PRIORITIZE_QUESTIONS = os.getenv('PRIORITIZE_QUESTIONS', 'true').lower() == 'true'
+    QUEUE_STATS_INTERVAL_SECONDS = float(os.getenv('QUEUE_STATS_INTERVAL_SECONDS', '60'))
+
+    # Durable work queue: claimed items return to the queue if their lease
+    # expires; finished items are kept for WORK_QUEUE_RETENTION_SECONDS
+    WORK_LEASE_SECONDS = float(os.getenv('WORK_LEASE_SECONDS', '300'))
+    WORK_QUEUE_POLL_SECONDS = float(os.getenv('WORK_QUEUE_POLL_SECONDS', '1'))
+    WORK_QUEUE_RETENTION_SECONDS = float(os.getenv('WORK_QUEUE_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+    # Delivery of approved affiliate responses: the admin app notifies the bot
+    # over local UDP (0 disables), with a PRAGMA data_version check as fallback
+    DELIVERY_NOTIFY_PORT = int(os.getenv('DELIVERY_NOTIFY_PORT', '8765'))
+    DELIVERY_CHECK_SECONDS = float(os.getenv('DELIVERY_CHECK_SECONDS', '1'))
+    DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', '20'))
+
+    # WebDriver commands slower than this are logged by the driver thread
+    DRIVER_SLOW_COMMAND_SECONDS = float(os.getenv('DRIVER_SLOW_COMMAND_SECONDS', '2'))
+
+    # Comma-separated groups monitored from one browser. The first is opened at
+    # startup; the others are visited by sidebar unread activity, and any group
+    # is revisited after GROUP_MAX_STALENESS_SECONDS without a visit
+    MONITORED_GROUPS = [group.strip() for group in os.getenv('MONITORED_GROUPS', 'affbot').split(',') if group.strip()]
+    GROUP_MAX_STALENESS_SECONDS = float(os.getenv('GROUP_MAX_STALENESS_SECONDS', '60'))
+    CHAT_SWITCH_SETTLE_SECONDS = float(os.getenv('CHAT_SWITCH_SETTLE_SECONDS', '1'))
+
+    # Sharded mode: several instances, each with its own browser profile and
+    # MONITORED_GROUPS, share one database. Each group is owned by one live
+    # instance at a time; an instance that misses heartbeats for
+    # GROUP_LEASE_SECONDS loses its groups to the other instances configured
+    # for them. INSTANCE_ID defaults to host, pid and a random suffix
+    SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', 'false').lower() == 'true'
+    INSTANCE_ID = os.getenv('INSTANCE_ID')
+    INSTANCE_HEARTBEAT_SECONDS = float(os.getenv('INSTANCE_HEARTBEAT_SECONDS', '5'))
+    GROUP_LEASE_SECONDS = float(os.getenv('GROUP_LEASE_SECONDS', '30'))
+
+    # Metrics: each instance writes its counters and latency histograms to the
+    # 'metrics' table every METRICS_FLUSH_SECONDS, and the admin app serves
+    # them at /metrics, leaving out instances silent for METRICS_STALE_SECONDS
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '15'))
+    METRICS_STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', '300'))
+
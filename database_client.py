@@ -3,78 +3,313 @@
 import logging
 import aiosqlite
 import asyncio
+import time
+import functools
+from contextlib import asynccontextmanager
+from metrics import registry
+from audit_log_writer import AuditLogWriter, GROQ_LOG_INSERT, PERPLEXITY_LOG_INSERT
+from work_queue import WORK_ITEM_INSERT, QUEUED, GROUP_FILTER, groups_param
 
 logger = logging.getLogger(__name__)
 
 DATABASE = 'bot_database.db'
 
+# Size of sqlite3's per-connection prepared statement cache. Statements are
+# reused as long as the SQL text is identical, so every query below is kept
+# as a fixed string with '?' placeholders.
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+# Number of '?' placeholders bound per IN (...) query, well under SQLite's limit
+MAX_IN_CLAUSE_PARAMS = 500
+
+def instrumented(method):
+    """
+    Records the latency of a DatabaseClient operation in
+    db_operation_seconds, and counts it in db_errors_total if it raises.
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        with registry.timer("db_operation_seconds", errors="db_errors_total", operation=operation):
+            return await method(*args, **kwargs)
+    return wrapper
+
 class DatabaseClient:
-    def __init__(self):
-        self.db_path = DATABASE
+    def __init__(self, db_path: str = DATABASE, pool_size: int = 4, group_commit: bool = False,
+        group_commit_window: float = 0.0, group_commit_max_batch: int = 500, buffered_logs: bool = False):
+        """
+        Initializes the DatabaseClient.
+
+        Until open() is called (or the client is used as an async context
+        manager) every method falls back to opening a short-lived connection
+        per call, so existing callers keep working unchanged.
 
-    async def insert_user_need(self, message_text: str, contact: str, unique_number: int):
+        Args:
+            db_path (str): Path to the SQLite database file.
+            pool_size (int): Number of long-lived read connections kept open.
+            group_commit (bool): Batch writes from concurrent coroutines into one transaction.
+            group_commit_window (float): Extra seconds to wait for more writes before committing a batch;
+                writes queued while the previous batch was committing are always picked up.
+            group_commit_max_batch (int): Maximum number of writes committed in one transaction.
+            buffered_logs (bool): Write groq_logs and perplexity_logs rows from a background
+                AuditLogWriter while the client is open.
         """
-        Inserts a user need into the 'user_needs' table.
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.group_commit = group_commit
+        self.group_commit_window = group_commit_window
+        self.group_commit_max_batch = group_commit_max_batch
+
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = None
+        self._reader_connections = []
+        self._pending_writes = None
+        self._group_commit_task = None
+        self.log_writer = AuditLogWriter(self) if buffered_logs else None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        """
+        Opens the long-lived writer connection and the reader pool, and starts
+        the group commit task if enabled.
+        """
+        if self.is_open:
+            return
+        self._writer = await self._connect()
+        self._readers = asyncio.Queue()
+        for _ in range(self.pool_size):
+            db = await self._connect()
+            self._reader_connections.append(db)
+            self._readers.put_nowait(db)
+        if self.group_commit:
+            self._pending_writes = asyncio.Queue()
+            self._group_commit_task = asyncio.create_task(self._group_commit_loop())
+        if self.log_writer is not None:
+            self.log_writer.start()
+        logger.info(f"Opened database pool for '{self.db_path}' with {self.pool_size} readers "
+                    f"(group commit: {self.group_commit})")
+
+    async def close(self):
+        """
+        Flushes any pending group commit writes and closes all pooled connections.
+        """
+        if not self.is_open:
+            return
+        if self.log_writer is not None:
+            await self.log_writer.stop()
+        if self._group_commit_task is not None:
+            await self._pending_writes.put(None)
+            await self._group_commit_task
+            self._group_commit_task = None
+            self._pending_writes = None
+        for db in self._reader_connections:
+            await db.close()
+        self._reader_connections = []
+        self._readers = None
+        await self._writer.close()
+        self._writer = None
+        logger.info(f"Closed database pool for '{self.db_path}'")
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _connect(self):
+        db = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        await db.execute("PRAGMA journal_mode = WAL;")
+        await db.execute("PRAGMA synchronous = NORMAL;")
+        await db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        return db
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Yields a read connection from the pool, or a short-lived connection if
+        the pool is not open.
         """
+        if self._readers is None:
+            async with aiosqlite.connect(self.db_path) as db:
+                yield db
+            return
+        db = await self._readers.get()
         try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Yields the writer connection and commits on exit, rolling back if the
+        block raises. Writers are serialized so only one transaction is open
+        on the shared connection at a time.
+        """
+        if self._writer is None:
             async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO user_needs (message_text, contact, unique_number)
-                    VALUES (?, ?, ?);
-                """, (message_text, contact, unique_number))
+                try:
+                    yield db
+                    await db.commit()
+                except BaseException:
+                    await db.rollback()
+                    raise
+            return
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    async def _execute_write(self, query: str, params: tuple = ()) -> int:
+        """
+        Runs a single write statement, either in its own transaction or, in
+        group commit mode, batched with writes from other coroutines.
+
+        Returns:
+            int: The number of rows affected.
+        """
+        if self._pending_writes is not None:
+            future = asyncio.get_running_loop().create_future()
+            await self._pending_writes.put((query, params, future))
+            return await future
+        async with self.transaction() as db:
+            cursor = await db.execute(query, params)
+            return cursor.rowcount
+
+    async def _group_commit_loop(self):
+        """
+        Collects queued writes and commits them together. A None entry flushes
+        what is queued and stops the loop.
+        """
+        stopping = False
+        while not stopping:
+            first = await self._pending_writes.get()
+            if first is None:
+                batch, stopping = [], True
+            else:
+                batch = [first]
+                if self.group_commit_window:
+                    await asyncio.sleep(self.group_commit_window)
+            while len(batch) < self.group_commit_max_batch and not self._pending_writes.empty():
+                item = self._pending_writes.get_nowait()
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+            if batch:
+                await self._flush_writes(batch)
+
+    async def _flush_writes(self, batch):
+        results = []
+        async with self._write_lock:
+            db = self._writer
+            for query, params, future in batch:
+                try:
+                    cursor = await db.execute(query, params)
+                    results.append((future, cursor.rowcount, None))
+                except Exception as e:
+                    # A failed statement is rolled back on its own; the rest of the batch still commits
+                    results.append((future, None, e))
+            try:
                 await db.commit()
-                logger.info(f"Inserted user need: '{message_text}', '{contact}', '{unique_number}'")
+            except Exception as e:
+                logger.error(f"Error committing write batch of {len(batch)}: {e}")
+                await db.rollback()
+                results = [(future, None, e) for future, _, _ in results]
+        for future, rowcount, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rowcount)
+        logger.debug(f"Group committed {len(batch)} writes")
+
+    @instrumented
+    async def insert_user_need(self, message_text: str, contact: str, unique_number: int, group_name: str = None):
+        """
+        Inserts a user need into the 'user_needs' table.
+        """
+        try:
+            await self._execute_write("""
+                INSERT INTO user_needs (message_text, contact, unique_number, group_name)
+                VALUES (?, ?, ?, ?);
+            """, (message_text, contact, unique_number, group_name))
+            logger.info(f"Inserted user need: '{message_text}', '{contact}', '{unique_number}'")
         except Exception as e:
+            registry.inc("db_errors_total", operation="insert_user_need")
             logger.error(f"Error inserting user need: {e}")
 
+    @instrumented
+    async def reserve_unique_numbers(self, count: int) -> int:
+        """
+        Atomically reserves `count` consecutive numbers from the sequence. The
+        single UPDATE ... RETURNING takes SQLite's write lock, so reservations
+        from different processes never overlap.
+
+        Returns:
+            int: The first reserved number.
+        """
+        async with self.transaction() as db:
+            cursor = await db.execute("""
+                UPDATE message_unique_number_seq SET next_unique_number = next_unique_number + ?
+                WHERE id = 1 RETURNING next_unique_number;
+            """, (count,))
+            row = await cursor.fetchone()
+            await cursor.close()
+        if not row:
+            raise Exception("Sequence not initialized.")
+        first = row[0] - count
+        logger.info(f"Reserved unique numbers {first}-{row[0] - 1}")
+        return first
+
     async def get_next_unique_number(self) -> int:
         """
         Retrieves and increments the next unique number from the sequence.
+        Timed as reserve_unique_numbers, so each allocation is counted once.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("BEGIN;")
-                cursor = await db.execute("""
-                    SELECT next_unique_number FROM message_unique_number_seq WHERE id = 1;
-                """)
-                row = await cursor.fetchone()
-                if row:
-                    unique_number = row[0]
-                    await db.execute("""
-                        UPDATE message_unique_number_seq SET next_unique_number = next_unique_number + 1 WHERE id = 1;
-                    """)
-                    await db.commit()
-                    logger.info(f"Retrieved next unique number: {unique_number}")
-                    return unique_number
-                else:
-                    raise Exception("Sequence not initialized.")
+            unique_number = await self.reserve_unique_numbers(1)
+            logger.info(f"Retrieved next unique number: {unique_number}")
+            return unique_number
         except Exception as e:
             logger.error(f"Error retrieving unique number: {e}")
             raise
 
-    async def insert_processed_message(self, message_id: str, unique_number: int):
+    @instrumented
+    async def insert_processed_message(self, message_id: bytes, unique_number: int):
         """
         Inserts a processed message into the 'processed_messages' table.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO processed_messages (message_id, unique_number)
-                    VALUES (?, ?);
-                """, (message_id, unique_number))
-                await db.commit()
-                logger.info(f"Marked message as processed: '{message_id}' with unique number: {unique_number}'")
+            await self._execute_write("""
+                INSERT INTO processed_messages (message_id, unique_number)
+                VALUES (?, ?);
+            """, (message_id, unique_number))
+            logger.info(f"Marked message as processed: '{message_id}' with unique number: {unique_number}'")
         except aiosqlite.IntegrityError:
             logger.warning(f"Message '{message_id}' is already processed.")
         except Exception as e:
+            registry.inc("db_errors_total", operation="insert_processed_message")
             logger.error(f"Error marking message as processed: {e}")
 
-    async def is_message_processed(self, message_id: str) -> bool:
+    @instrumented
+    async def is_message_processed(self, message_id: bytes) -> bool:
         """
         Checks if a message has already been processed.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.connection() as db:
                 cursor = await db.execute("""
                     SELECT message_id FROM processed_messages WHERE message_id = ?;
                 """, (message_id,))
@@ -83,101 +318,234 @@ class DatabaseClient:
                 logger.debug(f"Message '{message_id}' processed: {is_processed}")
                 return is_processed
         except Exception as e:
+            registry.inc("db_errors_total", operation="is_message_processed")
             logger.error(f"Error checking if message is processed: {e}")
             return False
 
+    @instrumented
+    async def filter_processed_messages(self, message_ids) -> set:
+        """
+        Returns the subset of the given message IDs that are already in
+        'processed_messages', using one IN (...) query per chunk of IDs.
+        """
+        message_ids = list(message_ids)
+        processed = set()
+        async with self.connection() as db:
+            for start in range(0, len(message_ids), MAX_IN_CLAUSE_PARAMS):
+                chunk = message_ids[start:start + MAX_IN_CLAUSE_PARAMS]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = await db.execute(
+                    f"SELECT message_id FROM processed_messages WHERE message_id IN ({placeholders});",
+                    chunk)
+                processed.update(row[0] for row in await cursor.fetchall())
+        logger.debug(f"{len(processed)} of {len(message_ids)} messages already processed")
+        return processed
+
+    @instrumented
+    async def insert_processed_messages(self, numbered_messages, work_items: dict = None) -> list:
+        """
+        Inserts a batch of (message_id, unique_number) pairs into
+        'processed_messages' in a single transaction. IDs that are already
+        present (for example inserted concurrently by another process) are
+        skipped.
+
+        Args:
+            numbered_messages: (message_id, unique_number) pairs.
+            work_items (dict): Optional message_id -> (contact, message_text, priority, group_name). Each
+                inserted message is queued in 'work_items' in the same transaction, so a
+                message is never marked processed without also being queued.
+
+        Returns:
+            list: The (message_id, unique_number) pairs that were inserted.
+        """
+        inserted = []
+        now = time.time()
+        async with self.transaction() as db:
+            for message_id, unique_number in numbered_messages:
+                cursor = await db.execute("""
+                    INSERT OR IGNORE INTO processed_messages (message_id, unique_number)
+                    VALUES (?, ?);
+                """, (message_id, unique_number))
+                if cursor.rowcount == 1:
+                    inserted.append((message_id, unique_number))
+                    if work_items is not None:
+                        contact, message_text, priority, group_name = work_items[message_id]
+                        await db.execute(WORK_ITEM_INSERT, (unique_number, contact, message_text, priority,
+                                                            group_name, QUEUED, now, now))
+        logger.info(f"Marked {len(inserted)} messages as processed")
+        return inserted
+
+    @instrumented
+    async def fetch_recent_processed_message_ids(self, limit: int) -> list:
+        """
+        Retrieves up to `limit` message IDs from 'processed_messages', most
+        recently numbered last.
+        """
+        async with self.connection() as db:
+            cursor = await db.execute("""
+                SELECT message_id FROM processed_messages
+                ORDER BY unique_number DESC LIMIT ?;
+            """, (limit,))
+            rows = await cursor.fetchall()
+        return [row[0] for row in reversed(rows)]
+
     # New logging methods for API clients
 
     async def log_groq_result(self, message_text: str, classification: str):
         """
         Logs the result of the Groq classification.
         """
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS groq_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        message_text TEXT NOT NULL,
-                        classification TEXT NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                await db.execute("""
-                    INSERT INTO groq_logs (message_text, classification)
-                    VALUES (?, ?);
-                """, (message_text, classification))
-                await db.commit()
-                logger.info(f"Logged Groq classification: '{classification}' for message: '{message_text}'")
-        except Exception as e:
-            logger.error(f"Error logging Groq result: {e}")
+        await self._log(GROQ_LOG_INSERT, (message_text, classification))
+        logger.info(f"Logged Groq classification: '{classification}' for message: '{message_text}'")
 
     async def log_perplexity_response(self, query: str, contact: str, response: str):
         """
         Logs the response from the Perplexity API.
         """
+        await self._log(PERPLEXITY_LOG_INSERT, (query, contact, response))
+        logger.info(f"Logged Perplexity response for query: '{query}' and contact: '{contact}'")
+
+    async def _log(self, query: str, params: tuple):
+        """
+        Hands a log row to the background writer if it is running, otherwise
+        writes it directly. The log tables are created by initialize_db.py.
+        """
+        if self.log_writer is not None and self.log_writer.is_running:
+            self.log_writer.submit(query, params)
+            return
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS perplexity_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        query TEXT NOT NULL,
-                        contact TEXT NOT NULL,
-                        response TEXT NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                await db.execute("""
-                    INSERT INTO perplexity_logs (query, contact, response)
-                    VALUES (?, ?, ?);
-                """, (query, contact, response))
-                await db.commit()
-                logger.info(f"Logged Perplexity response for query: '{query}' and contact: '{contact}'")
+            await self._execute_write(query, params)
         except Exception as e:
-            logger.error(f"Error logging Perplexity response: {e}")
-    
+            registry.inc("db_errors_total", operation="log")
+            logger.error(f"Error writing log record: {e}")
+
+    @instrumented
     async def insert_final_response(self, unique_number: int, contact: str,
-        message_text: str, generated_response: str):
+        message_text: str, generated_response: str, group_name: str = None):
         """
         Inserts a generated response into the 'final_response_table'.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO final_response_table (unique_number, contact,
-                    message_text, generated_response)
-                    VALUES (?, ?, ?, ?); """, 
-                (unique_number, contact, message_text, generated_response))
-                await db.commit()
+            await self._execute_write("""
+                INSERT INTO final_response_table (unique_number, contact,
+                message_text, generated_response, group_name)
+                VALUES (?, ?, ?, ?, ?); """,
+            (unique_number, contact, message_text, generated_response, group_name))
             logger.info(f"Inserted final response for unique number: {unique_number}")
         except Exception as e:
+            registry.inc("db_errors_total", operation="insert_final_response")
             logger.error(f"Error inserting final response: {e}")
-            
 
+
+    @instrumented
+    async def save_draft_response(self, unique_number: int, contact: str, message_text: str, draft: str,
+        group_name: str = None):
+        """
+        Stores a response that is still being generated as a 'drafting' row,
+        replacing any draft left for the same unique number by an earlier
+        attempt.
+        """
+        async with self.transaction() as db:
+            await db.execute("""
+                DELETE FROM final_response_table WHERE unique_number = ? AND status = 'drafting';
+            """, (unique_number,))
+            await db.execute("""
+                INSERT INTO final_response_table (unique_number, contact, message_text, generated_response,
+                group_name, status)
+                VALUES (?, ?, ?, ?, ?, 'drafting');
+            """, (unique_number, contact, message_text, draft, group_name))
+
+    @instrumented
+    async def update_draft_response(self, unique_number: int, draft: str):
+        """
+        Replaces the text of a 'drafting' row.
+        """
+        await self._execute_write("""
+            UPDATE final_response_table SET generated_response = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE unique_number = ? AND status = 'drafting';
+        """, (draft, unique_number))
+
+    @instrumented
+    async def finish_draft_response(self, unique_number: int, generated_response: str) -> bool:
+        """
+        Stores the finished text of a draft and makes it pending, so it can
+        get its affiliate link.
+
+        Returns:
+            bool: False if there was no draft to finish.
+        """
+        updated = await self._execute_write("""
+            UPDATE final_response_table
+            SET generated_response = ?, status = 'pending', updated_at = CURRENT_TIMESTAMP
+            WHERE unique_number = ? AND status = 'drafting';
+        """, (generated_response, unique_number))
+        if updated:
+            logger.info(f"Finished draft response for unique number: {unique_number}")
+        return bool(updated)
+
+    @instrumented
+    async def delete_draft_response(self, unique_number: int):
+        """
+        Removes the draft of a response whose generation failed.
+        """
+        await self._execute_write("""
+            DELETE FROM final_response_table WHERE unique_number = ? AND status = 'drafting';
+        """, (unique_number,))
+
+    @instrumented
+    async def fetch_draft_responses(self):
+        """
+        Retrieves the responses still being generated, for the admin page.
+        """
+        async with self.connection() as db:
+            cursor = await db.execute("""
+                SELECT unique_number, contact, message_text, generated_response, group_name
+                FROM final_response_table
+                WHERE status = 'drafting'
+                ORDER BY id;
+            """)
+            return await cursor.fetchall()
+
+    @instrumented
     async def update_affiliate_link(self, unique_number: int, affiliate_link: str):
         """
         Updates the affiliate link and status for a given unique number in
         'final_response_table'.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    UPDATE final_response_table
-                    SET affiliate_link = ?, status = 'affiliate_added', updated_at = CURRENT_TIMESTAMP
-                    WHERE unique_number = ? AND status = 'pending';
-                """, (affiliate_link, unique_number))
-                await db.commit()
+            await self._execute_write("""
+                UPDATE final_response_table
+                SET affiliate_link = ?, status = 'affiliate_added', updated_at = CURRENT_TIMESTAMP
+                WHERE unique_number = ? AND status = 'pending';
+            """, (affiliate_link, unique_number))
             logger.info(f"Updated affiliate link for unique number: {unique_number}")
         except Exception as e:
+            registry.inc("db_errors_total", operation="update_affiliate_link")
             logger.error(f"Error updating affiliate link: {e}")
-            
 
+
+    @instrumented
+    async def fetch_pending_responses(self):
+        """
+        Retrieves all entries from 'final_response_table' that are still
+        awaiting an affiliate link.
+        """
+        async with self.connection() as db:
+            cursor = await db.execute("""
+                SELECT unique_number, contact, message_text, generated_response, group_name
+                FROM final_response_table
+                WHERE affiliate_link IS NULL AND status = 'pending';
+            """)
+            return await cursor.fetchall()
+
+    @instrumented
     async def fetch_pending_affiliates(self):
         """
         Retrieves all entries from 'final_response_table' where affiliate_link is
         pending.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.connection() as db:
                 cursor = await db.execute("""
                     SELECT unique_number, generated_response
                     FROM final_response_table
@@ -186,31 +554,130 @@ class DatabaseClient:
                 rows = await cursor.fetchall()
                 return rows
         except Exception as e:
+            registry.inc("db_errors_total", operation="fetch_pending_affiliates")
             logger.error(f"Error fetching pending affiliates: {e}")
             return []
 
-    async def mark_as_sent(self, unique_number: int):
+    @instrumented
+    async def claim_affiliate_responses(self, limit: int, owner: str = None, groups=None) -> list:
+        """
+        Atomically claims up to `limit` responses whose affiliate link has
+        been added, moving them to status 'sending' so no other sender picks
+        them up.
+
+        Args:
+            limit (int): Maximum number of responses to claim.
+            owner (str): Instance recorded as the claimer; only it can acknowledge the send.
+            groups: Only claim responses for these groups. None claims from every group.
+
+        Returns:
+            list: (unique_number, contact, generated_response, affiliate_link, group_name) tuples, oldest first.
+        """
+        groups = groups_param(groups)
+        async with self.transaction() as db:
+            cursor = await db.execute(f"""
+                UPDATE final_response_table
+                SET status = 'sending', claimed_by = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM final_response_table
+                    WHERE status = 'affiliate_added' AND affiliate_link IS NOT NULL AND {GROUP_FILTER}
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING id, unique_number, contact, generated_response, affiliate_link, group_name;
+            """, (owner, groups, groups, limit))
+            rows = await cursor.fetchall()
+        rows.sort()
+        if rows:
+            logger.info(f"Claimed {len(rows)} affiliate responses for delivery")
+        return [row[1:] for row in rows]
+
+    @instrumented
+    async def count_unconfirmed_sends(self, claimed_by: str = None) -> int:
+        """
+        Counts responses claimed for delivery but never marked sent, left
+        behind by a sender that stopped mid-delivery.
+
+        Args:
+            claimed_by (str): Only count responses claimed by this instance.
         """
-        Marks the entry in 'final_response_table' as sent.
+        async with self.connection() as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM final_response_table
+                WHERE status = 'sending' AND (? IS NULL OR claimed_by = ?);
+            """, (claimed_by, claimed_by))
+            row = await cursor.fetchone()
+        return row[0]
+
+    @instrumented
+    async def fetch_unconfirmed_sends(self):
+        """
+        Retrieves the responses claimed for delivery but never marked sent,
+        for the admin page. Whether each one reached the group is unknown.
+        """
+        async with self.connection() as db:
+            cursor = await db.execute("""
+                SELECT unique_number, contact, message_text, generated_response, group_name, claimed_by, updated_at
+                FROM final_response_table
+                WHERE status = 'sending'
+                ORDER BY id;
+            """)
+            return await cursor.fetchall()
+
+    @instrumented
+    async def release_claimed_response(self, unique_number: int, owner: str = None) -> bool:
+        """
+        Puts a response claimed for delivery back to 'affiliate_added' so it
+        is sent again. Only for sends known not to have gone out, or ones an
+        operator has checked.
+
+        Args:
+            unique_number (int): The response to release.
+            owner (str): Only release it if this instance holds the claim. None releases any claim.
+
+        Returns:
+            bool: True if the response was released.
+        """
+        updated = await self._execute_write("""
+            UPDATE final_response_table
+            SET status = 'affiliate_added', claimed_by = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE unique_number = ? AND status = 'sending' AND (? IS NULL OR claimed_by = ?);
+        """, (unique_number, owner, owner))
+        if updated:
+            logger.info(f"Released unique number {unique_number} for another delivery attempt.")
+        return bool(updated)
+
+    @instrumented
+    async def mark_as_sent(self, unique_number: int, owner: str = None) -> bool:
+        """
+        Marks the entry in 'final_response_table' as sent. With an owner this
+        acknowledges a claim: the row is only updated if that instance still
+        holds it.
+
+        Returns:
+            bool: True if the row was marked sent.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    UPDATE final_response_table
-                    SET status = 'sent', updated_at = CURRENT_TIMESTAMP
-                    WHERE unique_number = ?;
-                """, (unique_number,))
-                await db.commit()
+            updated = await self._execute_write("""
+                UPDATE final_response_table
+                SET status = 'sent', updated_at = CURRENT_TIMESTAMP
+                WHERE unique_number = ? AND (? IS NULL OR (status = 'sending' AND claimed_by = ?));
+            """, (unique_number, owner, owner))
+            if not updated:
+                reason = f"is not claimed by '{owner}'" if owner else "was not found"
+                logger.warning(f"Unique number {unique_number} {reason}, not marked sent.")
+                return False
             logger.info(f"Marked unique number {unique_number} as sent.")
+            return True
         except Exception as e:
+            registry.inc("db_errors_total", operation="mark_as_sent")
             logger.error(f"Error marking as sent: {e}")
-            
+            return False
+
+    @instrumented
     async def delete_pending_response(self, unique_number):
         """
         Deletes a pending response based on unique_number.
         """
         query = "DELETE FROM final_response_table WHERE unique_number = ?"
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(query, (unique_number,))
-            await db.commit()
-   
+        await self._execute_write(query, (unique_number,))
+
@@ -0,0 +1,125 @@
+# dedup.py
+
+import hashlib
+import logging
+from collections import OrderedDict
+from database_client import DatabaseClient
+from number_allocator import UniqueNumberAllocator
+
+logger = logging.getLogger(__name__)
+
+# Message IDs are the first 16 bytes of a SHA-256 digest, stored as BLOBs.
+# 128 bits keep accidental collisions out of reach for any realistic
+# message volume at a quarter of the size of the 64-character hex digest.
+MESSAGE_ID_BYTES = 16
+
+def hash_message_id(unique_string: str) -> bytes:
+    """
+    Returns the compact ID of a message from the string identifying it.
+    """
+    return hashlib.sha256(unique_string.encode()).digest()[:MESSAGE_ID_BYTES]
+
+def compact_message_id(value):
+    """
+    Converts a message ID recorded as a SHA-256 hex string by earlier
+    versions to the compact form, which is the same digest truncated, so
+    a message seen before the migration is still recognised. Anything
+    else is returned unchanged.
+    """
+    if isinstance(value, str) and len(value) == 64:
+        try:
+            return bytes.fromhex(value)[:MESSAGE_ID_BYTES]
+        except ValueError:
+            pass
+    return value
+
+class SeenMessageCache:
+    def __init__(self, capacity: int):
+        """
+        A bounded LRU set of message IDs known to be processed.
+
+        Args:
+            capacity (int): Maximum number of IDs kept in memory.
+        """
+        self.capacity = capacity
+        self._ids = OrderedDict()
+
+    def __contains__(self, message_id: bytes) -> bool:
+        if message_id in self._ids:
+            self._ids.move_to_end(message_id)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, message_id: bytes):
+        self._ids[message_id] = None
+        self._ids.move_to_end(message_id)
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+
+class MessageDeduplicator:
+    def __init__(self, db_client: DatabaseClient, allocator: UniqueNumberAllocator, capacity: int = 50000):
+        """
+        Resolves which scraped messages are new, checking an in-memory LRU of
+        seen IDs first and the database only for the rest.
+
+        Args:
+            db_client (DatabaseClient): Database holding 'processed_messages'.
+            allocator (UniqueNumberAllocator): Source of unique numbers for new messages.
+            capacity (int): Size of the in-memory seen-set.
+        """
+        self.db_client = db_client
+        self.allocator = allocator
+        self.seen = SeenMessageCache(capacity)
+        self.cache_hits = 0
+        self.db_lookups = 0
+
+    async def warm(self):
+        """
+        Loads the most recently processed message IDs into the seen-set.
+        """
+        for message_id in await self.db_client.fetch_recent_processed_message_ids(self.seen.capacity):
+            self.seen.add(message_id)
+        logger.info(f"Warmed seen-message cache with {len(self.seen)} IDs")
+
+    async def register(self, message_ids, work_items: dict = None, aliases: dict = None) -> list:
+        """
+        Numbers and records the IDs that have not been processed yet.
+
+        Args:
+            message_ids: Message IDs from one poll, oldest first.
+            work_items (dict): Optional message_id -> (contact, message_text, priority) to queue
+                in 'work_items' together with each new ID.
+            aliases (dict): Optional message_id -> ID the same message was recorded under by an
+                earlier ID scheme. A message is processed if either ID is.
+
+        Returns:
+            list: (message_id, unique_number) pairs for the new IDs, in order.
+        """
+        candidates = []
+        for message_id in dict.fromkeys(message_ids):
+            if message_id in self.seen:
+                self.cache_hits += 1
+            else:
+                candidates.append(message_id)
+        if not candidates:
+            return []
+
+        aliases = {message_id: aliases[message_id] for message_id in candidates if message_id in (aliases or {})}
+        self.db_lookups += len(candidates)
+        processed = await self.db_client.filter_processed_messages(candidates + list(aliases.values()))
+        processed.update(message_id for message_id, alias in aliases.items() if alias in processed)
+        for message_id in processed:
+            self.seen.add(message_id)
+        new_ids = [message_id for message_id in candidates if message_id not in processed]
+        if not new_ids:
+            return []
+
+        numbers = await self.allocator.allocate_many(len(new_ids))
+        inserted = await self.db_client.insert_processed_messages(list(zip(new_ids, numbers)), work_items)
+        for message_id in new_ids:
+            self.seen.add(message_id)
+        return inserted
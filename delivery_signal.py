@@ -0,0 +1,110 @@
+# delivery_signal.py
+
+import asyncio
+import logging
+import socket
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_HOST = "127.0.0.1"
+NOTIFY_MESSAGE = b"affiliate_added"
+
+def notify_affiliate_added(port: int):
+    """
+    Tells a running bot that an affiliate link was committed. Fire and
+    forget: if no bot is listening the datagram is simply lost and the bot
+    picks the change up on its next data_version check.
+    """
+    if not port:
+        return
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(NOTIFY_MESSAGE, (NOTIFY_HOST, port))
+    except OSError as e:
+        logger.warning(f"Could not notify bot of new affiliate link: {e}")
+
+
+class _NotifyProtocol(asyncio.DatagramProtocol):
+    def __init__(self, event: asyncio.Event):
+        self.event = event
+
+    def datagram_received(self, data, addr):
+        self.event.set()
+
+
+class DeliverySignal:
+    def __init__(self, db_path: str, port: int = 0, check_interval: float = 1.0):
+        """
+        Wakes the delivery loop when final responses may be ready to send:
+        immediately on a datagram from notify_affiliate_added(), and otherwise
+        within check_interval of any commit to the database, detected with
+        PRAGMA data_version on a dedicated connection.
+
+        Args:
+            db_path (str): Database whose commits are watched.
+            port (int): Local UDP port to listen on, 0 to rely on data_version only.
+            check_interval (float): Seconds between data_version checks.
+        """
+        self.db_path = db_path
+        self.port = port
+        self.check_interval = check_interval
+        self._event = asyncio.Event()
+        self._transport = None
+        self._db = None
+        self._data_version = None
+
+        self.notifications = 0
+        self.changes = 0
+
+    async def start(self):
+        self._db = await aiosqlite.connect(self.db_path)
+        self._data_version = await self._read_data_version()
+        if self.port:
+            try:
+                loop = asyncio.get_running_loop()
+                self._transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _NotifyProtocol(self._event), local_addr=(NOTIFY_HOST, self.port))
+                logger.info(f"Listening for affiliate notifications on udp://{NOTIFY_HOST}:{self.port}")
+            except OSError as e:
+                logger.warning(f"Could not listen on port {self.port} ({e}), relying on data_version checks")
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _read_data_version(self) -> int:
+        cursor = await self._db.execute("PRAGMA data_version;")
+        row = await cursor.fetchone()
+        return row[0]
+
+    async def wait(self):
+        """
+        Returns once a notification arrives or the database has changed
+        since the previous call.
+        """
+        while True:
+            if self._event.is_set():
+                self._event.clear()
+                self.notifications += 1
+                return
+            data_version = await self._read_data_version()
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self.changes += 1
+                return
+            try:
+                await asyncio.wait_for(self._event.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                pass
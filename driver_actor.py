@@ -0,0 +1,133 @@
+# driver_actor.py
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class CommandTiming:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def record(self, waited: float, elapsed: float, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        self.wait_seconds += waited
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(1000 * self.total_seconds / self.count, 1) if self.count else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 1),
+            "mean_wait_ms": round(1000 * self.wait_seconds / self.count, 1) if self.count else 0.0,
+        }
+
+
+class DriverActor:
+    def __init__(self, driver, slow_command_seconds: float = 2.0):
+        """
+        Runs every WebDriver command on one dedicated thread, so blocking
+        Selenium calls never stall the event loop and the driver, which is
+        not thread-safe, is only ever touched from a single thread.
+
+        Until start() is called, call() runs commands inline on the caller's
+        thread, so code that has not started the actor keeps working.
+
+        Args:
+            driver: The webdriver.Chrome (or compatible) instance the actor owns.
+            slow_command_seconds (float): Commands running longer than this are logged.
+        """
+        self.driver = driver
+        self.slow_command_seconds = slow_command_seconds
+        self._commands = queue.Queue()
+        self._thread = None
+        self.timings = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._thread = threading.Thread(target=self._run, name="webdriver-actor", daemon=True)
+        self._thread.start()
+        logger.info("WebDriver actor started.")
+
+    async def stop(self):
+        """
+        Lets queued commands finish, then stops the thread.
+        """
+        if self._thread is None:
+            return
+        self._commands.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+        logger.info(f"WebDriver actor stopped. Command timings: {self.stats()}")
+
+    async def call(self, name: str, command, *args, **kwargs):
+        """
+        Runs command(*args, **kwargs) on the driver thread and returns its
+        result, re-raising anything it raises.
+
+        Args:
+            name (str): Label the timing is recorded under.
+            command: Callable that uses the driver.
+        """
+        submitted = time.perf_counter()
+        if not self.is_running:
+            return self._execute(name, command, args, kwargs, submitted)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._commands.put((name, command, args, kwargs, submitted, loop, future))
+        return await future
+
+    def _run(self):
+        while True:
+            entry = self._commands.get()
+            if entry is None:
+                return
+            name, command, args, kwargs, submitted, loop, future = entry
+            try:
+                result, error = self._execute(name, command, args, kwargs, submitted), None
+            except BaseException as e:
+                result, error = None, e
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                pass  # The event loop is gone; nobody is waiting any more
+
+    def _execute(self, name: str, command, args, kwargs, submitted: float):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = command(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings.setdefault(name, CommandTiming()).record(started - submitted, elapsed, failed)
+            if elapsed > self.slow_command_seconds:
+                logger.warning(f"WebDriver command '{name}' took {elapsed:.2f}s")
+
+    def stats(self) -> dict:
+        return {name: timing.summary() for name, timing in list(self.timings.items())}
+
+
+def _resolve(future: asyncio.Future, result, error):
+    if future.done():
+        return  # The caller was cancelled while the command ran
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,211 @@
+# fake_whatsapp.py
+
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.keys import Keys
+from whatsapp_automation import (
+    EXTRACT_NEW_MESSAGES_SCRIPT,
+    READ_UNREAD_COUNTS_SCRIPT,
+    INSTALL_MESSAGE_OBSERVER_SCRIPT,
+    DRAIN_MESSAGE_OBSERVER_SCRIPT
+)
+
+# One incoming chat message, arriving `at` seconds into the replay. `need`
+# is the expected classification, or None if unknown.
+TranscriptMessage = namedtuple("TranscriptMessage", "at group metadata text need", defaults=(None,))
+
+class FakeElement:
+    def __init__(self, on_click=None, on_keys=None, text: str = "", attributes: dict = None, children: dict = None):
+        self.on_click = on_click
+        self.on_keys = on_keys
+        self.text = text
+        self.attributes = attributes or {}
+        self.children = children or {}
+
+    def click(self):
+        if self.on_click:
+            self.on_click()
+
+    def clear(self):
+        pass
+
+    def send_keys(self, text):
+        if self.on_keys:
+            self.on_keys(text)
+
+    def is_displayed(self) -> bool:
+        return True
+
+    def is_enabled(self) -> bool:
+        return True
+
+    def get_attribute(self, name: str):
+        return self.attributes.get(name)
+
+    def find_element(self, by, value):
+        for selector, child in self.children.items():
+            if selector in value:
+                return child
+        raise NoSuchElementException(value)
+
+
+class ReplayDriver:
+    def __init__(self, transcript, speed: float = 1.0, command_latency: float = 0.0):
+        """
+        Stand-in for webdriver.Chrome on WhatsApp Web that replays a chat
+        transcript: each message becomes visible in its group `at / speed`
+        seconds after the bot first reads a chat, and is served through the
+        same scripts, observer and div.message-in elements the bot uses on
+        the real page. Sent messages are recorded instead of delivered.
+
+        Args:
+            transcript: TranscriptMessage entries, in any order.
+            speed (float): Replay speed-up; 0 makes the whole transcript visible at once.
+            command_latency (float): Seconds every driver command takes, to model the
+                WebDriver round trip.
+        """
+        self.pending = deque(sorted(transcript, key=lambda message: message.at))
+        self.speed = speed
+        self.command_latency = command_latency
+        self.groups = list(dict.fromkeys(message.group for message in self.pending))
+        self.chats = {group: [] for group in self.groups}
+        self.unread = Counter()
+        self.open_chat = None
+        self.observer_installed = False
+        self.inbox = []
+
+        self.started_at = None
+        self.started_wall = None
+        self.visible_at = {}  # (group, metadata, text) -> wall clock time the message appeared
+        self.sent = []        # (group, text, wall clock time)
+        self.commands = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        """
+        True once every transcript message is visible.
+        """
+        return self.started_at is not None and not self.pending
+
+    def _due(self, message) -> float:
+        return message.at / self.speed if self.speed else 0.0
+
+    def _start_clock(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+            self.started_wall = time.time()
+
+    def _release(self):
+        if self.started_at is None:
+            return
+        elapsed = time.monotonic() - self.started_at
+        while self.pending and self._due(self.pending[0]) <= elapsed:
+            message = self.pending.popleft()
+            pair = [message.metadata, message.text]
+            self.chats[message.group].append(pair)
+            self.visible_at.setdefault((message.group, message.metadata, message.text),
+                                       self.started_wall + self._due(message))
+            if message.group == self.open_chat:
+                if self.observer_installed:
+                    self.inbox.append(pair)
+            else:
+                self.unread[message.group] += 1
+
+    def _command(self, name: str):
+        self.commands[name] += 1
+        if self.command_latency:
+            time.sleep(self.command_latency)
+        self._release()
+
+    def _open(self, group: str):
+        self.open_chat = group
+        self.unread[group] = 0
+        self.inbox = []
+
+    def _type(self, text: str):
+        with self._lock:
+            self.sent.append((self.open_chat, text.replace(Keys.ENTER, ""), time.time()))
+
+    # WebDriver API used by WhatsAppBot
+
+    def get(self, url: str):
+        self._command("get")
+
+    def quit(self):
+        self._command("quit")
+
+    def set_script_timeout(self, timeout: float):
+        pass
+
+    def find_element(self, by, value):
+        self._command("find_element")
+        if 'id="side"' in value:
+            return FakeElement()
+        if 'id="main"' in value and self.open_chat is not None:
+            return FakeElement()
+        if 'data-tab="3"' in value:
+            return FakeElement()  # Search box
+        if '@title="' in value:
+            title = value.split('@title="')[1].split('"')[0]
+            if title in self.chats:
+                return FakeElement(on_click=lambda: self._open(title))
+        if "Type a message" in value and self.open_chat is not None:
+            return FakeElement(on_keys=self._type)
+        raise NoSuchElementException(value)
+
+    def find_elements(self, by, value):
+        self._command("find_elements")
+        if value != "div.message-in" or self.open_chat is None:
+            return []
+        self._start_clock()
+        self._release()
+        return [FakeElement(children={
+            "copyable-text": FakeElement(attributes={"data-pre-plain-text": metadata}),
+            "selectable-text": FakeElement(text=text),
+        }) for metadata, text in self.chats[self.open_chat]]
+
+    def execute_script(self, script: str, *args):
+        self._command("execute_script")
+        if script == READ_UNREAD_COUNTS_SCRIPT:
+            return {group: self.unread[group] for group in self.groups if group != self.open_chat}
+        if self.open_chat is None:
+            return None if script == EXTRACT_NEW_MESSAGES_SCRIPT else False
+        self._start_clock()
+        self._release()
+        if script == INSTALL_MESSAGE_OBSERVER_SCRIPT:
+            self.observer_installed = True
+            return True
+        if script == EXTRACT_NEW_MESSAGES_SCRIPT:
+            last_metadata, last_text = args
+            history = self.chats[self.open_chat]
+            start = 0
+            for index in range(len(history) - 1, -1, -1):
+                if last_metadata is not None and history[index] == [last_metadata, last_text]:
+                    start = index + 1
+                    break
+            return [list(pair) for pair in history[start:]]
+        raise ValueError("Unexpected script")
+
+    def execute_async_script(self, script: str, *args):
+        self._command("execute_async_script")
+        if script != DRAIN_MESSAGE_OBSERVER_SCRIPT:
+            raise ValueError("Unexpected script")
+        if not self.observer_installed:
+            return None
+        deadline = time.monotonic() + args[0] / 1000
+        while True:
+            self._release()
+            if self.inbox:
+                drained, self.inbox = self.inbox, []
+                return drained
+            now = time.monotonic()
+            if now >= deadline:
+                return []
+            # Sleep until the next message is due or the long-poll times out
+            wake = deadline
+            if self.pending:
+                wake = min(wake, self.started_at + self._due(self.pending[0]))
+            time.sleep(max(0.0, wake - now))
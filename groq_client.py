@@ -1,23 +1,70 @@
 # groq_client.py
 
 import logging
-from groq import Groq
+import json
+from groq import Groq, AsyncGroq
 from config import Config
 from database_client import DatabaseClient
+from classification_cache import ClassificationCache
+from rate_limiter import TokenBucket
+from metrics import registry
+from resilience import ResilientCaller, CircuitBreaker, UpstreamUnavailable
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+MODEL = "llama3-8b-8192"
+
 class GroqClient:
-    def __init__(self, db_client: DatabaseClient):
+    def __init__(self, db_client: DatabaseClient, batching: bool = None, batch_size: int = None,
+        batch_window: float = None, cache: ClassificationCache = None, max_concurrency: int = None,
+        timeout: float = None, rate_limiter: TokenBucket = None, base_url: str = None,
+        resilience: ResilientCaller = None):
         """
         Initializes the GroqClient with the provided DatabaseClient instance.
 
         Args:
             db_client (DatabaseClient): An instance of DatabaseClient for logging purposes.
+            batching (bool): Classify concurrent messages in one request. Defaults to Config.GROQ_BATCHING.
+            batch_size (int): Maximum messages per batched request. Defaults to Config.GROQ_BATCH_SIZE.
+            batch_window (float): Seconds to wait for a batch to fill. Defaults to Config.GROQ_BATCH_WINDOW_SECONDS.
+            cache (ClassificationCache): Optional cache consulted before calling Groq.
+            max_concurrency (int): Maximum Groq requests in flight. Defaults to Config.GROQ_MAX_CONCURRENCY.
+            timeout (float): Seconds before a Groq request is abandoned. Defaults to Config.GROQ_TIMEOUT_SECONDS.
+            rate_limiter (TokenBucket): Optional limiter matching the Groq request quota.
+            base_url (str): API endpoint. Defaults to Config.GROQ_BASE_URL, then the Groq default.
+            resilience (ResilientCaller): Deadline, retry, hedging and circuit breaker policy for
+                async calls. Defaults to one built from Config.
         """
-        self.client = Groq(api_key=Config.GROQ_API_KEY)
+        base_url = base_url or Config.GROQ_BASE_URL
+        self.client = Groq(api_key=Config.GROQ_API_KEY, base_url=base_url)
+        # Retries are left to the resilience policy
+        self.async_client = AsyncGroq(api_key=Config.GROQ_API_KEY, base_url=base_url, max_retries=0)
         self.db_client = db_client
+        self.batching = Config.GROQ_BATCHING if batching is None else batching
+        self.batch_size = Config.GROQ_BATCH_SIZE if batch_size is None else batch_size
+        self.batch_window = Config.GROQ_BATCH_WINDOW_SECONDS if batch_window is None else batch_window
+        self.cache = cache
+        self.max_concurrency = Config.GROQ_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.timeout = Config.GROQ_TIMEOUT_SECONDS if timeout is None else timeout
+        self.rate_limiter = rate_limiter
+        self.resilience = resilience or ResilientCaller(
+            "groq",
+            deadline=Config.GROQ_DEADLINE_SECONDS,
+            max_retries=Config.LLM_MAX_RETRIES,
+            backoff_base=Config.LLM_BACKOFF_BASE_SECONDS,
+            backoff_max=Config.LLM_BACKOFF_MAX_SECONDS,
+            hedge_after=Config.GROQ_HEDGE_AFTER_SECONDS,
+            breaker=CircuitBreaker("groq", Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_SECONDS)
+        )
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pending = []
+        self._flush_handle = None
+        self._batch_tasks = set()
+        self.batches_sent = 0
+        self.batch_fallbacks = 0
+        self.timeouts = 0
         logger.info("GroqClient initialized successfully.")
 
     def is_product_need(self, message: str) -> bool: # THIS IS FOR TESTING PURPOSES ONLY , WE DONT USE IN MAIN CODE
@@ -31,31 +78,65 @@ class GroqClient:
             bool: True if the message is classified as a product need; False otherwise.
         """
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a classifier that determines if a message indicates a product-related need. Respond with 'Yes' or 'No' only."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Is the following message a product-related need? Answer only with 'Yes' or 'No'. Message: '{message}'"
-                    }
-                ],
-                model="llama3-8b-8192",
-                temperature=0.0,
-                max_tokens=10,
-                top_p=1,
-                stop=["\n"],
-                stream=False,
-            )
-            answer = chat_completion.choices[0].message.content.strip().lower()
-            logger.info(f"Groq Classification Result: '{answer}' for message: '{message}'")
-            return answer == 'yes'
+            chat_completion = self.client.chat.completions.create(**classification_request(message))
+            return read_classification(chat_completion, message)
         except Exception as e:
             logger.error(f"Error during Groq classification: {e}")
             return False
 
+    async def classify_async(self, message: str) -> bool:
+        """
+        Classifies one message with the async Groq client. Unlike
+        is_product_need(), API errors and timeouts propagate so callers can
+        tell a 'No' apart from a failed request.
+        """
+        chat_completion = await self._create(classification_request(message))
+        return read_classification(chat_completion, message)
+
+    async def are_product_needs_async(self, messages: list) -> list:
+        """
+        Classifies several messages with a single Groq request.
+
+        Args:
+            messages (list): The message texts to classify.
+
+        Returns:
+            list: One bool per message, in order.
+
+        Raises:
+            ValueError: If the response is not one 'Yes'/'No' per message.
+        """
+        chat_completion = await self._create(batch_classification_request(messages))
+        answers = parse_batch_answers(chat_completion.choices[0].message.content, len(messages))
+        logger.info(f"Groq Batch Classification Result: {answers} for {len(messages)} messages")
+        return [answer == 'yes' for answer in answers]
+
+    async def _create(self, request: dict):
+        """
+        Sends a chat completion request under the resilience policy.
+        """
+        return await self.resilience.call(self._send, request)
+
+    async def _send(self, request: dict):
+        """
+        Sends one chat completion request once the rate limiter allows it,
+        holding a concurrency slot and enforcing the per-call timeout.
+        """
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._semaphore:
+            registry.inc("api_requests_total", api="groq")
+            try:
+                with registry.timer("api_request_seconds", api="groq"):
+                    return await asyncio.wait_for(self.async_client.chat.completions.create(**request), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                registry.inc("api_errors_total", api="groq", error="timeout")
+                raise
+            except Exception as e:
+                registry.inc("api_errors_total", api="groq", error=getattr(e, "status_code", type(e).__name__))
+                raise
+
     async def is_product_need_async(self, message_text: str) -> bool:
         """
         Asynchronously determines if a message indicates a product-related need using the Groq API.
@@ -65,17 +146,193 @@ class GroqClient:
 
         Returns:
             bool: True if the message is classified as a product need; False otherwise.
+
+        Raises:
+            UpstreamUnavailable: Groq is down or kept failing; the message can be classified later.
         """
         try:
-            loop = asyncio.get_running_loop()
-            # Run the synchronous method in the default executor (ThreadPoolExecutor)
-            result = await loop.run_in_executor(None, self.is_product_need, message_text)
-            
+            if self.cache is not None:
+                cached = await self.cache.get(message_text)
+                if cached is not None:
+                    return cached
+
+            if self.batching:
+                result = await self._classify_in_batch(message_text)
+            else:
+                result = await self.classify_async(message_text)
+
             # Log the classification result to the database
             classification = 'Yes' if result else 'No'
             await self.db_client.log_groq_result(message_text, classification)
-            
+            if self.cache is not None:
+                await self.cache.put(message_text, result)
+
             return result
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Exception during asynchronous Groq API call: {e}")
+            logger.error(f"Exception during asynchronous Groq API call: {e!r}")
             return False
+
+    async def _classify_in_batch(self, message_text: str) -> bool:
+        """
+        Adds a message to the pending batch and waits for its result. The batch
+        is sent when it reaches batch_size or batch_window has passed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message_text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush_batch()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush_batch)
+        return await future
+
+    def _flush_batch(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batch)
+        if batch:
+            task = asyncio.create_task(self._send_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+            # Nobody is left waiting if the batch is cancelled, even before it starts
+            task.add_done_callback(lambda _: cancel_waiting(batch))
+
+    async def close(self):
+        """
+        Cancels batched classifications that are still waiting or in flight.
+        Their callers get CancelledError.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        cancel_waiting(pending)
+        tasks = list(self._batch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send_batch(self, batch):
+        messages = [message_text for message_text, _ in batch]
+        if len(messages) > 1:
+            try:
+                self.batches_sent += 1
+                results = await self.are_product_needs_async(messages)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+            except UpstreamUnavailable as e:
+                # Single requests would fail the same way
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            except Exception as e:
+                # Malformed or failed batch: classify each message on its own
+                self.batch_fallbacks += 1
+                logger.warning(f"Batch classification of {len(messages)} messages failed ({e!r}), falling back to single requests")
+        results = await asyncio.gather(*(
+            self.classify_async(message_text) for message_text in messages
+        ), return_exceptions=True)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def cancel_waiting(batch):
+    """
+    Cancels the futures of batched messages that never got an answer.
+    """
+    for _, future in batch:
+        if not future.done():
+            future.cancel()
+
+def classification_request(message: str) -> dict:
+    """
+    Builds the chat completion arguments for classifying one message.
+    """
+    return dict(
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a classifier that determines if a message indicates a product-related need. Respond with 'Yes' or 'No' only."
+            },
+            {
+                "role": "user",
+                "content": f"Is the following message a product-related need? Answer only with 'Yes' or 'No'. Message: '{message}'"
+            }
+        ],
+        model=MODEL,
+        temperature=0.0,
+        max_tokens=10,
+        top_p=1,
+        stop=["\n"],
+        stream=False,
+    )
+
+def batch_classification_request(messages: list) -> dict:
+    """
+    Builds the chat completion arguments for classifying several messages at once.
+    """
+    return dict(
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "You are a classifier that determines, for each message in a JSON array, whether it "
+                    "indicates a product-related need. Respond only with a JSON array containing exactly "
+                    "one 'Yes' or 'No' per message, in the same order."
+                )
+            },
+            {
+                "role": "user",
+                "content": f"Classify these {len(messages)} messages: {json.dumps(messages, ensure_ascii=False)}"
+            }
+        ],
+        model=MODEL,
+        temperature=0.0,
+        max_tokens=8 * len(messages) + 10,
+        top_p=1,
+        stream=False,
+    )
+
+def read_classification(chat_completion, message: str) -> bool:
+    answer = chat_completion.choices[0].message.content.strip().lower()
+    logger.info(f"Groq Classification Result: '{answer}' for message: '{message}'")
+    return answer == 'yes'
+
+def parse_batch_answers(content: str, expected: int) -> list:
+    """
+    Parses a JSON array of 'Yes'/'No' answers out of a batch classification
+    response.
+
+    Returns:
+        list: The lower-cased answers.
+
+    Raises:
+        ValueError: If the array is missing, has the wrong length or contains
+            anything other than 'Yes'/'No'.
+    """
+    start, end = content.find('['), content.rfind(']')
+    if start == -1 or end < start:
+        raise ValueError(f"No JSON array in batch response: {content!r}")
+    try:
+        answers = json.loads(content[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in batch response: {e}")
+    if not isinstance(answers, list) or len(answers) != expected:
+        raise ValueError(f"Expected {expected} answers, got {answers!r}")
+    answers = [str(answer).strip().lower() for answer in answers]
+    if any(answer not in ('yes', 'no') for answer in answers):
+        raise ValueError(f"Unexpected answers in batch response: {answers!r}")
+    return answers
@@ -3,24 +3,81 @@
 import asyncio
 import aiosqlite
 import logging
+from dedup import compact_message_id
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATABASE = 'bot_database.db'
 
-async def initialize_db():
-    async with aiosqlite.connect(DATABASE) as db:
+async def add_column_if_missing(db, table: str, column: str, definition: str):
+    """
+    Adds a column to a table created by an older version of this script.
+    """
+    cursor = await db.execute(f"PRAGMA table_info({table});")
+    if column not in [row[1] for row in await cursor.fetchall()]:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+        logger.info(f"Added column {table}.{column}")
+
+PROCESSED_MESSAGES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        message_id BLOB PRIMARY KEY, -- 16-byte truncated SHA-256, see dedup.hash_message_id
+        unique_number INTEGER NOT NULL
+    ) WITHOUT ROWID;
+"""
+# Lets the deduplicator warm its cache from the most recent numbers without sorting the table
+PROCESSED_MESSAGES_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_processed_messages_unique_number ON {table} (unique_number);
+"""
+
+async def migrate_processed_messages(db) -> int:
+    """
+    Rebuilds a 'processed_messages' table created by an older version of
+    this script, which keyed rows on 64-character hex digests in a rowid
+    table with a separate primary key index, as a WITHOUT ROWID table of
+    16-byte IDs. Hex IDs become their truncated digest, so messages seen
+    before the migration are still recognised. Runs in one transaction.
+
+    Returns:
+        int: The number of rows migrated, 0 if the table was already compact.
+    """
+    cursor = await db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'processed_messages';")
+    row = await cursor.fetchone()
+    if row is None or "WITHOUT ROWID" in row[0].upper():
+        return 0
+    await db.create_function("compact_message_id", 1, compact_message_id, deterministic=True)
+    # As SQLite recommends for rebuilding a table, so dropping the old one does not check the tables referencing it
+    await db.execute("PRAGMA foreign_keys = OFF;")
+    await db.execute("DROP TABLE IF EXISTS processed_messages_compact;")
+    await db.execute(PROCESSED_MESSAGES_SCHEMA.format(table="processed_messages_compact"))
+    await db.execute("BEGIN;")
+    try:
+        cursor = await db.execute("""
+            INSERT OR IGNORE INTO processed_messages_compact (message_id, unique_number)
+            SELECT compact_message_id(message_id), unique_number FROM processed_messages;
+        """)
+        migrated = cursor.rowcount
+        await db.execute("DROP TABLE processed_messages;")
+        await db.execute(PROCESSED_MESSAGES_INDEX.format(table="processed_messages_compact"))
+        await db.execute("ALTER TABLE processed_messages_compact RENAME TO processed_messages;")
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.execute("PRAGMA foreign_keys = ON;")
+    logger.info(f"Migrated {migrated} processed messages to compact message IDs")
+    return migrated
+
+async def initialize_db(db_path: str = DATABASE):
+    async with aiosqlite.connect(db_path) as db:
         # Enable foreign key support
         await db.execute("PRAGMA foreign_keys = ON;")
         
-        # Create processed_messages table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS processed_messages (
-                message_id TEXT PRIMARY KEY,
-                unique_number INTEGER NOT NULL
-            );
-        """)
+        # Create processed_messages table, converting one with hex message IDs
+        await migrate_processed_messages(db)
+        await db.execute(PROCESSED_MESSAGES_SCHEMA.format(table="processed_messages"))
+        await db.execute(PROCESSED_MESSAGES_INDEX.format(table="processed_messages"))
         logger.info("Created table: processed_messages")
         
         # Create user_needs table
@@ -30,9 +87,11 @@ async def initialize_db():
                 message_text TEXT NOT NULL,
                 contact TEXT NOT NULL,
                 unique_number INTEGER NOT NULL,
+                group_name TEXT,
                 FOREIGN KEY (unique_number) REFERENCES processed_messages(unique_number)
             );
         """)
+        await add_column_if_missing(db, "user_needs", "group_name", "TEXT")
         logger.info("Created table: user_needs")
         
         # Create a sequence table for unique_number
@@ -74,6 +133,39 @@ async def initialize_db():
         logger.info("Created table: perplexity_logs")
         
         
+        # Cache of Groq classifications keyed on normalized message text
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS classification_cache (
+                normalized_text TEXT PRIMARY KEY,
+                classification TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+        logger.info("Created table: classification_cache")
+        
+        # Durable work queue between the scraper, classifier and responder stages
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                unique_number INTEGER PRIMARY KEY,
+                contact TEXT NOT NULL,
+                message_text TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                group_name TEXT,
+                state TEXT NOT NULL, -- 'queued', 'classifying', 'awaiting_response', 'responding', 'done', 'expired', 'failed'
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        await add_column_if_missing(db, "work_items", "group_name", "TEXT")
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_work_items_state
+            ON work_items (state, priority DESC, unique_number);
+        """)
+        logger.info("Created table: work_items")
+        
         # Add final_response_table (for affiliate link V2)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS final_response_table (
@@ -83,14 +175,62 @@ async def initialize_db():
                 message_text TEXT NOT NULL,
                 generated_response TEXT NOT NULL,
                 affiliate_link TEXT,
-                status TEXT DEFAULT 'pending', -- 'pending', 'affiliate_added', 'sent'
+                group_name TEXT,
+                status TEXT DEFAULT 'pending', -- 'drafting', 'pending', 'affiliate_added', 'sending', 'sent'
+                claimed_by TEXT, -- instance that claimed the row for delivery
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (unique_number) REFERENCES processed_messages(unique_number)
             );
         """)
+        await add_column_if_missing(db, "final_response_table", "group_name", "TEXT")
+        await add_column_if_missing(db, "final_response_table", "claimed_by", "TEXT")
         logger.info("Created table: final_response_table")
         
+        # Lets the delivery loop find approved responses without a table scan
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_final_response_status
+            ON final_response_table (status, id);
+        """)
+        
+        # Bot instances sharing this database, and which of them owns each group
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS bot_instances (
+                instance_id TEXT PRIMARY KEY,
+                hostname TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                groups TEXT NOT NULL, -- comma-separated groups the instance is configured for
+                started_at REAL NOT NULL,
+                heartbeat_at REAL NOT NULL
+            );
+        """)
+        logger.info("Created table: bot_instances")
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS group_leases (
+                group_name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                lease_expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL
+            );
+        """)
+        logger.info("Created table: group_leases")
+        
+        # Latest metrics snapshot of each process, served by the admin app at /metrics
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                instance_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL, -- 'counter', 'gauge' or 'histogram'
+                labels TEXT NOT NULL, -- JSON object
+                value REAL, -- counters and gauges
+                histogram TEXT, -- JSON bucket counts, sum and count
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (instance_id, name, labels)
+            );
+        """)
+        logger.info("Created table: metrics")
+        
         await db.commit()
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+# load_test_workers.py
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from config import Config
+from initialize_db import initialize_db
+from stub_servers import StubPerplexityServer
+from whatsapp_automation import WhatsAppBot
+from work_queue import AWAITING_RESPONSE
+
+class FakeInputBox:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def send_keys(self, text):
+        self.driver.sent.append(text)
+
+class FakeDriver:
+    """
+    Minimal stand-in for webdriver.Chrome that accepts outgoing messages.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def find_element(self, by, value):
+        return FakeInputBox(self)
+
+async def run_responders(db_path: str, base_url: str, workers: int, requests: int) -> float:
+    """
+    Pushes `requests` product needs through `workers` responder workers and
+    returns the throughput in responses per second.
+    """
+    bot = WhatsAppBot("loadtest", driver=FakeDriver())
+    bot.database_client.db_path = db_path
+    bot.perplexity_client.base_url = base_url
+    bot.outbound.interval = bot.outbound.min_interval = 0
+    bot.outbound.max_per_minute = 0
+    await bot.database_client.open()
+    await bot.perplexity_client.open()
+    bot.driver_actor.start()
+    bot.outbound.start()
+    try:
+        await bot.work_queue.enqueue([
+            (i, f"member{i}", f"need a gift idea number {i}", 0) for i in range(requests)
+        ], state=AWAITING_RESPONSE)
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(bot.give_product_need_response_to_user()) for _ in range(workers)]
+        await bot.work_queue.wait_until_idle()
+        elapsed = time.perf_counter() - start
+        await bot.shutdown([], tasks)
+        return requests / elapsed
+    finally:
+        await bot.outbound.stop()
+        await bot.driver_actor.stop()
+        await bot.perplexity_client.close()
+        await bot.database_client.close()
+
+async def load_test(worker_counts, requests: int, latency: float, requests_per_minute: float):
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "load-test-key"
+    Config.COALESCE_RECOMMENDATIONS = False
+    Config.PERPLEXITY_REQUESTS_PER_MINUTE = requests_per_minute
+    limit = requests_per_minute / 60
+    print(f"Perplexity stub latency {latency * 1000:.0f} ms, rate limit {limit:.1f} req/s, {requests} requests per run")
+    async with StubPerplexityServer(latency=latency) as server:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, "loadtest.db")
+                await initialize_db(db_path)
+                throughput = await run_responders(db_path, server.base_url, workers, requests)
+            # The bucket starts full, so short runs can exceed the limit by one burst
+            ideal = min(workers / latency, limit * requests / max(requests - limit, 1))
+            print(f"{workers:>3} workers: {throughput:6.2f} responses/sec (ideal {ideal:6.2f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure responder throughput as the worker count grows.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.25, help="Stub Perplexity latency in seconds")
+    parser.add_argument("--rpm", type=float, default=900, help="Perplexity requests per minute quota")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(load_test(args.workers, args.requests, args.latency, args.rpm))
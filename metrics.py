@@ -0,0 +1,309 @@
+# metrics.py
+
+import asyncio
+import bisect
+import json
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Upper bounds in seconds, covering fast SQLite statements up to slow API calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Kind and help text of every metric the bot records, used when rendering
+METRICS = {
+    "pipeline_stage_seconds": (HISTOGRAM, "Time spent handling one unit of work, by pipeline stage."),
+    "pipeline_errors_total": (COUNTER, "Errors caught in the pipeline loops, by stage."),
+    "messages_scraped_total": (COUNTER, "Messages read from the chats, including ones seen before."),
+    "messages_queued_total": (COUNTER, "New messages queued for classification, by group."),
+    "messages_classified_total": (COUNTER, "Classified messages, by result and by what decided it."),
+    "responses_sent_total": (COUNTER, "Responses handed to the outbound scheduler, by outcome."),
+    "work_queue_depth": (GAUGE, "Work items per state in the durable work queue."),
+    "outbound_queue_depth": (GAUGE, "Messages waiting in the outbound scheduler."),
+    "outbound_interval_seconds": (GAUGE, "Current gap between outgoing messages."),
+    "outbound_messages_total": (COUNTER, "Outgoing messages by outcome."),
+    "db_operation_seconds": (HISTOGRAM, "DatabaseClient operation latency, by operation."),
+    "db_errors_total": (COUNTER, "DatabaseClient operations that raised, by operation."),
+    "api_request_seconds": (HISTOGRAM, "Latency of requests to external APIs, by API."),
+    "api_requests_total": (COUNTER, "Requests sent to external APIs, by API."),
+    "api_errors_total": (COUNTER, "Failed requests to external APIs, by API and error."),
+    "api_first_token_seconds": (HISTOGRAM, "Time to the first streamed token of an API response, by API."),
+    "api_early_stops_total": (COUNTER, "Streamed API responses closed once they had the required structure."),
+    "api_retries_total": (COUNTER, "Retries of failed API requests, by API."),
+    "api_hedges_total": (COUNTER, "Hedged API requests, by API and which request answered first."),
+    "circuit_breaker_state": (GAUGE, "Circuit breaker state by API: 0 closed, 1 half open, 2 open."),
+    "circuit_breaker_rejections_total": (COUNTER, "Calls failed fast by an open circuit breaker, by API."),
+    "work_deferred_total": (COUNTER, "Work items put back in the queue while an API was unavailable, by stage."),
+    "api_throttled_seconds_total": (COUNTER, "Time spent waiting on the API rate limiters."),
+    "cache_lookups_total": (COUNTER, "Cache lookups by cache and result."),
+    "cache_hit_ratio": (GAUGE, "Fraction of lookups answered from the cache, by cache."),
+    "driver_commands_total": (COUNTER, "WebDriver commands run on the driver thread, by command."),
+    "driver_command_errors_total": (COUNTER, "WebDriver commands that raised, by command."),
+    "driver_command_seconds_total": (COUNTER, "Total time spent running WebDriver commands, by command."),
+    "metrics_updated_timestamp_seconds": (GAUGE, "When the instance last wrote its metrics."),
+}
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        In-process store of counters, gauges and latency histograms. Meant to
+        be used from the event loop thread; recording is a dict update, so it
+        is cheap enough for every database call.
+
+        Args:
+            buckets: Histogram upper bounds in seconds.
+        """
+        self.buckets = buckets
+        self._values = {}      # (name, label key) -> float
+        self._histograms = {}  # (name, label key) -> Histogram
+        self._kinds = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _label_key(labels))
+        self._kinds[name] = COUNTER
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name: str, value: float, kind: str = GAUGE, **labels):
+        """
+        Sets a gauge, or mirrors a counter kept by another component (kind=COUNTER).
+        """
+        self._kinds[name] = kind
+        self._values[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+            self._kinds[name] = HISTOGRAM
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, errors: str = None, **labels):
+        """
+        Observes the duration of the block in histogram `name`, and counts it
+        in counter `errors` if the block raises.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors is not None:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def value(self, name: str, **labels):
+        """
+        Returns a counter or gauge value, or a histogram's observation count.
+        """
+        key = (name, _label_key(labels))
+        if key in self._histograms:
+            return self._histograms[key].count
+        return self._values.get(key, 0)
+
+    def snapshot(self) -> list:
+        """
+        Returns every series as a dict with name, kind, labels and either a
+        value or, for histograms, the bucket counts, sum and count.
+        """
+        series = [
+            {"name": name, "kind": self._kinds[name], "labels": dict(labels), "value": value}
+            for (name, labels), value in self._values.items()
+        ]
+        series.extend(
+            {"name": name, "kind": HISTOGRAM, "labels": dict(labels), "histogram": histogram.snapshot()}
+            for (name, labels), histogram in self._histograms.items()
+        )
+        return series
+
+    def clear(self):
+        self._values.clear()
+        self._histograms.clear()
+        self._kinds.clear()
+
+
+# Shared by everything running in this process
+registry = MetricsRegistry()
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+def render_prometheus(series) -> str:
+    """
+    Renders series in the Prometheus text exposition format (version 0.0.4).
+
+    Args:
+        series: Dicts as returned by MetricsRegistry.snapshot(), optionally with extra labels.
+
+    Returns:
+        str: The exposition text.
+    """
+    by_name = {}
+    for entry in series:
+        by_name.setdefault(entry["name"], []).append(entry)
+    lines = []
+    for name in sorted(by_name):
+        entries = by_name[name]
+        kind, help_text = METRICS.get(name, (entries[0]["kind"], ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for entry in sorted(entries, key=lambda entry: sorted(entry["labels"].items())):
+            labels = entry["labels"]
+            if entry["kind"] != HISTOGRAM:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(entry['value'])}")
+                continue
+            histogram = entry["histogram"]
+            cumulative = 0
+            for bound, count in zip(list(histogram["buckets"]) + [math.inf], histogram["counts"]):
+                cumulative += count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+async def fetch_metrics(db_client, max_age: float) -> list:
+    """
+    Reads the series written by every instance whose metrics are at most
+    `max_age` seconds old, labelled with the instance in `bot_instance`.
+
+    Returns:
+        list: Series in the MetricsRegistry.snapshot() format.
+    """
+    async with db_client.connection() as db:
+        cursor = await db.execute("""
+            SELECT instance_id, name, kind, labels, value, histogram
+            FROM metrics WHERE updated_at >= ?;
+        """, (time.time() - max_age,))
+        rows = await cursor.fetchall()
+    series = []
+    for instance_id, name, kind, labels, value, histogram in rows:
+        entry = {"name": name, "kind": kind, "labels": dict(json.loads(labels), bot_instance=instance_id)}
+        if histogram is not None:
+            entry["histogram"] = json.loads(histogram)
+        else:
+            entry["value"] = value
+        series.append(entry)
+    return series
+
+
+class MetricsSink:
+    def __init__(self, db_client, instance_id: str, interval: float = 15.0, collectors=None,
+        registry: MetricsRegistry = registry):
+        """
+        Periodically writes a process's metrics to the 'metrics' table, where
+        the admin app reads them for its /metrics route. Each write replaces
+        the instance's previous snapshot, so the table holds cumulative
+        values and stays small.
+
+        Args:
+            db_client (DatabaseClient): Database shared with the admin app.
+            instance_id (str): Name the series are labelled with.
+            interval (float): Seconds between writes.
+            collectors: Callables, sync or async, run before each write to update gauges
+                and mirror counters kept by other components.
+            registry (MetricsRegistry): Registry to write. Defaults to the process registry.
+        """
+        self.db_client = db_client
+        self.instance_id = instance_id
+        self.interval = interval
+        self.collectors = list(collectors or [])
+        self.registry = registry
+        self._task = None
+        self.flushes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the periodic writes after writing one last snapshot.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def collect(self):
+        for collector in self.collectors:
+            try:
+                result = collector()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {e}")
+
+    async def flush(self):
+        """
+        Runs the collectors and replaces this instance's rows in one transaction.
+        """
+        await self.collect()
+        now = time.time()
+        self.registry.set("metrics_updated_timestamp_seconds", now)
+        rows = [
+            (self.instance_id, entry["name"], entry["kind"], json.dumps(entry["labels"], sort_keys=True),
+             entry.get("value"), json.dumps(entry["histogram"]) if "histogram" in entry else None, now)
+            for entry in self.registry.snapshot()
+        ]
+        try:
+            async with self.db_client.transaction() as db:
+                await db.execute("DELETE FROM metrics WHERE instance_id = ?;", (self.instance_id,))
+                await db.executemany("""
+                    INSERT INTO metrics (instance_id, name, kind, labels, value, histogram, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?);
+                """, rows)
+            self.flushes += 1
+        except Exception as e:
+            logger.error(f"Error writing metrics: {e}")
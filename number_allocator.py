@@ -0,0 +1,52 @@
+# number_allocator.py
+
+import asyncio
+import logging
+from database_client import DatabaseClient
+
+logger = logging.getLogger(__name__)
+
+class UniqueNumberAllocator:
+    def __init__(self, db_client: DatabaseClient, block_size: int = 1000):
+        """
+        Hands out unique numbers from blocks reserved in
+        'message_unique_number_seq', so the database is only touched once per
+        block. Numbers left in a block when the process exits are never
+        reused, which leaves gaps but no duplicates.
+
+        Args:
+            db_client (DatabaseClient): Database holding the sequence.
+            block_size (int): How many numbers to reserve at a time.
+        """
+        self.db_client = db_client
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return self._end - self._next
+
+    async def allocate(self) -> int:
+        """
+        Returns the next unique number, reserving a new block if needed.
+        """
+        return (await self.allocate_many(1))[0]
+
+    async def allocate_many(self, count: int) -> list:
+        """
+        Returns `count` unique numbers in increasing order.
+        """
+        async with self._lock:
+            numbers = []
+            while len(numbers) < count:
+                if self._next == self._end:
+                    # Reserve at least what is still needed in one round trip
+                    size = max(self.block_size, count - len(numbers))
+                    self._next = await self.db_client.reserve_unique_numbers(size)
+                    self._end = self._next + size
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+            return numbers
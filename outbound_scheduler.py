@@ -0,0 +1,225 @@
+# outbound_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Higher priorities are sent first
+PRIORITY_ACKNOWLEDGEMENT = 1  # the member who asked is waiting for a reply
+PRIORITY_RECOMMENDATION = 0
+
+MESSAGE_SEPARATOR = "\n\n"
+
+class MessageNotSent(Exception):
+    """
+    Raised by a send callable that failed before anything was typed, so the
+    message certainly did not go out and can be tried again.
+    """
+
+class OutboundMessage:
+    def __init__(self, text: str, group: str, priority: int, future: asyncio.Future):
+        self.text = text
+        self.group = group
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    def __init__(self, send, initial_interval: float = 2.0, min_interval: float = 1.0, max_interval: float = 30.0,
+        max_per_minute: int = 20, coalesce: bool = True, max_message_chars: int = 3000, max_attempts: int = 3,
+        slow_send_seconds: float = 5.0):
+        """
+        Paces outgoing chat messages. Messages wait in a priority queue; when
+        one is due, other queued messages for the same group can be merged
+        into it. The gap between sends adapts: it shrinks while sends succeed
+        quickly and doubles after a failed or slow send, within
+        [min_interval, max_interval], and never more than max_per_minute
+        messages go out in any 60 seconds.
+
+        Args:
+            send: Async callable taking (text, group) that delivers one message and raises on failure,
+                MessageNotSent if it failed before anything was typed.
+            initial_interval (float): Seconds between sends at start.
+            min_interval (float): Shortest gap between sends.
+            max_interval (float): Longest gap between sends.
+            max_per_minute (int): Hard cap on messages sent per minute, 0 for none.
+            coalesce (bool): Merge queued messages for the same group into one.
+            max_message_chars (int): Longest merged message.
+            max_attempts (int): Attempts per message before its future fails. Only MessageNotSent
+                failures are retried; any other failure may have sent the text, so it is not repeated.
+            slow_send_seconds (float): A send taking longer than this backs the rate off.
+        """
+        self.send = send
+        self.interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_per_minute = max_per_minute
+        self.coalesce = coalesce
+        self.max_message_chars = max_message_chars
+        self.max_attempts = max_attempts
+        self.slow_send_seconds = slow_send_seconds
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._ready = asyncio.Event()
+        self._task = None
+        self._last_send = None
+        self._recent_sends = deque()
+
+        self.sent = 0
+        self.delivered = 0
+        self.merged = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=1000)
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def qsize(self) -> int:
+        return len(self._queue)
+
+    async def submit(self, text: str, group: str = None, priority: int = PRIORITY_RECOMMENDATION):
+        """
+        Queues a message and waits until it has been delivered, possibly as
+        part of a merged message. If the scheduler is not running the message
+        is sent right away.
+
+        Raises:
+            Exception: Whatever the last failed send raised.
+        """
+        if not self.is_running:
+            await self.send(text, group)
+            return
+        future = asyncio.get_running_loop().create_future()
+        message = OutboundMessage(text, group, priority, future)
+        heapq.heappush(self._queue, (-priority, next(self._sequence), message))
+        self._ready.set()
+        await future
+
+    async def run(self):
+        """
+        Sends queued messages until cancelled.
+        """
+        while True:
+            while not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+            await self._wait_for_slot()
+            batch = self._take_batch()
+            await self._deliver(batch, attempt=1)
+
+    async def _wait_for_slot(self):
+        now = time.monotonic()
+        delay = 0.0
+        if self._last_send is not None:
+            delay = self._last_send + self.interval - now
+        if self.max_per_minute:
+            while self._recent_sends and now - self._recent_sends[0] > 60:
+                self._recent_sends.popleft()
+            if len(self._recent_sends) >= self.max_per_minute:
+                delay = max(delay, self._recent_sends[0] + 60 - now)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _take_batch(self) -> list:
+        _, _, first = heapq.heappop(self._queue)
+        batch = [first]
+        if not self.coalesce:
+            return batch
+        texts = {first.text}
+        length = len(first.text)
+        keep = []
+        # Highest priority first, so the most urgent same-group messages join the batch
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            message = entry[2]
+            if message.group != first.group:
+                keep.append(entry)
+            elif message.text in texts:
+                batch.append(message)  # Identical texts go out once
+            elif length + len(MESSAGE_SEPARATOR) + len(message.text) <= self.max_message_chars:
+                batch.append(message)
+                texts.add(message.text)
+                length += len(MESSAGE_SEPARATOR) + len(message.text)
+            else:
+                keep.append(entry)
+        for entry in keep:
+            heapq.heappush(self._queue, entry)
+        return batch
+
+    async def _deliver(self, batch: list, attempt: int):
+        # Cancelled callers are no longer waiting, but their text still goes out
+        text = MESSAGE_SEPARATOR.join(dict.fromkeys(message.text for message in batch))
+        started = time.monotonic()
+        try:
+            await self.send(text, batch[0].group)
+        except Exception as e:
+            self.failures += 1
+            self._back_off()
+            self._last_send = time.monotonic()
+            logger.warning(f"Send attempt {attempt} of {len(batch)} message(s) failed ({e!r}), "
+                           f"next send in {self.interval:.1f}s")
+            if isinstance(e, MessageNotSent) and attempt < self.max_attempts:
+                await self._wait_for_slot()
+                return await self._deliver(batch, attempt + 1)
+            for message in batch:
+                if not message.future.done():
+                    message.future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        self._last_send = finished
+        self._recent_sends.append(finished)
+        self.sent += 1
+        self.delivered += len(batch)
+        self.merged += len(batch) - 1
+        if finished - started > self.slow_send_seconds:
+            self._back_off()
+        else:
+            self.interval = max(self.min_interval, self.interval * 0.8)
+        for message in batch:
+            self.latencies.append(finished - message.enqueued_at)
+            if not message.future.done():
+                message.future.set_result(None)
+        logger.debug(f"Sent {len(batch)} message(s) in one, next send in {self.interval:.1f}s")
+
+    def _back_off(self):
+        self.interval = min(self.max_interval, max(self.interval, self.min_interval, 0.5) * 2)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "delivered": self.delivered,
+            "merged": self.merged,
+            "failures": self.failures,
+            "interval": round(self.interval, 2),
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+        }
@@ -1,20 +1,211 @@
 # perplexity_client.py
 
 import logging
+import json
+import re
+import time
 import aiohttp
+from urllib.parse import urlsplit
+from contextlib import asynccontextmanager
 from config import Config
 import asyncio
 from database_client import DatabaseClient  # Import the DatabaseClient
+from request_coalescing import RequestCoalescer
+from rate_limiter import TokenBucket
+from metrics import registry
+from resilience import ResilientCaller, CircuitBreaker, UpstreamError, UpstreamUnavailable, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
+# The prompt asks for two positive and two negative reviews followed by the
+# product link; these cues are how the reviews are usually phrased
+URL_PATTERN = re.compile(r"https?://\S+")
+POSITIVE_REVIEW_CUES = re.compile(r"suggested|told me|said|noticed|loved|mentioned|praised|happy with", re.IGNORECASE)
+NEGATIVE_REVIEW_CUES = re.compile(r"heads up|some people|complain|downside|drawback|however|\bbut\b|caution|issue",
+                                  re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Only a link to a store is the product link; sources such as Reddit threads may be linked earlier
+STORE_HOST = re.compile(r"(^|\.)(amazon|amzn|flipkart|fkrt|myntra|nykaa|ajio|croma|tatacliq|meesho|snapdeal)\.",
+                        re.IGNORECASE)
+URL_TRAILING_PUNCTUATION = ".,;:!?)]}'\""
+# Added in front of every recommendation. The model never sees the contact, so
+# one recommendation can be shared by near-duplicate requests from different people
+GREETING = "Hey, I saw your need {contact}, here is the solution to your need: "
+
+def count_review_sentences(text: str) -> tuple:
+    """
+    Returns how many sentences of `text` read as positive and as negative
+    reviews. A sentence counts once per kind, however many cues it has.
+    """
+    sentences = SENTENCE_END.split(text)
+    positive = sum(1 for sentence in sentences if POSITIVE_REVIEW_CUES.search(sentence))
+    negative = sum(1 for sentence in sentences if NEGATIVE_REVIEW_CUES.search(sentence))
+    return positive, negative
+
+def complete_recommendation(text: str):
+    """
+    Checks a partial recommendation for the structure the prompt asks for:
+    a link to a store preceded by at least two positive and two negative
+    review sentences.
+
+    Returns:
+        str or None: The text up to the end of that link, or None while incomplete.
+    """
+    for match in URL_PATTERN.finditer(text):
+        if match.end() == len(text):
+            return None  # The link itself may still be streaming
+        url = match.group().rstrip(URL_TRAILING_PUNCTUATION)
+        if not STORE_HOST.search(urlsplit(url).hostname or ""):
+            continue
+        positive, negative = count_review_sentences(text[:match.start()])
+        if positive >= 2 and negative >= 2:
+            return text[:match.start() + len(url)]
+    return None
+
+
+class DraftWriter:
+    def __init__(self, db_client: DatabaseClient, unique_number: int, contact: str, query: str,
+        group_name: str = None, interval: float = 1.0):
+        """
+        Persists a streaming recommendation to 'final_response_table' as a
+        'drafting' row, at most once per `interval` seconds, so the admin
+        page can show it while it is written.
+        """
+        self.db_client = db_client
+        self.unique_number = unique_number
+        self.contact = contact
+        self.query = query
+        self.group_name = group_name
+        self.interval = interval
+        self.saved = False
+        self._last_write = None
+
+    async def update(self, draft: str):
+        now = time.monotonic()
+        if self._last_write is not None and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        try:
+            if self.saved:
+                await self.db_client.update_draft_response(self.unique_number, draft)
+            else:
+                await self.db_client.save_draft_response(self.unique_number, self.contact, self.query, draft,
+                                                         self.group_name)
+                self.saved = True
+        except Exception as e:
+            logger.error(f"Error saving draft response for unique number {self.unique_number}: {e}")
+
+    async def finish(self, recommendation: str):
+        """
+        Stores the finished recommendation, turning the draft into a pending response.
+        """
+        if not (self.saved and await self.db_client.finish_draft_response(self.unique_number, recommendation)):
+            await self.db_client.insert_final_response(self.unique_number, self.contact, self.query, recommendation,
+                                                       self.group_name)
+
+    async def discard(self):
+        if self.saved:
+            await self.db_client.delete_draft_response(self.unique_number)
+
+
 class PerplexityClient:
-    def __init__(self, db_client: DatabaseClient):
+    def __init__(self, db_client: DatabaseClient, coalescer: RequestCoalescer = None, base_url: str = None,
+        connection_limit: int = None, keepalive_timeout: float = None, dns_cache_ttl: int = None,
+        rate_limiter: TokenBucket = None, streaming: bool = None, draft_interval: float = None,
+        early_stop: bool = None, timeout: float = None, resilience: ResilientCaller = None):
         self.api_key = Config.PERPLEXITY_API_KEY
-        self.base_url = "https://api.perplexity.ai"  # Replace with the actual Perplexity API base URL
+        self.base_url = base_url or Config.PERPLEXITY_BASE_URL or "https://api.perplexity.ai"
         self.db_client = db_client  # Store the DatabaseClient instance
+        self.coalescer = coalescer  # Optional: share recommendations between near-duplicate queries
+        self.rate_limiter = rate_limiter  # Optional: matches the Perplexity request quota
+
+        # Streaming: drafts are saved every draft_interval seconds, and generation
+        # stops once the recommendation has its required structure
+        self.streaming = Config.PERPLEXITY_STREAMING if streaming is None else streaming
+        self.draft_interval = Config.PERPLEXITY_DRAFT_INTERVAL_SECONDS if draft_interval is None else draft_interval
+        self.early_stop = Config.PERPLEXITY_EARLY_STOP if early_stop is None else early_stop
+        self.early_stops = 0
 
-    async def get_response_async(self, query: str, contact: str, unique_number: int) -> str:
+        # Per-request timeout, and the deadline, retry, hedging and circuit breaker policy around it
+        self.timeout = Config.PERPLEXITY_TIMEOUT_SECONDS if timeout is None else timeout
+        self.resilience = resilience or ResilientCaller(
+            "perplexity",
+            deadline=Config.PERPLEXITY_DEADLINE_SECONDS,
+            max_retries=Config.LLM_MAX_RETRIES,
+            backoff_base=Config.LLM_BACKOFF_BASE_SECONDS,
+            backoff_max=Config.LLM_BACKOFF_MAX_SECONDS,
+            hedge_after=Config.PERPLEXITY_HEDGE_AFTER_SECONDS,
+            breaker=CircuitBreaker("perplexity", Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_SECONDS)
+        )
+
+        # Connector tuning for the long-lived session opened by open()
+        self.connection_limit = connection_limit or Config.PERPLEXITY_CONNECTION_LIMIT
+        self.keepalive_timeout = keepalive_timeout or Config.PERPLEXITY_KEEPALIVE_SECONDS
+        self.dns_cache_ttl = dns_cache_ttl or Config.PERPLEXITY_DNS_CACHE_TTL_SECONDS
+        self.session = None
+        self.requests_sent = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    async def open(self):
+        """
+        Opens the shared HTTP session. Until this is called every request uses
+        its own short-lived session.
+        """
+        if self.session is not None:
+            return
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        logger.info(f"Opened Perplexity session (limit {self.connection_limit}, keep-alive {self.keepalive_timeout}s)")
+
+    async def close(self):
+        if self.session is None:
+            return
+        await self.session.close()
+        self.session = None
+        logger.info(f"Closed Perplexity session: {self.connection_stats()}")
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _on_connection_created(self, session, context, params):
+        self.connections_created += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+    def connection_stats(self) -> dict:
+        """
+        Returns request and connection counters for the shared session.
+        """
+        opened = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests_sent,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": self.connections_reused / opened if opened else 0.0,
+        }
+
+    @asynccontextmanager
+    async def _session(self):
+        if self.session is not None:
+            yield self.session
+            return
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+    async def get_response_async(self, query: str, contact: str, unique_number: int, group_name: str = None) -> str:
         """
         Asynchronously fetches product information including Indian product links and
         Reddit reviews using the Perplexity API based on the user's query and stores the response for
@@ -24,9 +215,60 @@ class PerplexityClient:
             query (str): The query string provided by the user (e.g., "vitamin c serum").
             contact (str): The contact details extracted from the message metadata.
             unique_number (int): The unique identifier for the message.
+            group_name (str): The group the query came from, so the final response goes back there.
         
         Returns:
             str: Acknowledgment message or status.
+
+        Raises:
+            UpstreamUnavailable: Perplexity is down or kept failing; the query can be answered later.
+        """
+        drafts = None
+        greeting = GREETING.format(contact=contact)
+        if self.streaming:
+            drafts = DraftWriter(self.db_client, unique_number, contact, query, group_name, self.draft_interval)
+            on_draft = lambda text: drafts.update(greeting + text)
+            fetch = lambda: self.stream_recommendation(query, contact, on_draft=on_draft)
+        else:
+            fetch = lambda: self.fetch_recommendation(query, contact)
+        try:
+            if self.coalescer is not None:
+                # Only the body is shared; each caller is greeted by name
+                _, body = await self.coalescer.run(query, fetch)
+            else:
+                _, body = await fetch()
+            recommendation = greeting + body
+
+            # Insert recommendation into final_response_table with unique_number
+            if drafts is not None:
+                await drafts.finish(recommendation)
+            else:
+                await self.db_client.insert_final_response(unique_number, contact, query, recommendation, group_name)
+
+            return "Response generated and awaiting affiliate link."
+        except UpstreamUnavailable:
+            await self._discard_draft(drafts, unique_number)
+            raise
+        except Exception as e:
+            logger.error(f"Exception during Perplexity API call: {e}")
+            await self._discard_draft(drafts, unique_number)
+            return "Sorry, I couldn't retrieve the product information at this time."
+
+    async def _discard_draft(self, drafts, unique_number: int):
+        if drafts is None:
+            return
+        try:
+            await drafts.discard()
+        except Exception as e:
+            logger.error(f"Error discarding draft response for unique number {unique_number}: {e}")
+
+    def _request(self, query: str, stream: bool = False) -> tuple:
+        """
+        Builds the chat completion payload and headers for a recommendation.
+        The contact is left out of the prompt; GREETING addresses them.
+
+        Returns:
+            tuple: (payload, headers).
         """
         model = "llama-3.1-sonar-small-128k-online"
         messages = [
@@ -64,9 +306,8 @@ class PerplexityClient:
                 "content": (
                     f"This is a user's need: {query}.\n\n"
                     f"Please provide a WhatsApp message as per the instructions above, including an Indian product link from Amazon India, Myntra, Flipkart, or Nykaa, and incorporating exactly two positive and two negative Reddit reviews.\n\n"
-                    f"Use this format:\n\n"
-                    f"Hey, I saw your need {contact}, here is the solution to your need: <response>\n\n"
-                    f"where {contact} is the contact number and <response> is the message to the user."
+                    f"Reply with the message only and don't address the user by name or number; "
+                    f"a line greeting them is added before your message."
                 ),
             },
         ]
@@ -78,31 +319,132 @@ class PerplexityClient:
             "temperature": 0.7,  # Adjust temperature as needed
             "top_p": 1,
             "n": 1,
-            "stream": False
+            "stream": stream
         }
 
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        return payload, headers
 
-        async with aiohttp.ClientSession() as session:
+    async def fetch_recommendation(self, query: str, contact: str) -> tuple:
+        """
+        Requests a recommendation for the query from the Perplexity API.
+
+        Args:
+            query (str): The query string provided by the user.
+            contact (str): The contact the message is addressed to.
+
+        Returns:
+            tuple: (contact, recommendation text), without GREETING.
+
+        Raises:
+            UpstreamUnavailable: If retryable errors persist or the circuit is open.
+            Exception: If the API call fails or returns a non-retryable status.
+        """
+        payload, headers = self._request(query)
+        return await self.resilience.call(self._fetch_once, payload, headers, contact)
+
+    async def _fetch_once(self, payload: dict, headers: dict, contact: str) -> tuple:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._session() as session:
+            self.requests_sent += 1
+            registry.inc("api_requests_total", api="perplexity")
+            error = None
             try:
-                async with session.post(f"{self.base_url}/chat/completions", json=payload, headers=headers) as resp:
-                    if resp.status == 200:
+                with registry.timer("api_request_seconds", api="perplexity"):
+                    async with session.post(f"{self.base_url}/chat/completions", json=payload, headers=headers,
+                                            timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                        if resp.status != 200:
+                            error = resp.status
+                            raise UpstreamError(f"Perplexity API error: {resp.status} - {resp.reason}",
+                                                status=resp.status,
+                                                retry_after=parse_retry_after(resp.headers.get("Retry-After")))
                         data = await resp.json()
-                        recommendation = data['choices'][0]['message']['content'].strip()
-                        logger.info(f"Perplexity Recommendation: {recommendation}")
-                        
-                        # Insert recommendation into final_response_table with unique_number
-                        await self.db_client.insert_final_response(unique_number, contact, query, recommendation)
-                        
-                        return "Response generated and awaiting affiliate link."
-                    else:
-                        logger.error(f"Perplexity API error: {resp.status} - {resp.reason}")
-                        return "Sorry, I couldn't retrieve the product information at this time."
-            
             except Exception as e:
-                logger.error(f"Exception during Perplexity API call: {e}")
-                return "Sorry, I couldn't retrieve the product information at this time."
+                registry.inc("api_errors_total", api="perplexity", error=error or type(e).__name__)
+                raise
+            recommendation = data['choices'][0]['message']['content'].strip()
+            logger.info(f"Perplexity Recommendation: {recommendation}")
+            return contact, recommendation
+
+    async def stream_recommendation(self, query: str, contact: str, on_draft=None) -> tuple:
+        """
+        Requests a recommendation as a stream of server-sent events. The text
+        received so far is passed to `on_draft` after every chunk, and the
+        stream is closed as soon as the recommendation has its required
+        structure (see complete_recommendation()), which ends generation early.
+        Time to first token is recorded in api_first_token_seconds.
+
+        Args:
+            query (str): The query string provided by the user.
+            contact (str): The contact the message is addressed to.
+            on_draft: Optional coroutine function called with the partial text.
+
+        Returns:
+            tuple: (contact, recommendation text), without GREETING.
 
+        Raises:
+            UpstreamUnavailable: If retryable errors persist or the circuit is open.
+            Exception: If the API call fails, returns a non-retryable status or streams no text.
+        """
+        payload, headers = self._request(query, stream=True)
+        # Two concurrent streams would overwrite each other's drafts, so streams are never hedged
+        return await self.resilience.call(self._stream_once, payload, headers, contact, on_draft, hedge=False)
+
+    async def _stream_once(self, payload: dict, headers: dict, contact: str, on_draft) -> tuple:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._session() as session:
+            self.requests_sent += 1
+            registry.inc("api_requests_total", api="perplexity")
+            error = None
+            text = ""
+            recommendation = None
+            started = time.perf_counter()
+            first_token_at = None
+            try:
+                with registry.timer("api_request_seconds", api="perplexity"):
+                    async with session.post(f"{self.base_url}/chat/completions", json=payload, headers=headers,
+                                            timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                        if resp.status != 200:
+                            error = resp.status
+                            raise UpstreamError(f"Perplexity API error: {resp.status} - {resp.reason}",
+                                                status=resp.status,
+                                                retry_after=parse_retry_after(resp.headers.get("Retry-After")))
+                        async for line in resp.content:
+                            line = line.decode("utf-8").strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                            if not delta:
+                                continue
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter() - started
+                                registry.observe("api_first_token_seconds", first_token_at, api="perplexity")
+                            text += delta
+                            if self.early_stop:
+                                recommendation = complete_recommendation(text)
+                                if recommendation is not None:
+                                    break  # Leaving the block closes the connection and stops generation
+                            if on_draft is not None:
+                                await on_draft(text)
+            except Exception as e:
+                registry.inc("api_errors_total", api="perplexity", error=error or type(e).__name__)
+                raise
+            elapsed = time.perf_counter() - started
+            stopped_early = recommendation is not None
+            if stopped_early:
+                self.early_stops += 1
+                registry.inc("api_early_stops_total", api="perplexity")
+            recommendation = (recommendation or text).strip()
+            if not recommendation:
+                raise Exception("Perplexity API error: empty stream")
+            logger.info(f"Perplexity Recommendation (first token after {first_token_at:.2f}s, "
+                        f"{'stopped early' if stopped_early else 'finished'} after {elapsed:.2f}s): {recommendation}")
+            return contact, recommendation
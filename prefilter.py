@@ -0,0 +1,219 @@
+# prefilter.py
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import re
+import zlib
+from database_client import DatabaseClient
+from text_normalization import normalize_message_text
+
+logger = logging.getLogger(__name__)
+
+# Messages that are never product needs on their own
+CHATTER = {
+    "ok", "okay", "k", "kk", "lol", "lmao", "haha", "hahaha", "hehe", "yes", "no", "ya", "yeah", "yep",
+    "nope", "hmm", "hm", "nice", "cool", "great", "thanks", "thank you", "thx", "ty", "welcome",
+    "good morning", "good night", "gm", "gn", "hi", "hello", "hey", "bye", "done", "sure", "same",
+    "true", "right", "wow", "congrats", "congratulations", "sticker omitted", "image omitted",
+    "video omitted", "gif omitted", "audio omitted", "this message was deleted",
+}
+
+# Phrases that on their own make a message a likely product need
+INTENT_PATTERNS = [
+    re.compile(r"\b(suggest|recommend)\w*\b.*\b(good|best|some|any|a|an)\b"),
+    re.compile(r"\b(looking|searching) for\b.*\b(buy|purchase|product|brand|good|best)\b"),
+    re.compile(r"\bany (good )?(recommendations?|suggestions?)\b"),
+    re.compile(r"\b(which|what) (is the )?(best|good)\b.*\b(buy|under|below|for)\b"),
+    re.compile(r"\b(best|good)\b.*\b(under|below|within)\s*(rs\.?|₹|inr)?\s*\d+\s*k?\b"),
+]
+
+# Words that make a short message worth sending to Groq anyway
+NEED_KEYWORDS = re.compile(r"\b(need|want|buy|suggest|recommend|recommendations?|suggestions?|best|looking)\b")
+
+LETTER_PATTERN = re.compile(r"[^\W\d_]")
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+class LinearMessageModel:
+    def __init__(self, dimensions: int = 2 ** 16):
+        """
+        Logistic regression over hashed unigram and bigram features.
+
+        Args:
+            dimensions (int): Size of the hashed feature space.
+        """
+        self.dimensions = dimensions
+        self.weights = {}
+        self.bias = 0.0
+
+    def features(self, normalized_text: str) -> list:
+        tokens = TOKEN_PATTERN.findall(normalized_text)
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return sorted({zlib.crc32(gram.encode()) % self.dimensions for gram in grams})
+
+    def probability(self, normalized_text: str) -> float:
+        score = self.bias + sum(self.weights.get(f, 0.0) for f in self.features(normalized_text))
+        return 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+
+    def train(self, examples, epochs: int = 8, learning_rate: float = 0.2, l2: float = 1e-4, seed: int = 0):
+        """
+        Fits the model with stochastic gradient descent.
+
+        Args:
+            examples: (normalized_text, label) pairs.
+        """
+        examples = [(self.features(text), label) for text, label in examples]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(examples)
+            for features, label in examples:
+                score = self.bias + sum(self.weights.get(f, 0.0) for f in features)
+                error = 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0))) - (1.0 if label else 0.0)
+                self.bias -= learning_rate * error
+                for f in features:
+                    weight = self.weights.get(f, 0.0)
+                    self.weights[f] = weight - learning_rate * (error + l2 * weight)
+
+
+class MessagePrefilter:
+    def __init__(self, min_words: int = 2, allow_positive: bool = False, model: LinearMessageModel = None,
+        negative_threshold: float = 0.05, positive_threshold: float = 0.95):
+        """
+        Cheap local classifier that settles obvious cases before a message is
+        sent to Groq.
+
+        Args:
+            min_words (int): Messages shorter than this are negatives unless they contain a need keyword.
+            allow_positive (bool): Also short-circuit confident positives.
+            model (LinearMessageModel): Optional trained model consulted when no rule applies.
+            negative_threshold (float): Model probability below which a message is a confident negative.
+            positive_threshold (float): Model probability above which a message is a confident positive.
+        """
+        self.min_words = min_words
+        self.allow_positive = allow_positive
+        self.model = model
+        self.negative_threshold = negative_threshold
+        self.positive_threshold = positive_threshold
+
+        self.negatives = 0
+        self.positives = 0
+        self.deferred = 0
+
+    @property
+    def calls_saved(self) -> int:
+        return self.negatives + self.positives
+
+    def decide(self, message_text: str):
+        """
+        Classifies a message without touching any counters.
+
+        Returns:
+            bool or None: False for a confident negative, True for a confident
+            positive (only if allow_positive), None to defer to Groq.
+        """
+        text = normalize_message_text(message_text)
+        if not LETTER_PATTERN.search(text) or text.strip(" .!?") in CHATTER:
+            return False
+        if any(pattern.search(text) for pattern in INTENT_PATTERNS):
+            return True if self.allow_positive else None
+        if len(TOKEN_PATTERN.findall(text)) < self.min_words and not NEED_KEYWORDS.search(text):
+            return False
+        if self.model is not None:
+            probability = self.model.probability(text)
+            if probability < self.negative_threshold:
+                return False
+            if self.allow_positive and probability > self.positive_threshold:
+                return True
+        return None
+
+    def classify(self, message_text: str):
+        """
+        Same as decide(), and records whether a Groq call was saved.
+        """
+        decision = self.decide(message_text)
+        if decision is None:
+            self.deferred += 1
+        elif decision:
+            self.positives += 1
+        else:
+            self.negatives += 1
+        logger.debug(f"Prefilter decision {decision} for message: '{message_text}'")
+        return decision
+
+    async def train_from_logs(self, db_client: DatabaseClient, limit: int = 20000):
+        """
+        Trains the linear model on the Groq labels in groq_logs.
+        """
+        examples = await fetch_labeled_examples(db_client, limit)
+        if not examples:
+            logger.info("No Groq labels available, prefilter runs on rules only")
+            return
+        self.model = self.model or LinearMessageModel()
+        self.model.train([(normalize_message_text(text), label) for text, label in examples])
+        logger.info(f"Trained prefilter model on {len(examples)} Groq labels")
+
+    def evaluate(self, examples) -> dict:
+        """
+        Measures how often the prefilter agrees with Groq labels.
+
+        Args:
+            examples: (message_text, label) pairs.
+
+        Returns:
+            dict: Coverage (share of messages decided locally) and agreement
+            (share of those decisions that match Groq).
+        """
+        decided = agreed = 0
+        for text, label in examples:
+            decision = self.decide(text)
+            if decision is not None:
+                decided += 1
+                agreed += decision == label
+        total = len(examples)
+        return {
+            "messages": total,
+            "decided": decided,
+            "coverage": decided / total if total else 0.0,
+            "agreement": agreed / decided if decided else 1.0,
+        }
+
+
+async def fetch_labeled_examples(db_client: DatabaseClient, limit: int) -> list:
+    """
+    Returns (message_text, is_product_need) pairs from groq_logs, newest first.
+    """
+    async with db_client.connection() as db:
+        cursor = await db.execute("""
+            SELECT message_text, classification FROM groq_logs
+            ORDER BY id DESC LIMIT ?;
+        """, (limit,))
+        rows = await cursor.fetchall()
+    return [(text, classification == 'Yes') for text, classification in rows]
+
+
+async def evaluate_on_logs(db_path: str, allow_positive: bool, holdout: float):
+    db_client = DatabaseClient(db_path)
+    examples = await fetch_labeled_examples(db_client, limit=1000000)
+    random.Random(0).shuffle(examples)
+    split = int(len(examples) * (1 - holdout))
+    train, test = examples[:split], examples[split:]
+
+    rules_only = MessagePrefilter(allow_positive=allow_positive)
+    with_model = MessagePrefilter(allow_positive=allow_positive, model=LinearMessageModel())
+    with_model.model.train([(normalize_message_text(text), label) for text, label in train])
+
+    print(f"{len(train)} training and {len(test)} held-out Groq labels")
+    for name, prefilter in (("rules", rules_only), ("rules + model", with_model)):
+        result = prefilter.evaluate(test)
+        print(f"{name:>14}: decided {result['decided']}/{result['messages']} "
+              f"({result['coverage']:.1%} Groq calls saved), agreement {result['agreement']:.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure prefilter agreement with historical Groq labels.")
+    parser.add_argument("--db", default=DatabaseClient().db_path)
+    parser.add_argument("--allow-positive", action="store_true")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(evaluate_on_logs(args.db, args.allow_positive, args.holdout))
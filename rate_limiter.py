@@ -0,0 +1,57 @@
+# rate_limiter.py
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Token bucket rate limiter for asyncio callers. Waiters are served in
+        arrival order.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum burst size. Defaults to one second's worth of tokens (at least 1).
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: float = None):
+        """
+        Builds a bucket from a requests-per-minute quota, or returns None if
+        the quota is not positive (no limit).
+        """
+        if not requests_per_minute or requests_per_minute <= 0:
+            return None
+        return cls(requests_per_minute / 60.0, burst)
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """
+        Waits until `tokens` are available and takes them.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            self._refill(loop.time())
+            if self._tokens < tokens:
+                wait = (tokens - self._tokens) / self.rate
+                self.throttled += 1
+                self.throttled_seconds += wait
+                await asyncio.sleep(wait)
+                self._refill(loop.time())
+            self._tokens -= tokens
+            self.acquired += 1
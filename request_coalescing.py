@@ -0,0 +1,105 @@
+# request_coalescing.py
+
+import asyncio
+import hashlib
+import logging
+import re
+from text_normalization import normalize_message_text
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+def simhash(text: str, bits: int = 64) -> int:
+    """
+    Computes a SimHash signature over the words and word bigrams of the
+    normalized text. Near-duplicate texts get signatures that differ in only
+    a few bits.
+    """
+    tokens = TOKEN_PATTERN.findall(normalize_message_text(text))
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts = [0] * bits
+    for feature in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            counts[bit] += 1 if digest >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if counts[bit] > 0)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class RequestCoalescer:
+    def __init__(self, max_distance: int = 3, reuse_window: float = 300.0):
+        """
+        Lets near-duplicate requests share one in-flight or recently completed
+        result (singleflight keyed on SimHash similarity).
+
+        Args:
+            max_distance (int): Maximum SimHash Hamming distance for two texts to count as duplicates.
+            reuse_window (float): Seconds a completed result can be reused.
+        """
+        self.max_distance = max_distance
+        self.reuse_window = reuse_window
+        self._entries = []
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _find(self, signature: int, now: float):
+        self._entries = [
+            entry for entry in self._entries
+            if not entry[2].done() or now - entry[1] <= self.reuse_window
+        ]
+        for entry in self._entries:
+            if hamming_distance(entry[0], signature) <= self.max_distance:
+                return entry[2]
+        return None
+
+    async def run(self, text: str, fetch):
+        """
+        Returns the result of `fetch()` for `text`, or the shared result of a
+        near-duplicate request that is in flight or finished within the reuse
+        window. Failed requests are not shared with later callers. If the
+        request being shared is cancelled, its followers retry, one of them
+        becoming the new leader.
+
+        Args:
+            text (str): The request text used for similarity.
+            fetch: Coroutine function producing the result.
+        """
+        signature = simhash(text)
+        loop = asyncio.get_running_loop()
+        shared = self._find(signature, loop.time())
+        if shared is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced request '{text}' with a near-duplicate ({self.coalesced} so far)")
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise  # This caller was cancelled, not the leader
+            # The leader was cancelled; its cancellation is not ours, so start over
+            logger.info(f"Leader for '{text}' was cancelled, retrying the request")
+            return await self.run(text, fetch)
+
+        self.leaders += 1
+        future = loop.create_future()
+        entry = [signature, loop.time(), future]
+        self._entries.append(entry)
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            self._entries.remove(entry)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._entries.remove(entry)
+            future.set_exception(e)
+            # Followers see the failure; mark it retrieved so it isn't reported as unhandled
+            future.exception()
+            raise
+        # The reuse window starts when the result is available
+        entry[1] = loop.time()
+        future.set_result(result)
+        return result
@@ -0,0 +1,295 @@
+# resilience.py
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: rate limiting and server-side failures
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamError(Exception):
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        """
+        An HTTP error response from an upstream API.
+
+        Args:
+            message (str): Error description.
+            status (int): HTTP status code.
+            retry_after (float): Seconds the upstream asked us to wait, from Retry-After.
+        """
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(Exception):
+    """
+    The upstream kept failing with retryable errors until the retries or the
+    deadline ran out. The work can be tried again later.
+    """
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """
+    The call was rejected without being sent because the circuit breaker is open.
+    """
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """
+    The deadline passed before the upstream answered. The work can be tried
+    again later.
+    """
+
+
+def parse_retry_after(value) -> float:
+    """
+    Parses a Retry-After header, given in seconds or as an HTTP date.
+
+    Returns:
+        float or None: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def error_status(error: Exception):
+    """
+    Returns the HTTP status of an error from aiohttp, the Groq SDK or
+    UpstreamError, or None if it has none.
+    """
+    for attribute in ("status", "status_code"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+def error_retry_after(error: Exception):
+    """
+    Returns the Retry-After delay carried by an error, if any.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    return parse_retry_after(headers.get("retry-after")) if headers is not None else None
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True for rate limiting, 5xx responses, dropped connections and attempts
+    that timed out.
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, (ConnectionError, OSError)) or type(error).__name__ in (
+        "APIConnectionError", "ClientConnectionError", "ServerDisconnectedError", "ClientPayloadError")
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Stops calls to an upstream after `failure_threshold` consecutive
+        failures. After `reset_timeout` seconds one trial call is let
+        through: success closes the circuit, failure opens it again.
+
+        Args:
+            name (str): Upstream name, used in logs and metrics.
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def retry_in(self) -> float:
+        """
+        Seconds until the open circuit lets a trial call through.
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN and self.retry_in() == 0:
+            self._set_state(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.rejected += 1
+        registry.inc("circuit_breaker_rejections_total", api=self.name)
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_in_flight = False
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened += 1
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures; "
+                               f"failing fast for {self.reset_timeout}s")
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        registry.set("circuit_breaker_state", BREAKER_STATE_VALUES[state], api=self.name)
+
+
+class ResilientCaller:
+    def __init__(self, name: str, deadline: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5,
+        backoff_max: float = 10.0, hedge_after: float = None, breaker: CircuitBreaker = None, seed: int = None):
+        """
+        Wraps calls to an upstream API with an overall deadline, retries with
+        full-jitter exponential backoff on retryable errors (waiting as long
+        as Retry-After asks, if the deadline allows), optional hedging and a
+        circuit breaker.
+
+        Args:
+            name (str): Upstream name, used in logs and metrics.
+            deadline (float): Seconds a call may take, including retries and backoff.
+            max_retries (int): Retries after the first attempt.
+            backoff_base (float): Backoff cap for the first retry; doubles with each retry.
+            backoff_max (float): Largest backoff cap.
+            hedge_after (float): Seconds after which a second, identical request is sent if the
+                first has not answered; the first answer wins. None disables hedging.
+            breaker (CircuitBreaker): Optional circuit breaker for the upstream.
+            seed (int): Seed for the backoff jitter, for repeatable runs.
+        """
+        self.name = name
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after or None
+        self.breaker = breaker
+        self.random = random.Random(seed)
+
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def backoff(self, retry: int) -> float:
+        return self.random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    async def call(self, fn, *args, hedge: bool = True):
+        """
+        Calls `fn(*args)` under the deadline, retry, hedging and circuit
+        breaker policy. Pass hedge=False for calls that must not run twice
+        at once.
+
+        Raises:
+            CircuitOpenError: The circuit is open; nothing was sent.
+            UpstreamUnavailable: Retryable errors, including timed out attempts, persisted past
+                the retries or the deadline.
+            DeadlineExceeded: The deadline passed while an attempt was in flight.
+            Exception: A non-retryable error from `fn`, unchanged.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            if self.breaker is not None and not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit for {self.name} is open", retry_after=self.breaker.retry_in())
+            remaining = deadline - time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._attempt(fn, args, hedge), remaining)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline:
+                    self._record_failure()
+                    raise DeadlineExceeded(f"{self.name} call exceeded its {self.deadline}s deadline") from e
+                if not is_retryable(e):
+                    if self.breaker is not None:
+                        self.breaker.record_success()  # The upstream answered; the request was at fault
+                    raise
+                self._record_failure()
+                delay = error_retry_after(e)
+                if delay is None:
+                    delay = self.backoff(retry)
+                if retry >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise UpstreamUnavailable(f"{self.name} unavailable after {retry + 1} attempts: {e!r}",
+                                              retry_after=delay) from e
+                retry += 1
+                self.retries += 1
+                registry.inc("api_retries_total", api=self.name)
+                logger.warning(f"{self.name} call failed ({e!r}), retry {retry}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _record_failure(self):
+        if self.breaker is not None:
+            self.breaker.record_failure()
+
+    async def _attempt(self, fn, args, hedge: bool):
+        if self.hedge_after is None or not hedge:
+            return await fn(*args)
+        primary = asyncio.ensure_future(fn(*args))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self.hedges += 1
+        second = asyncio.ensure_future(fn(*args))
+        pending = {primary, second}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # A failed request only decides the call once the other one has failed too
+                for task in sorted(done, key=lambda task: task.exception() is not None):
+                    if task.exception() is None or not pending:
+                        winner = "hedge" if task is second else "primary"
+                        self.hedge_wins += winner == "hedge"
+                        registry.inc("api_hedges_total", api=self.name, winner=winner)
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        stats = {"calls": self.calls, "retries": self.retries, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        if self.breaker is not None:
+            stats.update(breaker=self.breaker.state, breaker_opened=self.breaker.opened,
+                         breaker_rejected=self.breaker.rejected)
+        return stats
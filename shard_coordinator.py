@@ -0,0 +1,158 @@
+# shard_coordinator.py
+
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def default_instance_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class ShardCoordinator:
+    def __init__(self, db_client, groups, instance_id: str = None, lease_seconds: float = 30.0,
+        heartbeat_interval: float = 5.0):
+        """
+        Lets several bot instances, each with its own browser and groups,
+        share one database. Every instance registers itself in
+        'bot_instances' and heartbeats; each group is owned by at most one
+        instance at a time through a lease in 'group_leases', renewed with
+        every heartbeat. When an instance stops heartbeating its leases run
+        out and another instance configured for the same groups takes them
+        over.
+
+        Args:
+            db_client (DatabaseClient): The shared database.
+            groups: Groups this instance is configured to monitor.
+            instance_id (str): Stable name for this instance. Defaults to host, pid and a random suffix.
+            lease_seconds (float): How long a group lease, and an instance without a heartbeat, lasts.
+            heartbeat_interval (float): Seconds between heartbeats; well under lease_seconds.
+        """
+        self.db_client = db_client
+        self.groups = list(groups)
+        self.instance_id = instance_id or default_instance_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.owned_groups = set()
+
+        self.heartbeats = 0
+        self.takeovers = 0
+        self.reaped = 0
+
+    def owns(self, group_name: str) -> bool:
+        return group_name in self.owned_groups
+
+    async def register(self) -> set:
+        """
+        Records this instance and takes the leases on whichever of its groups
+        are free.
+
+        Returns:
+            set: The groups this instance owns.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO bot_instances (instance_id, hostname, pid, groups, started_at, heartbeat_at)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, (self.instance_id, socket.gethostname(), os.getpid(), ",".join(self.groups), now, now))
+        logger.info(f"Registered bot instance '{self.instance_id}' for groups {self.groups}")
+        return await self.heartbeat()
+
+    async def heartbeat(self) -> set:
+        """
+        Marks this instance alive, renews the leases it holds and takes over
+        the leases on its groups that have expired, all in one transaction.
+
+        Returns:
+            set: The groups this instance owns.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            cursor = await db.execute("""
+                UPDATE bot_instances SET heartbeat_at = ? WHERE instance_id = ?;
+            """, (now, self.instance_id))
+            if cursor.rowcount == 0:
+                # Another instance declared us dead during a long pause
+                logger.warning(f"Bot instance '{self.instance_id}' was reaped, registering again")
+                await db.execute("""
+                    INSERT INTO bot_instances (instance_id, hostname, pid, groups, started_at, heartbeat_at)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, (self.instance_id, socket.gethostname(), os.getpid(), ",".join(self.groups), now, now))
+            await db.executemany("""
+                INSERT INTO group_leases (group_name, owner, lease_expires_at, acquired_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (group_name) DO UPDATE
+                SET owner = excluded.owner, lease_expires_at = excluded.lease_expires_at,
+                    acquired_at = CASE WHEN group_leases.owner = excluded.owner
+                                       THEN group_leases.acquired_at ELSE excluded.acquired_at END
+                WHERE group_leases.owner = excluded.owner OR group_leases.lease_expires_at < ?;
+            """, [(group, self.instance_id, now + self.lease_seconds, now, now) for group in self.groups])
+            cursor = await db.execute("SELECT group_name FROM group_leases WHERE owner = ?;", (self.instance_id,))
+            owned = {row[0] for row in await cursor.fetchall()}
+        self.heartbeats += 1
+
+        gained, lost = owned - self.owned_groups, self.owned_groups - owned
+        if gained:
+            if self.heartbeats > 1:
+                self.takeovers += len(gained)
+            logger.info(f"Bot instance '{self.instance_id}' now owns groups {sorted(gained)}")
+        if lost:
+            logger.warning(f"Bot instance '{self.instance_id}' lost groups {sorted(lost)}")
+        self.owned_groups = owned
+        return owned
+
+    async def reap_dead_instances(self) -> list:
+        """
+        Removes instances that have not heartbeated for lease_seconds, along
+        with their group leases. Each dead instance is returned to exactly
+        one caller, which is then responsible for releasing its other claims.
+
+        Returns:
+            list: IDs of the instances removed.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            cursor = await db.execute("""
+                DELETE FROM bot_instances WHERE heartbeat_at < ? AND instance_id != ?
+                RETURNING instance_id;
+            """, (now - self.lease_seconds, self.instance_id))
+            dead = [row[0] for row in await cursor.fetchall()]
+            await db.executemany("DELETE FROM group_leases WHERE owner = ?;", [(owner,) for owner in dead])
+        if dead:
+            self.reaped += len(dead)
+            logger.warning(f"Reaped bot instances without a heartbeat: {dead}")
+        return dead
+
+    async def deregister(self):
+        """
+        Gives up this instance's group leases so other instances can take
+        them over at once, and removes its registration.
+        """
+        async with self.db_client.transaction() as db:
+            await db.execute("DELETE FROM group_leases WHERE owner = ?;", (self.instance_id,))
+            await db.execute("DELETE FROM bot_instances WHERE instance_id = ?;", (self.instance_id,))
+        self.owned_groups = set()
+        logger.info(f"Deregistered bot instance '{self.instance_id}'")
+
+    async def live_instances(self) -> dict:
+        """
+        Returns instance ID -> configured groups for every instance with a recent heartbeat.
+        """
+        async with self.db_client.connection() as db:
+            cursor = await db.execute("""
+                SELECT instance_id, groups FROM bot_instances WHERE heartbeat_at >= ?;
+            """, (time.time() - self.lease_seconds,))
+            return {instance_id: groups.split(",") for instance_id, groups in await cursor.fetchall()}
+
+    def stats(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "owned_groups": sorted(self.owned_groups),
+            "heartbeats": self.heartbeats,
+            "takeovers": self.takeovers,
+            "reaped": self.reaped,
+        }
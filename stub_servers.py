@@ -0,0 +1,194 @@
+# stub_servers.py
+
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from aiohttp import web
+from prefilter import NEED_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+class StubServer:
+    name = "stub"
+    path = "/"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+        error_status: int = 500, retry_after: float = None, seed: int = None):
+        """
+        Base for local stand-ins of the APIs the bot calls, for tests and
+        benchmarks. Every request waits `latency` plus a uniform random extra
+        of up to `jitter` seconds, and a fraction `error_rate` of requests is
+        answered with `error_status` instead of a result. For fault injection
+        in tests, the next `fail_next` requests always fail and the next
+        `slow_next` requests wait `slow_latency` seconds instead.
+
+        Args:
+            latency (float): Seconds to wait before answering each request.
+            jitter (float): Upper bound of the random extra wait in seconds.
+            error_rate (float): Fraction of requests that fail, between 0 and 1.
+            error_status (int): HTTP status of failed requests, e.g. 429 or 503.
+            retry_after (float): Retry-After header sent with failed requests, in seconds.
+            seed (int): Seed for the jitter and error draws, for repeatable runs.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.fail_next = 0
+        self.slow_next = 0
+        self.slow_latency = 0.0
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._runner = None
+        self.base_url = None
+
+    def respond(self, payload: dict) -> dict:
+        raise NotImplementedError
+
+    async def stream(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        raise web.HTTPBadRequest(text=f"Stub {self.name} server does not stream")
+
+    async def handle_request(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        payload = await request.json()
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.slow_next:
+            self.slow_next -= 1
+            delay = self.slow_latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.fail_next or (self.error_rate and self.random.random() < self.error_rate):
+            self.fail_next = max(0, self.fail_next - 1)
+            self.errors += 1
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else None
+            return web.json_response({"error": {"message": "Injected stub error"}}, status=self.error_status,
+                                     headers=headers)
+        if payload.get("stream"):
+            return await self.stream(request, payload)
+        return web.json_response(self.respond(payload))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_request)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        logger.info(f"Stub {self.name} server listening on {self.base_url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors}
+
+
+def chat_completion(content: str, model: str = None) -> dict:
+    """
+    Wraps text in an OpenAI-style chat completion body.
+    """
+    return {
+        "id": f"stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model or "stub",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class StubPerplexityServer(StubServer):
+    name = "Perplexity"
+    path = "/chat/completions"
+
+    def __init__(self, latency: float = 0.0, reply: str = None, chunk_delay: float = 0.0, **profile):
+        """
+        Local stand-in for the Perplexity /chat/completions endpoint. With
+        "stream": true the reply is sent word by word as server-sent events.
+
+        Args:
+            latency (float): Seconds to wait before answering each request, or before the first chunk.
+            reply (str): Recommendation text returned in every completion.
+            chunk_delay (float): Seconds between streamed chunks, to model generation speed.
+            **profile: jitter, error_rate, error_status, retry_after and seed, as for StubServer.
+        """
+        super().__init__(latency=latency, **profile)
+        self.reply = reply or "Hey! Try the Example Kettle. Here's the link: https://www.amazon.in/dp/EXAMPLE"
+        self.chunk_delay = chunk_delay
+        self.chunks_sent = 0
+        self.streams_closed_early = 0
+
+    def respond(self, payload: dict) -> dict:
+        return chat_completion(self.reply, payload.get("model"))
+
+    async def stream(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunks = re.findall(r"\S+\s*", self.reply)
+        try:
+            for index, chunk in enumerate(chunks):
+                if index and self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                event = {"id": "stub", "model": payload.get("model") or "stub", "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": chunk},
+                                      "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.chunks_sent += 1
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            # The client stopped reading; generation ends here
+            self.streams_closed_early += 1
+            raise
+        return response
+
+
+def is_need(message_text: str) -> bool:
+    """
+    Default stub classification: questions and messages with need keywords.
+    """
+    return '?' in message_text or bool(NEED_KEYWORDS.search(message_text.lower()))
+
+class StubGroqServer(StubServer):
+    name = "Groq"
+    path = "/openai/v1/chat/completions"
+
+    def __init__(self, latency: float = 0.0, classify=None, **profile):
+        """
+        Local stand-in for the Groq chat completions endpoint, answering both
+        the single-message and the batched classification prompts.
+
+        Args:
+            latency (float): Seconds to wait before answering each request.
+            classify: Callable taking a message text and returning True for a product need.
+                Defaults to is_need().
+            **profile: jitter, error_rate, error_status, retry_after and seed, as for StubServer.
+        """
+        super().__init__(latency=latency, **profile)
+        self.classify = classify or is_need
+
+    def respond(self, payload: dict) -> dict:
+        prompt = payload["messages"][-1]["content"]
+        if prompt.startswith("Classify these"):
+            messages = json.loads(prompt[prompt.index("["):])
+            content = json.dumps(["Yes" if self.classify(message) else "No" for message in messages])
+        else:
+            message = prompt.split("Message: '", 1)[1][:-1]
+            content = "Yes" if self.classify(message) else "No"
+        return chat_completion(content, payload.get("model"))
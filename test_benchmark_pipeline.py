@@ -0,0 +1,50 @@
+# test_benchmark_pipeline.py
+
+import asyncio
+import pytest
+from benchmark_pipeline import run_replay, synthetic_transcript
+from config import Config
+from groq_client import GroqClient
+from perplexity_client import PerplexityClient
+from resilience import ResilientCaller
+from stub_servers import StubGroqServer, StubPerplexityServer
+
+async def _stub_profiles():
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "test-key"
+    async with StubGroqServer() as server:
+        groq_client = GroqClient(db_client=None, base_url=server.base_url)
+        assert await groq_client.are_product_needs_async(["need a phone under 20k", "lol"]) == [True, False]
+        assert await groq_client.classify_async("any good earphones?")
+
+    async with StubPerplexityServer(error_rate=1.0, error_status=429) as server:
+        with pytest.raises(Exception, match="429"):
+            await PerplexityClient(db_client=None, base_url=server.base_url,
+                                   resilience=ResilientCaller("perplexity", max_retries=0)
+                                   ).fetch_recommendation("need a kettle", "Bob")
+        assert server.stats() == {"requests": 1, "errors": 1}
+
+def test_stub_profiles():
+    asyncio.run(_stub_profiles())
+
+def test_replay_end_to_end():
+    transcript = synthetic_transcript(40, ["deals", "books"], rate=0, need_ratio=0.25, seed=3)
+    result = asyncio.run(run_replay(
+        transcript,
+        speed=0,
+        groq_profile=dict(latency=0.01),
+        perplexity_profile=dict(latency=0.01),
+        approve_delay=0,
+        poll_interval=0.05,
+        timeout=60,
+    ))
+    assert result["completed"]
+    assert result["processed"] == result["messages"]
+    needs = result["needs_labelled"]
+    assert needs and result["needs_detected"] == result["responses"] == result["delivered"] == needs
+    assert result["stages_ms"]["ingest"]["count"] == result["messages"]
+    assert result["stages_ms"]["end_to_end"]["count"] == needs
+    assert result["db_ops_per_message"] > 0
+
+if __name__ == "__main__":
+    test_stub_profiles()
+    test_replay_end_to_end()
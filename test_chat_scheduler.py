@@ -0,0 +1,159 @@
+# test_chat_scheduler.py
+
+import asyncio
+import os
+import tempfile
+from chat_scheduler import ChatVisitScheduler
+from config import Config
+from initialize_db import initialize_db
+from whatsapp_automation import WhatsAppBot, EXTRACT_NEW_MESSAGES_SCRIPT, READ_UNREAD_COUNTS_SCRIPT
+from work_queue import QUEUED, CLASSIFYING
+
+def test_visits_follow_unread_badges():
+    scheduler = ChatVisitScheduler(["deals", "books", "tech"], max_staleness=60)
+    for group in ("deals", "books", "tech"):
+        scheduler.record_visit(group, now=100)
+
+    # Busiest chat first, regardless of list order
+    assert scheduler.choose("deals", {"books": 2, "tech": 5}, now=101) == "tech"
+    # No badges and nothing stale: stay put
+    assert scheduler.choose("deals", {"books": 0, "tech": 0}, now=110) == "deals"
+    # A quiet group is still revisited once it goes stale
+    scheduler.record_visit("deals", now=150)
+    scheduler.record_visit("tech", now=150)
+    assert scheduler.choose("deals", {}, now=161) == "books"
+    assert scheduler.stats()["switches"] == 2
+
+class FakeElement:
+    def __init__(self, on_click=None, on_keys=None):
+        self.on_click = on_click
+        self.on_keys = on_keys
+
+    def click(self):
+        self.on_click()
+
+    def send_keys(self, text):
+        self.on_keys(text)
+
+class FakeWhatsAppDriver:
+    """
+    Stand-in for WhatsApp Web with several chats in the sidebar.
+    """
+    def __init__(self, open_chat: str):
+        self.open_chat = open_chat
+        self.inbox = {}
+        self.sent = []
+
+    def find_element(self, by, value):
+        if "pane-side" in value:
+            title = value.split('@title="')[1].split('"')[0]
+            return FakeElement(on_click=lambda: setattr(self, "open_chat", title))
+        return FakeElement(on_keys=lambda text: self.sent.append((self.open_chat, text)))
+
+    def execute_script(self, script, *args):
+        if script == READ_UNREAD_COUNTS_SCRIPT:
+            return {chat: len(pairs) for chat, pairs in self.inbox.items() if chat != self.open_chat}
+        if script == EXTRACT_NEW_MESSAGES_SCRIPT:
+            return [list(pair) for pair in self.inbox.pop(self.open_chat, [])]
+        raise AssertionError("unexpected script")
+
+async def _routes_by_group(tmp: str):
+    db_path = os.path.join(tmp, "test.db")
+    await initialize_db(db_path)
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "test-key"
+    driver = FakeWhatsAppDriver("deals")
+    bot = WhatsAppBot(["deals", "books"], driver=driver)
+    bot.database_client.db_path = db_path
+    bot.poll_interval = 0.01
+    bot.chat_switch_settle = 0
+
+    # The same question cross-posted to both groups is two separate needs
+    question = ("[10:01, 01/01/2025] Bob: ", "any good earphones under 2k?")
+    driver.inbox = {"deals": [question], "books": [question]}
+    async with bot.database_client:
+        monitor = asyncio.create_task(bot.monitor_groups())
+        while sum((await bot.work_queue.counts()).values()) < 2:
+            await asyncio.sleep(0.01)
+        monitor.cancel()
+        claimed = await bot.work_queue.claim(QUEUED, CLASSIFYING, 10)
+        assert sorted(group for *_, group in claimed) == ["books", "deals"]
+
+        # Replies go back to the group the need came from
+        assert driver.open_chat == "books"
+        await bot.send_final_response(1, "Bob", "Try the Boat Rockerz 450", "https://example.com/boat", "deals")
+        await bot.send_response("Response generated and awaiting affiliate link.")
+    assert [chat for chat, _ in driver.sent] == ["deals", "deals"]
+    assert driver.sent[0][1].startswith("Try the Boat Rockerz 450\nProduct Link: https://example.com/boat")
+
+def test_routes_by_group():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_routes_by_group(tmp))
+
+class NoInputBoxDriver(FakeWhatsAppDriver):
+    """
+    A chat that never renders its input box, so nothing can be typed.
+    """
+    def find_element(self, by, value):
+        if "Type a message" in value:
+            raise RuntimeError("no such element")
+        return super().find_element(by, value)
+
+async def _releases_unsent(tmp: str):
+    db_path = os.path.join(tmp, "test.db")
+    await initialize_db(db_path)
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "test-key"
+    bot = WhatsAppBot(["deals"], driver=NoInputBoxDriver("deals"))
+    bot.database_client.db_path = db_path
+    async with bot.database_client as db_client:
+        await db_client.insert_final_response(1, "Bob", "any good earphones?", "Try the Boat Rockerz 450", "deals")
+        await db_client.update_affiliate_link(1, "https://example.com/boat")
+        claimed = await db_client.claim_affiliate_responses(10, owner=bot.instance_id)
+        await bot.send_final_response(*claimed[0])
+        # Nothing was typed, so the response is back in line rather than stuck in 'sending'
+        assert await db_client.count_unconfirmed_sends() == 0
+        assert len(await db_client.claim_affiliate_responses(10, owner=bot.instance_id)) == 1
+        assert [row[0] for row in await db_client.fetch_unconfirmed_sends()] == [1]
+
+        # An operator can requeue a send that never confirmed
+        assert await db_client.release_claimed_response(1)
+        assert not await db_client.release_claimed_response(1)
+
+def test_unsent_final_response_is_released():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_releases_unsent(tmp))
+
+async def _ids_ignore_group_order(tmp: str):
+    db_path = os.path.join(tmp, "test.db")
+    await initialize_db(db_path)
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "test-key"
+    question = ("[10:01, 01/01/2025] Bob: ", "any good earphones under 2k?")
+    other = ("[10:02, 01/01/2025] Carol: ", "need a kettle")
+
+    bot = WhatsAppBot(["deals", "books"], driver=FakeWhatsAppDriver("deals"))
+    bot.database_client.db_path = db_path
+    async with bot.database_client as db_client:
+        # Recorded by an older version while 'books' was the first group, without the group in the ID
+        contact = bot.extract_contact_details_from_metadata(question[0])
+        timestamp = bot.extract_timestamp_from_metadata(question[0])
+        await db_client.insert_processed_message(bot.generate_unique_message_id(contact, timestamp, question[1]), 1)
+        await bot.queue_scraped_messages([question], "books")
+        await bot.queue_scraped_messages([other], "deals")
+        assert await bot.work_queue.counts() == {QUEUED: 1}
+
+    # Reordering the groups does not change the IDs
+    reordered = WhatsAppBot(["books", "deals"], driver=FakeWhatsAppDriver("books"))
+    reordered.database_client.db_path = db_path
+    async with reordered.database_client:
+        await reordered.queue_scraped_messages([other], "deals")
+        await reordered.queue_scraped_messages([question], "books")
+        assert await reordered.work_queue.counts() == {QUEUED: 1}
+
+def test_message_ids_ignore_group_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_ids_ignore_group_order(tmp))
+
+if __name__ == "__main__":
+    test_visits_follow_unread_badges()
+    test_routes_by_group()
+    test_unsent_final_response_is_released()
+    test_message_ids_ignore_group_order()
@@ -0,0 +1,44 @@
+# test_classification_cache.py
+
+import asyncio
+import os
+import tempfile
+from classification_cache import ClassificationCache
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+
+async def _two_tier_cache(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        await db_client.log_groq_result("Any good earphones under 2k?", "Yes")
+        await db_client.log_groq_result("lol", "No")
+
+        cache = ClassificationCache(db_client, capacity=2)
+        await cache.warm_from_logs()
+        # Case, whitespace and URLs do not change the key
+        assert await cache.get("any good   EARPHONES under 2k? https://amzn.in/x") is True
+        assert await cache.get("LOL") is False
+        assert await cache.get("need a kettle") is None
+        assert cache.memory_hits == 2 and cache.misses == 1
+
+        await cache.put("need a kettle", True)
+        assert cache.evictions == 1
+
+        # A new process starts with an empty LRU but finds the SQLite tier
+        restarted = ClassificationCache(db_client, capacity=2)
+        assert await restarted.get("Need a kettle") is True
+        assert restarted.db_hits == 1
+        assert await restarted.get("need a kettle") is True
+        assert restarted.memory_hits == 1
+
+        expired = ClassificationCache(db_client, ttl=-1)
+        await expired.put("old question", True)
+        assert await ClassificationCache(db_client).get("old question") is None
+        assert await expired.purge_expired() == 1
+
+def test_two_tier_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_two_tier_cache(os.path.join(tmp, "test.db")))
+
+if __name__ == "__main__":
+    test_two_tier_cache()
@@ -1,7 +1,11 @@
 # test_database_client.py
 
 import asyncio
+import os
+import tempfile
 from database_client import DatabaseClient
+from dedup import hash_message_id
+from initialize_db import initialize_db
 
 async def test_database():
     db_client = DatabaseClient()
@@ -26,5 +30,48 @@ async def test_database():
     except Exception as e:
         print(f"Database test failed: {e}")
 
+async def _pooled_group_commit(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path, pool_size=2, group_commit=True) as db_client:
+        # Concurrent writers share one transaction per batch
+        await asyncio.gather(*(
+            db_client.insert_processed_message(hash_message_id(f"message_{i}"), i) for i in range(50)
+        ))
+        # A duplicate in the batch must not roll back the other writes
+        await asyncio.gather(
+            db_client.insert_processed_message(hash_message_id("message_0"), 0),
+            db_client.insert_processed_message(hash_message_id("message_50"), 50),
+        )
+        numbers = [await db_client.get_next_unique_number() for _ in range(3)]
+        assert numbers == [1, 2, 3]
+        assert await db_client.is_message_processed(hash_message_id("message_50"))
+    async with DatabaseClient(db_path).connection() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM processed_messages;")
+        assert (await cursor.fetchone())[0] == 51
+
+def test_pooled_group_commit():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_pooled_group_commit(os.path.join(tmp, "test.db")))
+
+async def _buffered_audit_logs(db_path: str):
+    await initialize_db(db_path)
+    db_client = DatabaseClient(db_path, buffered_logs=True)
+    db_client.log_writer.batch_size = 10
+    async with db_client:
+        for i in range(25):
+            await db_client.log_groq_result(f"message {i}", "No")
+        await db_client.log_perplexity_response("earphones", "Bob", "Try these")
+    # Everything buffered is flushed on close
+    assert db_client.log_writer.written == 26
+    async with DatabaseClient(db_path).connection() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM groq_logs;")
+        assert (await cursor.fetchone())[0] == 25
+        cursor = await db.execute("SELECT COUNT(*) FROM perplexity_logs;")
+        assert (await cursor.fetchone())[0] == 1
+
+def test_buffered_audit_logs():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_buffered_audit_logs(os.path.join(tmp, "test.db")))
+
 if __name__ == "__main__":
     asyncio.run(test_database())
@@ -0,0 +1,81 @@
+# test_dedup.py
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import aiosqlite
+from database_client import DatabaseClient
+from dedup import MessageDeduplicator, SeenMessageCache, hash_message_id
+from initialize_db import initialize_db
+from number_allocator import UniqueNumberAllocator
+
+def test_seen_message_cache_evicts_least_recently_used():
+    cache = SeenMessageCache(capacity=2)
+    cache.add("a")
+    cache.add("b")
+    assert "a" in cache  # refreshes 'a'
+    cache.add("c")
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+
+async def _register_batches(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        allocator = UniqueNumberAllocator(db_client, block_size=10)
+        deduplicator = MessageDeduplicator(db_client, allocator, capacity=100)
+        assert await deduplicator.register(["m1", "m2", "m1"]) == [("m1", 1), ("m2", 2)]
+
+        # The same poll seen again is answered from memory
+        assert await deduplicator.register(["m1", "m2", "m3"]) == [("m3", 3)]
+        assert deduplicator.cache_hits == 2
+
+        # A restarted process warms up from the table and continues after the reserved block
+        restarted = MessageDeduplicator(db_client, UniqueNumberAllocator(db_client, block_size=10), capacity=2)
+        await restarted.warm()
+        assert "m1" not in restarted.seen and "m3" in restarted.seen
+        assert await restarted.register(["m1", "m4"]) == [("m4", 11)]
+
+        # A message recorded under an older ID scheme is recognised through its alias
+        assert await restarted.register(["deals_m2", "deals_m5"], aliases={"deals_m2": "m2", "deals_m5": "m5"}) == [
+            ("deals_m5", 12)]
+
+def test_register_batches():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_register_batches(os.path.join(tmp, "test.db")))
+
+async def _migrate_hex_ids(db_path: str):
+    hex_id = hashlib.sha256("Alice_[10:00]_need a phone".encode()).hexdigest()
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("CREATE TABLE processed_messages (message_id TEXT PRIMARY KEY, unique_number INTEGER NOT NULL);")
+        await db.execute("INSERT INTO processed_messages VALUES (?, 1);", (hex_id,))
+        await db.commit()
+    await initialize_db(db_path)
+    await initialize_db(db_path)  # Already compact: nothing to do
+
+    async with DatabaseClient(db_path) as db_client:
+        async with db_client.connection() as db:
+            cursor = await db.execute("SELECT sql FROM sqlite_master WHERE name = 'processed_messages';")
+            assert "WITHOUT ROWID" in (await cursor.fetchone())[0]
+            # The cache warm-up reads the newest numbers from the index instead of sorting the table
+            cursor = await db.execute("""
+                EXPLAIN QUERY PLAN SELECT message_id FROM processed_messages ORDER BY unique_number DESC LIMIT 10;
+            """)
+            plan = " ".join(row[-1] for row in await cursor.fetchall())
+            assert "idx_processed_messages_unique_number" in plan and "TEMP B-TREE" not in plan
+        # A message recorded before the migration is still recognised by its new ID
+        message_id = hash_message_id("Alice_[10:00]_need a phone")
+        assert len(message_id) == 16 and message_id == bytes.fromhex(hex_id)[:16]
+        assert await db_client.fetch_recent_processed_message_ids(10) == [message_id]
+        deduplicator = MessageDeduplicator(db_client, UniqueNumberAllocator(db_client, block_size=10))
+        new = await deduplicator.register([message_id, hash_message_id("Bob_[10:01]_lol")])
+        assert [message_id for message_id, _ in new] == [hash_message_id("Bob_[10:01]_lol")]
+
+def test_migrate_hex_ids():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_migrate_hex_ids(os.path.join(tmp, "test.db")))
+
+if __name__ == "__main__":
+    test_seen_message_cache_evicts_least_recently_used()
+    test_register_batches()
+    test_migrate_hex_ids()
@@ -0,0 +1,78 @@
+# test_delivery_signal.py
+
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import aiosqlite
+from database_client import DatabaseClient
+from delivery_signal import DeliverySignal, notify_affiliate_added
+from initialize_db import initialize_db
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _claims_are_exclusive(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as admin:
+        for unique_number in range(1, 41):
+            await admin.insert_final_response(unique_number, f"member{unique_number}", "need a bag", "Try this bag",
+                                              "deals")
+            await admin.update_affiliate_link(unique_number, f"https://example.com/{unique_number}")
+        await admin.insert_final_response(41, "member41", "need a pen", "Try this pen")  # no link yet
+
+    async def sender():
+        claimed = []
+        async with DatabaseClient(db_path) as db_client:
+            while True:
+                rows = await db_client.claim_affiliate_responses(3)
+                if not rows:
+                    return claimed
+                claimed += rows
+
+    first, second = await asyncio.gather(sender(), sender())
+    numbers = [row[0] for row in first + second]
+    assert sorted(numbers) == list(range(1, 41))
+    assert (1, "member1", "Try this bag", "https://example.com/1", "deals") in first + second
+    async with DatabaseClient(db_path) as db_client:
+        assert await db_client.count_unconfirmed_sends() == 40
+        await db_client.mark_as_sent(1)
+        assert await db_client.count_unconfirmed_sends() == 39
+
+def test_claims_are_exclusive():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_claims_are_exclusive(os.path.join(tmp, "test.db")))
+
+async def _signal_wakeups(db_path: str):
+    await initialize_db(db_path)
+    port = free_udp_port()
+    async with DeliverySignal(db_path, port=port, check_interval=10) as signal:
+        # A notification wakes the waiter long before the next data_version check
+        start = time.perf_counter()
+        asyncio.get_running_loop().call_later(0.05, notify_affiliate_added, port)
+        await asyncio.wait_for(signal.wait(), 2)
+        assert time.perf_counter() - start < 1 and signal.notifications == 1
+
+    async with DeliverySignal(db_path, port=0, check_interval=0.05) as signal:
+        # A commit from another connection is noticed through data_version
+        async with aiosqlite.connect(db_path) as db:
+            await db.execute("INSERT INTO groq_logs (message_text, classification) VALUES ('hi', 'No');")
+            await db.commit()
+        await asyncio.wait_for(signal.wait(), 2)
+        assert signal.changes == 1
+        # Nothing changed since, so the next wait blocks
+        waiter = asyncio.create_task(signal.wait())
+        await asyncio.sleep(0.2)
+        assert not waiter.done()
+        waiter.cancel()
+
+def test_signal_wakeups():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_signal_wakeups(os.path.join(tmp, "test.db")))
+
+if __name__ == "__main__":
+    test_claims_are_exclusive()
+    test_signal_wakeups()
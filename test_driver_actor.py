@@ -0,0 +1,70 @@
+# test_driver_actor.py
+
+import asyncio
+import threading
+import time
+import pytest
+from driver_actor import DriverActor
+
+class SlowDriver:
+    """
+    Stand-in for webdriver.Chrome whose calls block like real WebDriver round trips.
+    """
+    def __init__(self):
+        self.threads = set()
+
+    def find_elements(self, delay: float):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(delay)
+        return ["message"]
+
+    def send_keys(self, text: str):
+        self.threads.add(threading.current_thread().name)
+        if not text:
+            raise ValueError("nothing to send")
+        return text
+
+def test_blocking_commands_leave_the_event_loop_free():
+    async def scenario():
+        driver = SlowDriver()
+        actor = DriverActor(driver, slow_command_seconds=10)
+        actor.start()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        scans = [actor.call("find_elements", driver.find_elements, 0.1) for _ in range(3)]
+        assert await asyncio.gather(*scans) == [["message"]] * 3
+        ticking.cancel()
+
+        with pytest.raises(ValueError):
+            await actor.call("send_message", driver.send_keys, "")
+        await actor.stop()
+        return ticks, driver.threads, actor.stats()
+
+    ticks, threads, stats = asyncio.run(scenario())
+    # The loop kept running while the driver thread blocked for ~0.3s
+    assert ticks >= 10
+    assert threads == {"webdriver-actor"}
+    assert stats["find_elements"]["count"] == 3 and stats["find_elements"]["mean_ms"] >= 90
+    # Commands queue behind each other on the single driver thread
+    assert stats["find_elements"]["mean_wait_ms"] >= 50
+    assert stats["send_message"] == {**stats["send_message"], "count": 1, "errors": 1}
+
+def test_runs_inline_until_started():
+    async def scenario():
+        driver = SlowDriver()
+        actor = DriverActor(driver)
+        assert await actor.call("send_message", driver.send_keys, "hi") == "hi"
+        return driver.threads
+
+    assert asyncio.run(scenario()) == {threading.main_thread().name}
+
+if __name__ == "__main__":
+    test_blocking_commands_leave_the_event_loop_free()
+    test_runs_inline_until_started()
@@ -1,8 +1,13 @@
 # test_groq_client.py
 
 import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from config import Config
 from database_client import DatabaseClient
-from groq_client import GroqClient
+from groq_client import GroqClient, parse_batch_answers
+from resilience import ResilientCaller, UpstreamUnavailable
 
 async def test_groq():
     db_client = DatabaseClient()
@@ -11,5 +16,110 @@ async def test_groq():
     result = await groq_client.is_product_need_async(message)
     print(f"Is product need: {result}")
 
+class FakeCompletions:
+    """
+    Stands in for groq's async chat.completions, answering 'Yes' for messages
+    that contain 'need'. Batch requests are answered with `batch_reply` if set.
+    """
+    def __init__(self, batch_reply=None, latency=0.0):
+        self.batch_reply = batch_reply
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        self.requests.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if prompt.startswith("Classify these"):
+            texts = json.loads(prompt[prompt.index("["):])
+            content = self.batch_reply or json.dumps(["Yes" if "need" in text else "No" for text in texts])
+        else:
+            content = "Yes" if "need" in prompt.split("Message:")[1] else "No"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class NullDatabaseClient:
+    async def log_groq_result(self, message_text, classification):
+        pass
+
+def make_client(monkeypatch, completions, **kwargs) -> GroqClient:
+    monkeypatch.setattr(Config, "GROQ_API_KEY", Config.GROQ_API_KEY or "test-key")
+    kwargs.setdefault("batching", True)
+    groq_client = GroqClient(db_client=NullDatabaseClient(), **kwargs)
+    groq_client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return groq_client
+
+def test_micro_batching(monkeypatch):
+    completions = FakeCompletions()
+    groq_client = make_client(monkeypatch, completions, batch_size=3, batch_window=0.05)
+    messages = ["need earphones", "lol", "ok", "need a kettle", "see you"]
+
+    async def classify():
+        return await asyncio.gather(*(groq_client.is_product_need_async(m) for m in messages))
+
+    assert asyncio.run(classify()) == [True, False, False, True, False]
+    # One full batch of three, then the remaining two once the window closes
+    assert len(completions.requests) == 2
+    assert groq_client.batches_sent == 2
+
+def test_malformed_batch_falls_back_to_single_requests(monkeypatch):
+    completions = FakeCompletions(batch_reply="Yes, No")
+    groq_client = make_client(monkeypatch, completions, batch_size=2, batch_window=0.05)
+
+    async def classify():
+        return await asyncio.gather(*(groq_client.is_product_need_async(m) for m in ["lol", "need shoes"]))
+
+    assert asyncio.run(classify()) == [False, True]
+    assert groq_client.batch_fallbacks == 1
+    assert len(completions.requests) == 3
+
+def test_concurrency_cap_and_timeout(monkeypatch):
+    completions = FakeCompletions(latency=0.05)
+    groq_client = make_client(monkeypatch, completions, batching=False, max_concurrency=2)
+
+    async def classify():
+        return await asyncio.gather(*(groq_client.is_product_need_async(f"need item {i}") for i in range(6)))
+
+    assert asyncio.run(classify()) == [True] * 6
+    assert completions.max_in_flight == 2
+
+    # Timed out attempts are retried, then the message is left to be classified later
+    slow = make_client(monkeypatch, FakeCompletions(latency=1), batching=False, timeout=0.05,
+                       resilience=ResilientCaller("groq", max_retries=1, backoff_base=0.01, seed=1))
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(slow.is_product_need_async("need shoes"))
+    assert slow.timeouts == 2
+
+def test_close_cancels_batches_in_flight(monkeypatch):
+    completions = FakeCompletions(latency=5)
+    groq_client = make_client(monkeypatch, completions, batch_size=2, batch_window=0.01)
+
+    async def classify():
+        waiting = [asyncio.create_task(groq_client.is_product_need_async(m)) for m in ["need shoes", "lol", "ok"]]
+        while not completions.requests:
+            await asyncio.sleep(0.01)
+        await groq_client.close()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        return results, groq_client._batch_tasks
+
+    results, tasks = asyncio.run(classify())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert not tasks
+
+def test_parse_batch_answers():
+    assert parse_batch_answers('Sure: ["Yes", "no"]', 2) == ["yes", "no"]
+    for content in ('["Yes"]', 'Yes, No', '["Yes", "Maybe"]'):
+        try:
+            parse_batch_answers(content, 2)
+        except ValueError:
+            continue
+        raise AssertionError(f"{content!r} should be rejected")
+
 if __name__ == "__main__":
     asyncio.run(test_groq())
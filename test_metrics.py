@@ -0,0 +1,88 @@
+# test_metrics.py
+
+import asyncio
+import os
+import tempfile
+from fastapi.testclient import TestClient
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from metrics import MetricsRegistry, MetricsSink, fetch_metrics, registry, render_prometheus
+
+def test_render_prometheus():
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.inc("api_requests_total", api="groq")
+    metrics.inc("api_requests_total", 2, api="groq")
+    metrics.set("work_queue_depth", 4, state="queued")
+    metrics.observe("pipeline_stage_seconds", 0.05, stage="classify")
+    metrics.observe("pipeline_stage_seconds", 0.5, stage="classify")
+    metrics.observe("pipeline_stage_seconds", 3, stage="classify")
+    try:
+        with metrics.timer("db_operation_seconds", errors="db_errors_total", operation="mark_as_sent"):
+            raise ValueError("locked")
+    except ValueError:
+        pass
+
+    text = render_prometheus(metrics.snapshot())
+    assert "# TYPE api_requests_total counter\napi_requests_total{api=\"groq\"} 3\n" in text
+    assert 'work_queue_depth{state="queued"} 4' in text
+    assert 'pipeline_stage_seconds_bucket{le="0.1",stage="classify"} 1' in text
+    assert 'pipeline_stage_seconds_bucket{le="1",stage="classify"} 2' in text
+    assert 'pipeline_stage_seconds_bucket{le="+Inf",stage="classify"} 3' in text
+    assert 'pipeline_stage_seconds_count{stage="classify"} 3' in text
+    assert 'db_errors_total{operation="mark_as_sent"} 1' in text
+    assert metrics.value("db_operation_seconds", operation="mark_as_sent") == 1
+
+async def _sink_round_trip(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        metrics = MetricsRegistry()
+        sink = MetricsSink(db_client, "bot-1", interval=60, registry=metrics,
+                           collectors=[lambda: metrics.set("outbound_queue_depth", 2)])
+        metrics.inc("messages_queued_total", 5, group="deals")
+        sink.start()
+        await sink.stop()
+        # Each write replaces the instance's previous snapshot
+        metrics.clear()
+        metrics.inc("messages_queued_total", 7, group="deals")
+        await sink.flush()
+
+        series = {(entry["name"], tuple(sorted(entry["labels"].items()))): entry
+                  for entry in await fetch_metrics(db_client, max_age=60)}
+        assert series[("messages_queued_total", (("bot_instance", "bot-1"), ("group", "deals")))]["value"] == 7
+        assert series[("outbound_queue_depth", (("bot_instance", "bot-1"),))]["value"] == 2
+        assert await fetch_metrics(db_client, max_age=-1) == []
+
+def test_sink_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_sink_round_trip(os.path.join(tmp, "test.db")))
+
+async def _seed_bot_metrics(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        metrics = MetricsRegistry()
+        metrics.observe("pipeline_stage_seconds", 0.2, stage="respond")
+        await MetricsSink(db_client, "bot-1", registry=metrics).flush()
+
+def test_admin_metrics_route():
+    import admin.main
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "test.db")
+        asyncio.run(_seed_bot_metrics(db_path))
+        original = admin.main.db_client
+        admin.main.db_client = DatabaseClient(db_path)
+        try:
+            with TestClient(admin.main.app) as client:
+                client.get("/")  # Records the admin app's own database metrics
+                response = client.get("/metrics")
+        finally:
+            admin.main.db_client = original
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'pipeline_stage_seconds_count{bot_instance="bot-1",stage="respond"} 1' in response.text
+    assert 'db_operation_seconds_count{bot_instance="admin",operation="fetch_pending_responses"}' in response.text
+    assert registry.value("db_operation_seconds", operation="fetch_pending_responses") >= 1
+
+if __name__ == "__main__":
+    test_render_prometheus()
+    test_sink_round_trip()
+    test_admin_metrics_route()
@@ -0,0 +1,62 @@
+# test_number_allocator.py
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from number_allocator import UniqueNumberAllocator
+
+async def _allocate(db_path: str, coroutines: int, per_coroutine: int, block_size: int) -> list:
+    async with DatabaseClient(db_path) as db_client:
+        allocator = UniqueNumberAllocator(db_client, block_size=block_size)
+
+        async def worker():
+            numbers = []
+            for i in range(per_coroutine):
+                if i % 5 == 0:
+                    numbers.extend(await allocator.allocate_many(3))
+                else:
+                    numbers.append(await allocator.allocate())
+            return numbers
+
+        results = await asyncio.gather(*(worker() for _ in range(coroutines)))
+    return [number for numbers in results for number in numbers]
+
+def allocate_in_process(db_path: str) -> list:
+    return asyncio.run(_allocate(db_path, coroutines=4, per_coroutine=250, block_size=37))
+
+def test_allocator_blocks():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "test.db")
+        asyncio.run(initialize_db(db_path))
+
+        async def scenario():
+            async with DatabaseClient(db_path) as db_client:
+                allocator = UniqueNumberAllocator(db_client, block_size=4)
+                assert [await allocator.allocate() for _ in range(3)] == [1, 2, 3]
+                # A request larger than the block is served from one reservation
+                assert await allocator.allocate_many(6) == [4, 5, 6, 7, 8, 9]
+                assert allocator.remaining == 0
+                other = UniqueNumberAllocator(db_client, block_size=4)
+                assert await other.allocate() == 10
+                assert await allocator.allocate() == 14
+
+        asyncio.run(scenario())
+
+def test_no_duplicates_across_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "test.db")
+        asyncio.run(initialize_db(db_path))
+
+        with multiprocessing.get_context("spawn").Pool(4) as pool:
+            results = pool.map(allocate_in_process, [db_path] * 4)
+
+        numbers = [number for numbers in results for number in numbers]
+        assert len(numbers) == 4 * 4 * 250 * 7 // 5
+        assert len(set(numbers)) == len(numbers)
+
+if __name__ == "__main__":
+    test_allocator_blocks()
+    test_no_duplicates_across_processes()
@@ -0,0 +1,93 @@
+# test_outbound_scheduler.py
+
+import asyncio
+import time
+import pytest
+from driver_actor import DriverActor
+from outbound_scheduler import OutboundScheduler, MessageNotSent, PRIORITY_ACKNOWLEDGEMENT
+
+class FakeChatDriver:
+    """
+    Stand-in for the WebDriver chat input that records sends and can be made
+    to fail a number of times.
+    """
+    def __init__(self, failures: int = 0, error: Exception = None):
+        self.sent = []
+        self.failures = failures
+        self.error = error or MessageNotSent("input box not found")
+
+    def type_message(self, text: str):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.sent.append((time.monotonic(), text))
+
+def make_scheduler(driver: FakeChatDriver, **kwargs) -> OutboundScheduler:
+    actor = DriverActor(driver)
+    return OutboundScheduler(lambda text, group: actor.call("send_message", driver.type_message, text), **kwargs)
+
+def test_prioritizes_and_merges_per_group():
+    async def scenario():
+        driver = FakeChatDriver()
+        scheduler = make_scheduler(driver, initial_interval=0.05, min_interval=0.05)
+        scheduler.start()
+        await asyncio.gather(
+            scheduler.submit("Try the Boat Rockerz 450", group="deals"),
+            scheduler.submit("Try the Nike Revolution 6", group="deals"),
+            scheduler.submit("Response generated and awaiting affiliate link.", group="deals",
+                             priority=PRIORITY_ACKNOWLEDGEMENT),
+            scheduler.submit("Response generated and awaiting affiliate link.", group="deals",
+                             priority=PRIORITY_ACKNOWLEDGEMENT),
+            scheduler.submit("Try the Kindle Paperwhite", group="books"),
+        )
+        await scheduler.stop()
+        return driver.sent, scheduler.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert [text for _, text in sent] == [
+        "Response generated and awaiting affiliate link.\n\nTry the Boat Rockerz 450\n\nTry the Nike Revolution 6",
+        "Try the Kindle Paperwhite",
+    ]
+    assert sent[1][0] - sent[0][0] >= 0.04
+    assert stats["sent"] == 2 and stats["delivered"] == 5 and stats["merged"] == 3
+    # The merged batch went out at once, the other group waited one interval
+    assert stats["latency_p50"] < 0.04 <= stats["latency_max"]
+
+def test_backs_off_after_failures_and_recovers():
+    async def scenario():
+        driver = FakeChatDriver(failures=2)
+        scheduler = make_scheduler(driver, initial_interval=0.01, min_interval=0.01, max_interval=0.1)
+        scheduler.start()
+        await scheduler.submit("hello")
+        backed_off = scheduler.interval
+        with pytest.raises(MessageNotSent):
+            driver.failures = 3
+            await scheduler.submit("lost")
+        await scheduler.stop()
+        return driver.sent, backed_off, scheduler.stats()
+
+    sent, backed_off, stats = asyncio.run(scenario())
+    assert [text for _, text in sent] == ["hello"]
+    # Two failures pushed the gap to the cap; one success eases it back
+    assert backed_off == pytest.approx(0.08)
+    assert stats["failures"] == 5
+
+def test_does_not_retry_sends_that_may_have_gone_out():
+    async def scenario():
+        driver = FakeChatDriver(failures=1, error=RuntimeError("lost connection after typing"))
+        scheduler = make_scheduler(driver, initial_interval=0.01, min_interval=0.01)
+        scheduler.start()
+        with pytest.raises(RuntimeError):
+            await scheduler.submit("maybe sent")
+        await scheduler.submit("hello")
+        await scheduler.stop()
+        return driver.sent, scheduler.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert [text for _, text in sent] == ["hello"]
+    assert stats["failures"] == 1
+
+if __name__ == "__main__":
+    test_prioritizes_and_merges_per_group()
+    test_backs_off_after_failures_and_recovers()
+    test_does_not_retry_sends_that_may_have_gone_out()
@@ -0,0 +1,121 @@
+# test_perplexity_streaming.py
+
+import asyncio
+import os
+import re
+import tempfile
+import pytest
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from perplexity_client import PerplexityClient, complete_recommendation, GREETING
+from resilience import ResilientCaller, UpstreamUnavailable
+from stub_servers import StubPerplexityServer
+
+REPLY = (
+    "Hey! Try the Example Kettle with a 1.5L steel body. "
+    "Someone I suggested it to noticed it boils in two minutes. Another person said the handle stays cool. "
+    "Just a heads up, some people found the lid stiff. A few also complain about the short cord. "
+    "Reviews are from https://www.reddit.com/r/india threads. "
+    "If you're interested, here's the link: https://www.amazon.in/dp/EXAMPLE. Hope it helps! "
+    "Sources: these reviews were collected from several Reddit threads about electric kettles in India, "
+    "which you can browse for more detail on durability, noise levels and long term reliability."
+)
+
+def test_complete_recommendation():
+    assert complete_recommendation("Someone said it's great. Try https://amzn.in/x ") is None
+    # Several cues in one sentence are one review
+    assert complete_recommendation("Someone I suggested it to told me it's great. Just a heads up, some people "
+                                   "found it loud. Try https://amzn.in/x ") is None
+    partial = REPLY[:REPLY.index("EXAMPLE") + 3]
+    assert complete_recommendation(partial) is None  # The link is still arriving
+    # The Reddit source is not the product link, and the full stop is not part of the link
+    assert complete_recommendation(REPLY).endswith("here's the link: https://www.amazon.in/dp/EXAMPLE")
+
+async def _stream_with_drafts(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client, \
+            StubPerplexityServer(reply=REPLY, chunk_delay=0.01) as server:
+        client = PerplexityClient(db_client=db_client, base_url=server.base_url, streaming=True,
+                                  draft_interval=0, early_stop=True)
+        drafts_seen = []
+
+        async def watch_drafts():
+            while True:
+                drafts_seen.extend(row[3] for row in await db_client.fetch_draft_responses())
+                await asyncio.sleep(0.02)
+
+        watcher = asyncio.create_task(watch_drafts())
+        try:
+            await client.get_response_async("need a kettle", "Bob", 7, "deals")
+        finally:
+            watcher.cancel()
+
+        # Partial drafts were visible while the response was generated
+        greeting = GREETING.format(contact="Bob")
+        assert drafts_seen and all((greeting + REPLY).startswith(draft) for draft in drafts_seen)
+        assert await db_client.fetch_draft_responses() == []
+        [(unique_number, contact, _, response, group_name)] = await db_client.fetch_pending_responses()
+        assert (unique_number, contact, group_name) == (7, "Bob", "deals")
+        assert response.startswith(greeting + "Hey! Try") and response.endswith("https://www.amazon.in/dp/EXAMPLE")
+
+        # Generation stopped well before the end of the reply
+        assert client.early_stops == 1
+        await asyncio.sleep(0.05)
+        assert server.chunks_sent < len(re.findall(r"\S+\s*", REPLY)) - 20
+
+        # Without the required structure the whole stream is used
+        server.reply = "Hey! Try the Example Kettle: https://www.amazon.in/dp/EXAMPLE"
+        assert await client.stream_recommendation("need a kettle", "Bob") == ("Bob", server.reply)
+
+async def _failed_stream(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client, \
+            StubPerplexityServer(error_rate=1.0, error_status=503) as server:
+        client = PerplexityClient(db_client=db_client, base_url=server.base_url, streaming=True,
+                                  resilience=ResilientCaller("perplexity", max_retries=0))
+        with pytest.raises(UpstreamUnavailable):
+            await client.get_response_async("need a kettle", "Bob", 7)
+        assert await db_client.fetch_pending_responses() == []
+        assert await db_client.fetch_draft_responses() == []
+
+        server.error_status = 400
+        assert (await client.get_response_async("need a kettle", "Bob", 7)).startswith("Sorry")
+        assert await db_client.fetch_pending_responses() == []
+        assert await db_client.fetch_draft_responses() == []
+
+def test_streaming_saves_drafts_and_stops_early():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_stream_with_drafts(os.path.join(tmp, "test.db")))
+
+def test_failed_stream_leaves_no_rows():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_failed_stream(os.path.join(tmp, "test.db")))
+
+async def _seed_draft(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        await db_client.save_draft_response(7, "Bob", "need a kettle", "Hey Bob, try the", "deals")
+
+def test_admin_polls_drafts_fragment():
+    from fastapi.testclient import TestClient
+    import admin.main
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "test.db")
+        asyncio.run(_seed_draft(db_path))
+        original = admin.main.db_client
+        admin.main.db_client = DatabaseClient(db_path)
+        try:
+            with TestClient(admin.main.app) as client:
+                page = client.get("/").text
+                fragment = client.get("/drafts").text
+        finally:
+            admin.main.db_client = original
+    # The page no longer reloads itself, which would wipe links being typed
+    assert 'http-equiv="refresh"' not in page and 'fetch("/drafts")' in page
+    assert "Hey Bob, try the" in fragment and "<form" not in fragment
+
+if __name__ == "__main__":
+    test_complete_recommendation()
+    test_streaming_saves_drafts_and_stops_early()
+    test_failed_stream_leaves_no_rows()
+    test_admin_polls_drafts_fragment()
@@ -0,0 +1,32 @@
+# test_prefilter.py
+
+from prefilter import LinearMessageModel, MessagePrefilter
+from text_normalization import normalize_message_text
+
+def test_rules():
+    prefilter = MessagePrefilter()
+    for chatter in ["ok", "LOL!!", "https://example.com/x", "😂😂", "image omitted", "tomorrow"]:
+        assert prefilter.classify(chatter) is False, chatter
+    for need in ["any good earphones under 2k?", "need a laptop", "Can someone suggest a good sunscreen"]:
+        assert prefilter.classify(need) is None, need
+    assert prefilter.calls_saved == 6 and prefilter.deferred == 3
+
+    assert MessagePrefilter(allow_positive=True).decide("any good earphones under 2k?") is True
+
+def test_model_and_agreement():
+    positives = ["need a {} for my mom", "looking to buy a {}", "which {} should i get", "want a cheap {}"]
+    negatives = ["the {} at the party was fun", "my {} broke lol", "did you see the {} yesterday", "{} was so good"]
+    products = ["phone", "kettle", "serum", "bag", "watch", "laptop", "trimmer", "mixer"]
+    examples = [(template.format(p), True) for template in positives for p in products]
+    examples += [(template.format(p), False) for template in negatives for p in products]
+
+    model = LinearMessageModel()
+    model.train([(normalize_message_text(text), label) for text, label in examples])
+    prefilter = MessagePrefilter(model=model, allow_positive=True, negative_threshold=0.2, positive_threshold=0.8)
+    result = prefilter.evaluate(examples)
+    assert result["coverage"] > 0.5
+    assert result["agreement"] > 0.9
+
+if __name__ == "__main__":
+    test_rules()
+    test_model_and_agreement()
@@ -0,0 +1,116 @@
+# test_request_coalescing.py
+
+import asyncio
+from perplexity_client import PerplexityClient
+from request_coalescing import RequestCoalescer, hamming_distance, simhash
+
+def test_simhash_similarity():
+    a = simhash("Any good wireless earphones under 2k? Need them for the gym")
+    b = simhash("any good  wireless earphones under 2k?? need them for the gym https://amzn.in/x")
+    c = simhash("Can someone suggest a sunscreen for oily skin")
+    assert hamming_distance(a, b) == 0
+    assert hamming_distance(a, c) > 3
+
+def test_concurrent_duplicates_share_one_fetch():
+    coalescer = RequestCoalescer(max_distance=3, reuse_window=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "recommendation"
+
+    async def scenario():
+        results = await asyncio.gather(
+            coalescer.run("need a good kettle for tea", fetch),
+            coalescer.run("Need a good kettle for tea!", fetch),
+        )
+        # Finished results are reused within the window
+        results.append(await coalescer.run("need a GOOD kettle for tea", fetch))
+        return results
+
+    assert asyncio.run(scenario()) == ["recommendation"] * 3
+    assert len(calls) == 1
+    assert coalescer.leaders == 1 and coalescer.coalesced == 2
+
+def test_failures_and_expired_results_are_not_shared():
+    coalescer = RequestCoalescer(reuse_window=0)
+    outcomes = [RuntimeError("upstream down"), "first", "second"]
+
+    async def fetch():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def scenario():
+        try:
+            await coalescer.run("need a laptop bag", fetch)
+        except RuntimeError:
+            pass
+        first = await coalescer.run("need a laptop bag", fetch)
+        await asyncio.sleep(0.01)
+        return first, await coalescer.run("need a laptop bag", fetch)
+
+    assert asyncio.run(scenario()) == ("first", "second")
+
+def test_followers_retry_when_leader_is_cancelled():
+    coalescer = RequestCoalescer(reuse_window=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "recommendation"
+
+    async def scenario():
+        leader = asyncio.create_task(coalescer.run("need a good kettle for tea", fetch))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(coalescer.run("Need a good kettle for tea!", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(scenario()) == ["recommendation"] * 2
+    # One follower took over as leader, the other shared its result
+    assert len(calls) == 2 and coalescer.leaders == 2
+
+class RecordingDatabaseClient:
+    def __init__(self):
+        self.rows = []
+
+    async def insert_final_response(self, unique_number, contact, message_text, generated_response, group_name=None):
+        self.rows.append((unique_number, contact, generated_response))
+
+def test_each_duplicate_gets_its_own_row():
+    db_client = RecordingDatabaseClient()
+    client = PerplexityClient(db_client=db_client, coalescer=RequestCoalescer(), streaming=False)
+    requests = []
+
+    async def fetch_recommendation(query, contact):
+        requests.append(query)
+        await asyncio.sleep(0.05)
+        return contact, "Also worth a look: try X"
+
+    client.fetch_recommendation = fetch_recommendation
+
+    async def scenario():
+        await asyncio.gather(
+            client.get_response_async("any good trimmer for beard", "Al", 1),
+            client.get_response_async("Any good trimmer for beard?", "Bob", 2),
+        )
+
+    asyncio.run(scenario())
+    assert len(requests) == 1
+    assert sorted(db_client.rows) == [
+        # The first asker's name, which the body happens to contain, is not swapped for the second's
+        (1, "Al", "Hey, I saw your need Al, here is the solution to your need: Also worth a look: try X"),
+        (2, "Bob", "Hey, I saw your need Bob, here is the solution to your need: Also worth a look: try X"),
+    ]
+
+if __name__ == "__main__":
+    test_simhash_similarity()
+    test_concurrent_duplicates_share_one_fetch()
+    test_failures_and_expired_results_are_not_shared()
+    test_followers_retry_when_leader_is_cancelled()
+    test_each_duplicate_gets_its_own_row()
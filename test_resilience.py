@@ -0,0 +1,118 @@
+# test_resilience.py
+
+import asyncio
+import os
+import tempfile
+import time
+import pytest
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from perplexity_client import PerplexityClient
+from resilience import (ResilientCaller, CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamUnavailable,
+                        CLOSED, OPEN)
+from stub_servers import StubPerplexityServer
+from work_queue import DurableWorkQueue, QUEUED, CLASSIFYING
+
+def _client(server, **policy) -> PerplexityClient:
+    return PerplexityClient(db_client=None, base_url=server.base_url, streaming=False,
+                            resilience=ResilientCaller("perplexity", seed=1, **policy))
+
+async def _retry_after():
+    async with StubPerplexityServer(error_status=429, retry_after=0.1) as server:
+        server.fail_next = 2
+        # A large backoff would make the test slow if Retry-After were ignored
+        client = _client(server, max_retries=3, backoff_base=30)
+        started = time.monotonic()
+        assert await client.fetch_recommendation("need a kettle", "Bob") == ("Bob", server.reply)
+        assert 0.2 <= time.monotonic() - started < 5
+        assert server.stats() == {"requests": 3, "errors": 2}
+        assert client.resilience.retries == 2
+
+        # Errors that retrying cannot fix are raised at once
+        server.error_status = 400
+        server.fail_next = 1
+        with pytest.raises(Exception, match="400"):
+            await client.fetch_recommendation("need a kettle", "Bob")
+        assert server.requests == 4
+
+def test_retry_honors_retry_after():
+    asyncio.run(_retry_after())
+
+async def _hedging():
+    async with StubPerplexityServer() as server:
+        server.slow_next = 1
+        server.slow_latency = 5
+        client = _client(server, hedge_after=0.05)
+        started = time.monotonic()
+        assert await client.fetch_recommendation("need a kettle", "Bob") == ("Bob", server.reply)
+        assert time.monotonic() - started < 2
+        assert server.requests == 2
+        assert client.resilience.stats()["hedge_wins"] == 1
+
+        # Fast answers are not hedged
+        await client.fetch_recommendation("need a kettle", "Bob")
+        assert server.requests == 3 and client.resilience.hedges == 1
+
+def test_hedged_request_beats_slow_one():
+    asyncio.run(_hedging())
+
+async def _circuit_breaker():
+    async with StubPerplexityServer(error_rate=1.0, error_status=503) as server:
+        breaker = CircuitBreaker("perplexity", failure_threshold=2, reset_timeout=0.2)
+        client = _client(server, max_retries=0, breaker=breaker)
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await client.fetch_recommendation("need a kettle", "Bob")
+        assert breaker.state == OPEN
+
+        # Open: fails fast without sending anything
+        with pytest.raises(CircuitOpenError) as error:
+            await client.fetch_recommendation("need a kettle", "Bob")
+        assert 0 < error.value.retry_after <= 0.2
+        assert server.requests == 2 and breaker.rejected == 1
+
+        # After the reset timeout one trial call closes it again
+        server.error_rate = 0.0
+        await asyncio.sleep(0.25)
+        assert await client.fetch_recommendation("need a kettle", "Bob") == ("Bob", server.reply)
+        assert breaker.state == CLOSED and breaker.opened == 1
+
+def test_circuit_breaker_opens_and_recovers():
+    asyncio.run(_circuit_breaker())
+
+async def _deadline():
+    async with StubPerplexityServer(latency=2) as server:
+        client = _client(server, deadline=0.1)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded) as error:
+            await client.fetch_recommendation("need a kettle", "Bob")
+        assert time.monotonic() - started < 1
+        # Callers defer the work, as for any other unavailable upstream
+        assert isinstance(error.value, UpstreamUnavailable)
+
+def test_deadline():
+    asyncio.run(_deadline())
+
+async def _defer(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, max_attempts=1, worker_id="worker")
+        await queue.enqueue([(1, "Alice", "need a phone", 0), (2, "Bob", "need a kettle", 0)])
+        assert len(await queue.claim(QUEUED, CLASSIFYING, 2)) == 2
+        # Only items leased by this worker are put back
+        assert await DurableWorkQueue(db_client, worker_id="other").defer(CLASSIFYING, [1]) == 0
+        assert await queue.defer(CLASSIFYING, [1, 2]) == 2
+        assert await queue.counts() == {QUEUED: 2}
+        # Deferring does not use up attempts
+        assert len(await queue.claim(QUEUED, CLASSIFYING, 2)) == 2
+
+def test_deferred_work_returns_to_queue():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_defer(os.path.join(tmp, "test.db")))
+
+if __name__ == "__main__":
+    test_retry_honors_retry_after()
+    test_hedged_request_beats_slow_one()
+    test_circuit_breaker_opens_and_recovers()
+    test_deadline()
+    test_deferred_work_returns_to_queue()
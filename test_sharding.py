@@ -0,0 +1,179 @@
+# test_sharding.py
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from database_client import DatabaseClient
+from initialize_db import initialize_db
+from shard_coordinator import ShardCoordinator
+from work_queue import DurableWorkQueue, QUEUED, AWAITING_RESPONSE, RESPONDING, DONE
+
+async def _failover(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        first = ShardCoordinator(db_client, ["deals", "books"], instance_id="first", lease_seconds=0.2)
+        second = ShardCoordinator(db_client, ["books", "tech"], instance_id="second", lease_seconds=0.2)
+        assert await first.register() == {"deals", "books"}
+        assert await second.register() == {"tech"}
+
+        first_queue = DurableWorkQueue(db_client, worker_id="first")
+        second_queue = DurableWorkQueue(db_client, worker_id="second")
+        first_queue.groups, second_queue.groups = first.owned_groups, second.owned_groups
+        await first_queue.enqueue([(1, "Alice", "need a lamp?", 1)], state=AWAITING_RESPONSE, group_name="books")
+        assert await second_queue.claim(AWAITING_RESPONSE, RESPONDING, 5) == []
+        assert await first_queue.claim(AWAITING_RESPONSE, RESPONDING, 5) == [(1, "Alice", "need a lamp?", "books")]
+
+        await db_client.insert_final_response(2, "Bob", "need a pen", "Try this pen", "books")
+        await db_client.update_affiliate_link(2, "https://example.com/pen")
+        assert await db_client.claim_affiliate_responses(5, owner="second", groups=second.owned_groups) == []
+        assert len(await db_client.claim_affiliate_responses(5, owner="first", groups=first.owned_groups)) == 1
+        # Only the claimer can acknowledge the send
+        assert not await db_client.mark_as_sent(2, owner="second")
+        assert await db_client.mark_as_sent(2, owner="first")
+
+        # The first instance stops heartbeating while holding a lease
+        await asyncio.sleep(0.3)
+        assert await second.heartbeat() == {"books", "tech"}
+        assert await second.reap_dead_instances() == ["first"]
+        assert await second.reap_dead_instances() == []
+        assert await second_queue.release_leases("first") == 1
+        second_queue.groups = second.owned_groups
+        assert await second_queue.claim(AWAITING_RESPONSE, RESPONDING, 5) == [(1, "Alice", "need a lamp?", "books")]
+
+        # Back from its pause, the first instance only gets its free group again
+        assert await first.heartbeat() == {"deals"}
+        assert sorted(await second.live_instances()) == ["first", "second"]
+        await second.deregister()
+        assert await first.heartbeat() == {"deals", "books"}
+        assert first.takeovers == 1
+
+def test_group_failover():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_failover(os.path.join(tmp, "test.db")))
+
+async def _takeover_rescans(db_path: str):
+    from benchmark_pipeline import configured
+    from fake_whatsapp import ReplayDriver, TranscriptMessage
+    from whatsapp_automation import WhatsAppBot
+    await initialize_db(db_path)
+    transcript = [TranscriptMessage(0, "books", f"[10:0{i}, 1/1/2025] Member{i}: ", f"need a book {i}")
+                  for i in range(2)]
+    with configured(GROQ_API_KEY="test-key", SHARDING_ENABLED=True, INSTANCE_ID="second", GROUP_LEASE_SECONDS=0.2):
+        bot = WhatsAppBot(["books"], driver=ReplayDriver(transcript, speed=0))
+    bot.database_client.db_path = db_path
+    async with DatabaseClient(db_path) as db_client, bot.database_client:
+        first = ShardCoordinator(db_client, ["books"], instance_id="first", lease_seconds=0.2)
+        await first.register()
+        bot.apply_group_ownership(await bot.shard.register())
+        bot.driver._open("books")
+
+        # Seen while the group belongs to the first instance, which dies before queueing them
+        await bot.queue_scraped_messages(bot.scrape_new_message_pairs(), "books")
+        assert bot.last_seen_messages["books"]
+        await asyncio.sleep(0.3)
+        bot.apply_group_ownership(await bot.shard.heartbeat())
+        assert "books" in bot.rescan_groups
+
+        await bot.queue_scraped_messages(bot.scrape_new_message_pairs(), "books")
+        assert await bot.work_queue.counts() == {QUEUED: 2}
+
+def test_takeover_rescans_group():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_takeover_rescans(os.path.join(tmp, "test.db")))
+
+async def _seed(db_path: str, groups, per_group: int):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client)
+        unique_number = 0
+        for group in groups:
+            items = []
+            for _ in range(per_group):
+                unique_number += 1
+                items.append((unique_number, f"member{unique_number}", f"need a gift {unique_number}", 0))
+            await queue.enqueue(items, state=AWAITING_RESPONSE, group_name=group)
+        for group in groups:
+            for _ in range(per_group):
+                unique_number += 1
+                await db_client.insert_final_response(unique_number, f"member{unique_number}", "need a bag",
+                                                      "Try this bag", group)
+                await db_client.update_affiliate_link(unique_number, f"https://example.com/{unique_number}")
+
+async def _instance(db_path: str, instance_id: str, groups, send_seconds: float, barrier):
+    responded, delivered = [], []
+    async with DatabaseClient(db_path) as db_client:
+        shard = ShardCoordinator(db_client, groups, instance_id=instance_id)
+        queue = DurableWorkQueue(db_client, worker_id=instance_id)
+        queue.groups = await shard.register()
+        barrier.wait()
+        while True:
+            items = await queue.claim(AWAITING_RESPONSE, RESPONDING, 5)
+            for unique_number, _, _, _ in items:
+                time.sleep(send_seconds)  # One browser per instance, so its sends are serialized
+                responded.append(unique_number)
+            await queue.advance(RESPONDING, {DONE: [item[0] for item in items]})
+
+            rows = await db_client.claim_affiliate_responses(5, owner=instance_id, groups=queue.groups)
+            for row in rows:
+                time.sleep(send_seconds)
+                if await db_client.mark_as_sent(row[0], owner=instance_id):
+                    delivered.append(row[0])
+            if not items and not rows:
+                break
+        await shard.deregister()
+    return responded, delivered
+
+def _run_instance(db_path: str, instance_id: str, groups, send_seconds: float, barrier, results):
+    logging.getLogger().setLevel(logging.WARNING)
+    results.put(asyncio.run(_instance(db_path, instance_id, groups, send_seconds, barrier)))
+
+def run_shards(db_path: str, groups, instance_count: int, send_seconds: float):
+    """
+    Runs `instance_count` processes, each configured for its share of the
+    groups, until the seeded work is done.
+
+    Returns:
+        tuple: (elapsed seconds, responded unique numbers, delivered unique numbers)
+    """
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(instance_count + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_run_instance, args=(db_path, f"instance{i}", groups[i::instance_count],
+                                                    send_seconds, barrier, results))
+        for i in range(instance_count)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait(timeout=60)
+    started = time.perf_counter()
+    outputs = [results.get(timeout=60) for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join(timeout=10)
+    responded = [number for output in outputs for number in output[0]]
+    delivered = [number for output in outputs for number in output[1]]
+    return elapsed, responded, delivered
+
+def test_throughput_scales_without_loss_or_duplicates():
+    groups = [f"group{i}" for i in range(8)]
+    per_group = 6
+    elapsed = {}
+    for instance_count in (1, 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "test.db")
+            asyncio.run(_seed(db_path, groups, per_group))
+            elapsed[instance_count], responded, delivered = run_shards(db_path, groups, instance_count, 0.01)
+        # Every item handled exactly once
+        total = len(groups) * per_group
+        assert sorted(responded) == list(range(1, total + 1))
+        assert sorted(delivered) == list(range(total + 1, 2 * total + 1))
+    assert elapsed[4] < elapsed[1] / 2, elapsed
+
+if __name__ == "__main__":
+    test_group_failover()
+    test_takeover_rescans_group()
+    test_throughput_scales_without_loss_or_duplicates()
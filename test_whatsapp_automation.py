@@ -0,0 +1,93 @@
+# test_whatsapp_automation.py
+
+import asyncio
+import os
+import tempfile
+import pytest
+from selenium import webdriver
+from config import Config
+from initialize_db import initialize_db
+from whatsapp_automation import WhatsAppBot
+
+# Minimal static stand-in for the WhatsApp Web chat pane
+WHATSAPP_STUB_PAGE = """
+<html>
+<body>
+<div id="side"></div>
+<div id="main">
+    <div id="history"></div>
+</div>
+<script>
+function addMessage(metadata, text) {
+    const row = document.createElement('div');
+    row.innerHTML = '<div class="message-in"><div class="copyable-text" data-pre-plain-text=""><span class="selectable-text"></span></div></div>';
+    row.querySelector('.copyable-text').setAttribute('data-pre-plain-text', metadata);
+    row.querySelector('.selectable-text').innerText = text;
+    document.getElementById('history').appendChild(row);
+}
+addMessage('[10:00, 01/01/2025] Alice: ', 'hello everyone');
+addMessage('[10:01, 01/01/2025] Bob: ', 'any good earphones under 2k?');
+</script>
+</body>
+</html>
+"""
+
+def start_headless_chrome():
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    try:
+        return webdriver.Chrome(options=options)
+    except Exception as e:
+        pytest.skip(f"Chrome is not available: {e}")
+
+def add_message(driver, metadata: str, text: str):
+    driver.execute_script("addMessage(arguments[0], arguments[1]);", metadata, text)
+
+async def _observer_ingestion(driver, tmp: str):
+    db_path = os.path.join(tmp, "test.db")
+    await initialize_db(db_path)
+    page = os.path.join(tmp, "whatsapp.html")
+    with open(page, "w") as f:
+        f.write(WHATSAPP_STUB_PAGE)
+    driver.get(f"file://{page}")
+
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "test-key"
+    bot = WhatsAppBot("affbot", driver=driver)
+    bot.database_client.db_path = db_path
+
+    # Polling with a high-water mark only returns what is new
+    assert [text for _, text in bot.scrape_new_message_pairs()] == ["hello everyone", "any good earphones under 2k?"]
+    assert bot.scrape_new_message_pairs() == []
+    add_message(driver, "[10:02, 01/01/2025] Carol: ", "lol")
+    assert bot.scrape_new_message_pairs() == [("[10:02, 01/01/2025] Carol: ", "lol")]
+
+    # The observer buffers nodes added after installation
+    assert bot.install_message_observer()
+    assert bot.drain_message_observer(0.1) == []
+    add_message(driver, "[10:03, 01/01/2025] Dave: ", "need a laptop bag")
+    pairs = bot.drain_message_observer(1)
+    assert pairs == [("[10:03, 01/01/2025] Dave: ", "need a laptop bag")]
+
+    # A pending long-poll wakes up as soon as a node shows up
+    driver.execute_script("setTimeout(() => addMessage('[10:04, 01/01/2025] Eve: ', 'ok'), 200);")
+    assert bot.drain_message_observer(5) == [("[10:04, 01/01/2025] Eve: ", "ok")]
+
+    await bot.queue_scraped_messages(pairs + pairs)
+    assert await bot.work_queue.claim("queued", "classifying", 10) == [(1, "Dave", "need a laptop bag", "affbot")]
+
+    # After a reload the observer is gone and the bot must fall back to polling
+    driver.refresh()
+    assert bot.drain_message_observer(0.1) is None
+
+def test_observer_ingestion():
+    driver = start_headless_chrome()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(_observer_ingestion(driver, tmp))
+    finally:
+        driver.quit()
+
+if __name__ == "__main__":
+    test_observer_ingestion()
@@ -0,0 +1,122 @@
+# test_work_queue.py
+
+import asyncio
+import os
+import tempfile
+import time
+from database_client import DatabaseClient
+from dedup import MessageDeduplicator
+from initialize_db import initialize_db
+from number_allocator import UniqueNumberAllocator
+from work_queue import DurableWorkQueue, QUEUED, CLASSIFYING, AWAITING_RESPONSE, RESPONDING, DONE, FAILED
+
+async def _resume_after_restart(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        deduplicator = MessageDeduplicator(db_client, UniqueNumberAllocator(db_client, block_size=10))
+        work = {"m1": ("Alice", "lol", 0, "deals"), "m2": ("Bob", "any good earphones?", 1, "deals"),
+                "m3": ("Carol", "ok", 0, "books")}
+        assert len(await deduplicator.register(list(work), work_items=work)) == 3
+
+        queue = DurableWorkQueue(db_client, worker_id="first")
+        # Questions first, then oldest first
+        assert await queue.claim(QUEUED, CLASSIFYING, 2) == [(2, "Bob", "any good earphones?", "deals"),
+                                                             (1, "Alice", "lol", "deals")]
+        await queue.advance(CLASSIFYING, {AWAITING_RESPONSE: [2], DONE: [1]})
+        assert await queue.claim(AWAITING_RESPONSE, RESPONDING, 1) == [(2, "Bob", "any good earphones?", "deals")]
+        # The process dies here with item 2 being answered and item 3 never classified
+
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, worker_id="second")
+        assert await queue.recover() == 1
+        assert await queue.counts() == {QUEUED: 1, AWAITING_RESPONSE: 1, DONE: 1}
+        assert await queue.get(AWAITING_RESPONSE, RESPONDING, 5) == [(2, "Bob", "any good earphones?", "deals")]
+        assert await queue.get(QUEUED, CLASSIFYING, 5) == [(3, "Carol", "ok", "books")]
+
+        # A worker that lost its lease cannot complete the item
+        await DurableWorkQueue(db_client, worker_id="stale").advance(RESPONDING, {DONE: [2]})
+        await queue.advance(RESPONDING, {DONE: [2]})
+        await queue.advance(CLASSIFYING, {DONE: [3]})
+        await asyncio.wait_for(queue.wait_until_idle(), 1)
+        assert await queue.counts() == {DONE: 3}
+
+def test_resume_after_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_resume_after_restart(os.path.join(tmp, "test.db")))
+
+async def _expired_leases(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, lease_seconds=0.01, max_attempts=2, worker_id="crashy")
+        await queue.enqueue([(1, "Alice", "need a phone", 0)])
+        assert len(await queue.claim(QUEUED, CLASSIFYING, 1)) == 1
+        time.sleep(0.02)
+        assert await queue.reclaim_expired_leases() == 1
+        assert len(await queue.claim(QUEUED, CLASSIFYING, 1)) == 1
+        time.sleep(0.02)
+        # Second expired lease: the item is given up on
+        assert await queue.reclaim_expired_leases() == 1
+        assert await queue.counts() == {FAILED: 1}
+
+def test_expired_leases_are_reclaimed():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_expired_leases(os.path.join(tmp, "test.db")))
+
+async def _shed(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client)
+        await queue.enqueue([(1, "a", "ok", 0), (2, "b", "need shoes?", 1), (3, "c", "lol", 0), (4, "d", "hmm", 0)])
+        assert await queue.shed(QUEUED, 2, "drop_oldest") == 2
+        assert [item[0] for item in await queue.claim(QUEUED, CLASSIFYING, 10)] == [2, 4]
+        assert queue.evicted == 2
+
+def test_shed_drop_oldest():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_shed(os.path.join(tmp, "test.db")))
+
+async def _shed_expired(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, max_age=60)
+        await queue.enqueue([(1, "a", "ok", 0), (2, "b", "need shoes?", 1), (3, "c", "lol", 0), (4, "d", "hmm", 0)])
+        async with db_client.transaction() as db:
+            await db.execute("UPDATE work_items SET updated_at = updated_at - 120 WHERE unique_number = 3;")
+        # The stale item goes first, then the oldest of the rest
+        assert await queue.shed(QUEUED, 2, "drop_expired") == 2
+        assert [item[0] for item in await queue.claim(QUEUED, CLASSIFYING, 10)] == [2, 4]
+        assert queue.expired == 1 and queue.evicted == 1
+
+        # Stale items are all shed, even beyond the excess
+        await queue.enqueue([(5, "e", "hi", 0), (6, "f", "yo", 0), (7, "g", "hey", 0)])
+        async with db_client.transaction() as db:
+            await db.execute("UPDATE work_items SET updated_at = updated_at - 120 WHERE unique_number IN (5, 6);")
+        assert await queue.shed(QUEUED, 2, "drop_expired") == 2
+        assert [item[0] for item in await queue.claim(QUEUED, CLASSIFYING, 10)] == [7]
+
+def test_shed_drop_expired():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_shed_expired(os.path.join(tmp, "test.db")))
+
+async def _keep_leased(db_path: str):
+    await initialize_db(db_path)
+    async with DatabaseClient(db_path) as db_client:
+        queue = DurableWorkQueue(db_client, lease_seconds=0.06)
+        await queue.enqueue([(1, "a", "need shoes", 0)])
+        assert len(await queue.claim(QUEUED, CLASSIFYING, 1)) == 1
+        async with queue.keep_leased(CLASSIFYING, [1]):
+            await asyncio.sleep(0.2)  # Several lease lengths, as when a send waits in the outbound queue
+            assert await queue.reclaim_expired_leases() == 0
+        await asyncio.sleep(0.1)
+        assert await queue.reclaim_expired_leases() == 1
+
+def test_leases_are_kept_while_work_is_in_progress():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_keep_leased(os.path.join(tmp, "test.db")))
+
+if __name__ == "__main__":
+    test_resume_after_restart()
+    test_expired_leases_are_reclaimed()
+    test_shed_drop_oldest()
+    test_shed_drop_expired()
+    test_leases_are_kept_while_work_is_in_progress()
@@ -0,0 +1,31 @@
+# text_normalization.py
+
+import re
+
+URL_PATTERN = re.compile(r'http\S+|www\.\S+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def remove_urls(text: str) -> str:
+    """
+    Removes all URLs from the given text.
+
+    Args:
+        text (str): The text from which URLs should be removed.
+
+    Returns:
+        str: Text without URLs.
+    """
+    return URL_PATTERN.sub('', text)
+
+def normalize_message_text(text: str) -> str:
+    """
+    Case-folds a message, strips URLs and collapses whitespace, so repeated
+    copies of the same question compare equal.
+
+    Args:
+        text (str): The raw message text.
+
+    Returns:
+        str: The normalized text.
+    """
+    return WHITESPACE_PATTERN.sub(' ', remove_urls(text).casefold()).strip()
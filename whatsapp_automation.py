@@ -1,6 +1,5 @@
 # whatsapp_automation.py
 
-import aiosqlite
 import asyncio
 import re
 from selenium import webdriver
@@ -21,26 +20,240 @@ import logging
 from database_client import DatabaseClient
 from perplexity_client import PerplexityClient
 from groq_client import GroqClient
+from dedup import MessageDeduplicator, hash_message_id
+from number_allocator import UniqueNumberAllocator
+from text_normalization import remove_urls
+from prefilter import MessagePrefilter, NEED_KEYWORDS
+from classification_cache import ClassificationCache
+from request_coalescing import RequestCoalescer
+from rate_limiter import TokenBucket
+from delivery_signal import DeliverySignal
+from driver_actor import DriverActor
+from chat_scheduler import ChatVisitScheduler
+from shard_coordinator import ShardCoordinator, default_instance_id
+from outbound_scheduler import (OutboundScheduler, MessageNotSent, PRIORITY_ACKNOWLEDGEMENT,
+                                PRIORITY_RECOMMENDATION)
+from work_queue import DurableWorkQueue, QUEUED, CLASSIFYING, AWAITING_RESPONSE, RESPONDING, DONE, BLOCK, ACTIVE_STATES
+from metrics import registry, MetricsSink, COUNTER
+from resilience import UpstreamUnavailable
 import re
-import hashlib
 from config import Config
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Collects (metadata, text) pairs for every incoming message newer than the
+# high-water mark passed in as (metadata, text), walking the chat backwards so
+# the work done is proportional to the number of new messages. Returns null
+# while the chat pane is not loaded.
+EXTRACT_NEW_MESSAGES_SCRIPT = """
+const lastMetadata = arguments[0];
+const lastText = arguments[1];
+if (!document.getElementById('main')) {
+    return null;
+}
+const scrollToBottom = document.querySelector('div[aria-label="Scroll to bottom"]');
+if (scrollToBottom) {
+    scrollToBottom.click();
+}
+const messages = document.querySelectorAll('div.message-in');
+const fresh = [];
+for (let i = messages.length - 1; i >= 0; i--) {
+    const meta = messages[i].querySelector('div.copyable-text');
+    const span = messages[i].querySelector('span.selectable-text');
+    if (!meta || !span) {
+        continue;
+    }
+    const metadata = meta.getAttribute('data-pre-plain-text');
+    const text = span.innerText;
+    if (lastMetadata !== null && metadata === lastMetadata && text === lastText) {
+        break;
+    }
+    fresh.push([metadata, text]);
+}
+return fresh.reverse();
+"""
+
+# Returns {chat title: unread count} for the chats rendered in the sidebar;
+# chats without an unread badge count as 0.
+READ_UNREAD_COUNTS_SCRIPT = """
+const counts = {};
+document.querySelectorAll('#pane-side [role="listitem"], #pane-side [role="row"]').forEach(row => {
+    const title = row.querySelector('span[title]');
+    if (!title) {
+        return;
+    }
+    const badge = row.querySelector('span[aria-label*="unread"]');
+    counts[title.getAttribute('title')] = badge ? (parseInt(badge.textContent, 10) || 1) : 0;
+});
+return counts;
+"""
+
+# Installs a MutationObserver that buffers (metadata, text) pairs of newly
+# added message-in nodes in window.__murmurInbox and wakes any pending drain.
+# Returns false if the chat pane is not loaded yet.
+INSTALL_MESSAGE_OBSERVER_SCRIPT = """
+if (window.__murmurObserver) {
+    return true;
+}
+if (!document.getElementById('main')) {
+    return false;
+}
+window.__murmurInbox = [];
+window.__murmurWaiters = [];
+const collect = (message) => {
+    const meta = message.querySelector('div.copyable-text');
+    const span = message.querySelector('span.selectable-text');
+    if (meta && span) {
+        window.__murmurInbox.push([meta.getAttribute('data-pre-plain-text'), span.innerText]);
+    }
+};
+window.__murmurObserver = new MutationObserver((mutations) => {
+    for (const mutation of mutations) {
+        for (const node of mutation.addedNodes) {
+            if (node.nodeType !== Node.ELEMENT_NODE) {
+                continue;
+            }
+            if (node.matches('div.message-in')) {
+                collect(node);
+            }
+            node.querySelectorAll('div.message-in').forEach(collect);
+        }
+    }
+    if (window.__murmurInbox.length) {
+        window.__murmurWaiters.splice(0).forEach((wake) => wake());
+    }
+});
+window.__murmurObserver.observe(document.body, {childList: true, subtree: true});
+return true;
+"""
+
+# Async script: returns the buffered pairs as soon as there are any, or an
+# empty list after arguments[0] milliseconds. Returns null if the observer is
+# gone (for example after a page reload).
+DRAIN_MESSAGE_OBSERVER_SCRIPT = """
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+if (!window.__murmurObserver) {
+    done(null);
+    return;
+}
+let finished = false;
+const finish = () => {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    done(window.__murmurInbox.splice(0));
+};
+if (window.__murmurInbox.length) {
+    finish();
+    return;
+}
+window.__murmurWaiters.push(finish);
+setTimeout(finish, timeoutMs);
+"""
+
 
 class WhatsAppBot:
-    def __init__(self, group_name: str):
-        self.group_name = group_name
-        self.driver = self.init_driver()
+    def __init__(self, group_names, driver=None):
+        """
+        Args:
+            group_names: Name of the group to monitor, or a list of names. The first
+                group is opened at startup.
+            driver: Optional WebDriver to use instead of starting Chrome.
+        """
+        self.groups = [group_names] if isinstance(group_names, str) else list(group_names)
+        # The chat currently open in the browser
+        self.group_name = self.groups[0]
+        self.chat_scheduler = ChatVisitScheduler(self.groups, max_staleness=Config.GROUP_MAX_STALENESS_SECONDS)
+        self.chat_switch_settle = Config.CHAT_SWITCH_SETTLE_SECONDS
+        self.driver = driver if driver is not None else self.init_driver()
         self.actions = ActionChains(self.driver)
-        self.database_client = DatabaseClient()
-        self.groq_client = GroqClient(db_client=self.database_client)
-        self.perplexity_client = PerplexityClient(db_client=self.database_client)
+        # Every WebDriver call from the async pipeline goes through this thread
+        self.driver_actor = DriverActor(self.driver, slow_command_seconds=Config.DRIVER_SLOW_COMMAND_SECONDS)
+        self.database_client = DatabaseClient(buffered_logs=True)
+        self.classification_cache = ClassificationCache(
+            self.database_client,
+            capacity=Config.CLASSIFICATION_CACHE_SIZE,
+            ttl=Config.CLASSIFICATION_CACHE_TTL_SECONDS
+        ) if Config.CLASSIFICATION_CACHE_ENABLED else None
+        self.groq_rate_limiter = TokenBucket.per_minute(Config.GROQ_REQUESTS_PER_MINUTE)
+        self.perplexity_rate_limiter = TokenBucket.per_minute(Config.PERPLEXITY_REQUESTS_PER_MINUTE)
+        self.groq_client = GroqClient(db_client=self.database_client, cache=self.classification_cache,
+                                      rate_limiter=self.groq_rate_limiter)
+        self.recommendation_coalescer = RequestCoalescer(
+            max_distance=Config.COALESCE_MAX_DISTANCE,
+            reuse_window=Config.COALESCE_REUSE_WINDOW_SECONDS
+        ) if Config.COALESCE_RECOMMENDATIONS else None
+        self.perplexity_client = PerplexityClient(db_client=self.database_client, coalescer=self.recommendation_coalescer,
+                                                  rate_limiter=self.perplexity_rate_limiter)
+        self.prefilter = MessagePrefilter(allow_positive=Config.PREFILTER_ALLOW_POSITIVE) if Config.PREFILTER_ENABLED else None
+        self.number_allocator = UniqueNumberAllocator(self.database_client, block_size=Config.UNIQUE_NUMBER_BLOCK_SIZE)
+        self.deduplicator = MessageDeduplicator(self.database_client, self.number_allocator,
+                                                capacity=Config.SEEN_MESSAGE_CACHE_SIZE)
+        # Group ownership among instances sharing the database, in sharded mode only
+        self.shard = ShardCoordinator(
+            self.database_client,
+            self.groups,
+            instance_id=Config.INSTANCE_ID,
+            lease_seconds=Config.GROUP_LEASE_SECONDS,
+            heartbeat_interval=Config.INSTANCE_HEARTBEAT_SECONDS
+        ) if Config.SHARDING_ENABLED else None
+        self.instance_id = self.shard.instance_id if self.shard else Config.INSTANCE_ID or default_instance_id()
+        self.extraction_mode = Config.MESSAGE_EXTRACTION_MODE
+        self.poll_interval = Config.POLL_INTERVAL_SECONDS
+        self.ingestion_mode = Config.MESSAGE_INGESTION_MODE
+        self.long_poll_timeout = Config.OBSERVER_LONG_POLL_SECONDS
+        self.classifier_workers = Config.CLASSIFIER_WORKERS
+        self.responder_workers = Config.RESPONDER_WORKERS
+        self.outbound = OutboundScheduler(
+            self.deliver_message,
+            initial_interval=Config.SEND_DELAY_SECONDS,
+            min_interval=Config.SEND_MIN_INTERVAL_SECONDS,
+            max_interval=Config.SEND_MAX_INTERVAL_SECONDS,
+            max_per_minute=Config.SEND_MAX_PER_MINUTE,
+            coalesce=Config.COALESCE_OUTBOUND,
+            max_message_chars=Config.OUTBOUND_MAX_MESSAGE_CHARS
+        )
+        self.shutdown_grace_period = 10
+
+        # Per group, (metadata, text) of the newest message already scraped in 'script' mode
+        self.last_seen_messages = {}
+        # Groups taken over from another instance, rescanned in full on the next visit so
+        # messages scraped but not queued while they belonged to it are picked up
+        self.owned_groups = None
+        self.rescan_groups = set()
+
+        # Durable queue between the scraper, classifier and responder stages
+        self.work_queue = DurableWorkQueue(
+            self.database_client,
+            lease_seconds=Config.WORK_LEASE_SECONDS,
+            max_age=Config.QUEUE_MAX_AGE_SECONDS,
+            poll_interval=Config.WORK_QUEUE_POLL_SECONDS,
+            worker_id=self.instance_id
+        )
+        self.incoming_queue_size = Config.INCOMING_QUEUE_SIZE
+        self.response_queue_size = Config.RESPONSE_QUEUE_SIZE
+        self.queue_full_policy = Config.QUEUE_FULL_POLICY
 
-        # Initialize asyncio queues
-        self.incoming_queue = asyncio.Queue()
-        self.response_queue = asyncio.Queue()
+        # Writes this instance's metrics where the admin app's /metrics route reads them
+        self.metrics_sink = MetricsSink(
+            self.database_client,
+            self.instance_id,
+            interval=Config.METRICS_FLUSH_SECONDS,
+            collectors=[self.collect_metrics]
+        ) if Config.METRICS_ENABLED else None
+
+    @staticmethod
+    def message_priority(message_text: str) -> int:
+        """
+        Ranks incoming messages so direct questions and explicit needs are
+        classified before general chatter.
+        """
+        if not Config.PRIORITIZE_QUESTIONS:
+            return 0
+        return 1 if '?' in message_text or NEED_KEYWORDS.search(message_text.lower()) else 0
 
     def init_driver(self):
         chrome_driver_path = Config.CHROME_DRIVER_PATH  
@@ -75,8 +288,7 @@ class WhatsAppBot:
         Returns:
             str: Text without URLs.
         """
-        url_pattern = re.compile(r'http\S+|www\.\S+')
-        return url_pattern.sub('', text)
+        return remove_urls(text)
 
     def open_whatsapp_web(self):
         try:
@@ -95,24 +307,12 @@ class WhatsAppBot:
             self.driver.quit()
             raise
 
-    def select_group(self):
+    def select_group(self, group_name: str = None):
+        group_name = group_name or self.group_name
         try:
-            search_box = WebDriverWait(self.driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div[contenteditable="true"][data-tab="3"]'))
-            )
-            search_box.clear()
-            time.sleep(1)
-            search_box.send_keys(self.group_name)
-            logger.info(f"Searching for group: {self.group_name}")
-            time.sleep(2)
-            group_title = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, f'//span[@title="{self.group_name}"]'))
-            )
-            group_title.click()
-            logger.info(f"Selected group: {self.group_name}")
-            time.sleep(3)  # Allow time for messages to load
+            self.search_and_open_chat(group_name)
         except TimeoutException:
-            logger.error(f"Timeout while selecting group: {self.group_name}. Ensure the group name is correct.")
+            logger.error(f"Timeout while selecting group: {group_name}. Ensure the group name is correct.")
             self.driver.quit()
             raise
         except Exception as e:
@@ -120,6 +320,61 @@ class WhatsAppBot:
             self.driver.quit()
             raise
 
+    def search_and_open_chat(self, group_name: str):
+        """
+        Opens a chat through the sidebar search box.
+        """
+        search_box = WebDriverWait(self.driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'div[contenteditable="true"][data-tab="3"]'))
+        )
+        search_box.clear()
+        time.sleep(1)
+        search_box.send_keys(group_name)
+        logger.info(f"Searching for group: {group_name}")
+        time.sleep(2)
+        group_title = WebDriverWait(self.driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, f'//span[@title="{group_name}"]'))
+        )
+        group_title.click()
+        self.group_name = group_name
+        logger.info(f"Selected group: {group_name}")
+        time.sleep(3)  # Allow time for messages to load
+
+    def open_chat(self, group_name: str):
+        """
+        Switches the browser to another monitored chat, clicking it in the
+        sidebar when it is rendered there and searching for it otherwise.
+        Unlike select_group(), a failure leaves the driver running.
+        """
+        if group_name == self.group_name:
+            return
+        try:
+            title = self.driver.find_element(By.XPATH, f'//div[@id="pane-side"]//span[@title="{group_name}"]')
+        except NoSuchElementException:
+            self.search_and_open_chat(group_name)
+            return
+        title.click()
+        self.group_name = group_name
+        time.sleep(self.chat_switch_settle)  # Let the chat pane re-render
+        logger.info(f"Switched to group: {group_name}")
+
+    def read_unread_counts(self) -> dict:
+        """
+        Returns chat title -> unread count for the chats rendered in the sidebar.
+        """
+        return self.driver.execute_script(READ_UNREAD_COUNTS_SCRIPT) or {}
+
+    def scrape_current_chat(self):
+        """
+        Scrapes new messages from whichever chat is open. Runs as one driver
+        command so the group it returns is the one the messages came from,
+        even if a send switched chats in between.
+
+        Returns:
+            tuple: (group_name, [(metadata, message_text), ...]).
+        """
+        return self.group_name, self.scrape_new_message_pairs()
+
     def extract_contact_details_from_metadata(self, metadata):
         """
         Extracts contact details from the message metadata.
@@ -152,190 +407,653 @@ class WhatsAppBot:
             return match.group(1)
         return "unknown_time"
 
-    def generate_unique_message_id(self, contact: str, timestamp: str, message_text: str) -> str:
+    def generate_unique_message_id(self, contact: str, timestamp: str, message_text: str, group_name: str = None) -> bytes:
         """
-        Generates a unique identifier for a message using SHA-256 hash.
+        Generates a unique identifier for a message: a truncated SHA-256 digest (see dedup.hash_message_id).
 
         Args:
             contact (str): Contact details extracted from metadata.
             timestamp (str): Timestamp extracted from metadata.
             message_text (str): The text content of the message.
+            group_name (str): Group the message was posted in. Without it, the ID is the one
+                recorded before multi-group support, which queue_scraped_messages() checks
+                as an alias.
 
         Returns:
-            str: A unique hash string.
+            bytes: A 16-byte message ID.
         """
         unique_string = f"{contact}_{timestamp}_{message_text}"
-        message_hash = hashlib.sha256(unique_string.encode()).hexdigest()
-        return message_hash
+        if group_name is not None:
+            unique_string = f"{group_name}_{unique_string}"
+        return hash_message_id(unique_string)
+
+    def scrape_message_pairs(self):
+        """
+        Returns (metadata, message_text) pairs for every message in the chat
+        using one WebDriver call per message element.
+        """
+        WebDriverWait(self.driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'div[id="main"]'))
+        )
+
+        # Scroll to bottom to load latest messages
+        try:
+            scroll_to_bottom_button = self.driver.find_element(By.XPATH, '//div[@aria-label="Scroll to bottom"]')
+            scroll_to_bottom_button.click()
+        except NoSuchElementException:
+            pass
+
+        messages = self.driver.find_elements(By.CSS_SELECTOR, "div.message-in")  # Collect the most recent messages by scrolling to bottom
+
+        pairs = []
+        for message in messages:
+            try:
+                # A message = metadata + message_text, so extract both separately
+                metadata = message.find_element(By.XPATH, './/div[contains(@class, "copyable-text")]').get_attribute('data-pre-plain-text')
+                message_text = message.find_element(By.CSS_SELECTOR, 'span.selectable-text').text
+                pairs.append((metadata, message_text))
+            except StaleElementReferenceException:
+                continue  # Message no longer in DOM
+            except NoSuchElementException:
+                continue  # Required elements not found
+        return pairs
+
+    def scrape_new_message_pairs(self):
+        """
+        Returns (metadata, message_text) pairs for messages newer than the last
+        one seen, fetched in a single execute_script round trip, and advances
+        the high-water mark.
+        """
+        pairs = self.driver.execute_script(EXTRACT_NEW_MESSAGES_SCRIPT,
+                                           *self.last_seen_messages.get(self.group_name, (None, None)))
+        if pairs is None:
+            raise TimeoutException("Chat pane is not loaded.")
+        if pairs:
+            self.last_seen_messages[self.group_name] = tuple(pairs[-1])
+        return [tuple(pair) for pair in pairs]
+
+    def install_message_observer(self) -> bool:
+        """
+        Installs the in-page MutationObserver that buffers new incoming messages.
+
+        Returns:
+            bool: True if the observer is installed.
+        """
+        return bool(self.driver.execute_script(INSTALL_MESSAGE_OBSERVER_SCRIPT))
+
+    def drain_message_observer(self, timeout: float):
+        """
+        Long-polls the in-page buffer for up to `timeout` seconds and returns the
+        buffered (metadata, message_text) pairs, or None if the observer is gone.
+        """
+        self.driver.set_script_timeout(timeout + 5)
+        pairs = self.driver.execute_async_script(DRAIN_MESSAGE_OBSERVER_SCRIPT, int(timeout * 1000))
+        if pairs is None:
+            return None
+        if pairs:
+            self.last_seen_messages[self.group_name] = tuple(pairs[-1])
+        return [tuple(pair) for pair in pairs]
+
+    async def queue_scraped_messages(self, pairs, group_name: str = None):
+        """
+        Assigns unique numbers to the scraped (metadata, message_text) pairs
+        that were not processed before and queues them in the work queue, in
+        the same transaction that marks them processed.
+
+        Args:
+            pairs: Scraped (metadata, message_text) pairs.
+            group_name (str): Group the pairs were scraped from. Defaults to the open chat.
+        """
+        group_name = group_name or self.group_name
+        if self.shard is not None and not self.shard.owns(group_name):
+            logger.debug(f"Not queueing messages from '{group_name}', owned by another instance")
+            return
+        registry.inc("messages_scraped_total", len(pairs))
+        messages = {}
+        # Older versions recorded messages in the first configured group without the group, and the
+        # order of the groups may have changed since, so every message is also checked under that ID
+        aliases = {}
+        for metadata, message_text in pairs:
+            try:
+                # Extract contact details and timestamp from metadata using predefined functions
+                contact = self.extract_contact_details_from_metadata(metadata)
+                timestamp = self.extract_timestamp_from_metadata(metadata)
+
+                # Generate unique message ID
+                message_id = self.generate_unique_message_id(contact, timestamp, message_text, group_name)
+                messages.setdefault(message_id, (contact, message_text, self.message_priority(message_text), group_name))
+                aliases[message_id] = self.generate_unique_message_id(contact, timestamp, message_text)
+            except Exception as e:
+                logger.error(f"Error processing message: {e}")
+        if not messages:
+            return
+
+        if self.queue_full_policy == BLOCK:
+            await self.work_queue.wait_for_room(QUEUED, self.incoming_queue_size)
+
+        # Resolve, number and queue the whole poll at once, so it can't be reprocessed or lost
+        with registry.timer("pipeline_stage_seconds", stage="queue"):
+            queued = await self.deduplicator.register(list(messages), work_items=messages, aliases=aliases)
+        if queued:
+            registry.inc("messages_queued_total", len(queued), group=group_name)
+        for message_id, unique_number in queued:
+            logger.info(f"Queued new message from '{group_name}': '{messages[message_id][1]}' "
+                        f"with Unique Number: {unique_number}")
+        if queued:
+            self.work_queue.notify(QUEUED, len(queued))
+            await self.work_queue.shed(QUEUED, self.incoming_queue_size, self.queue_full_policy)
 
     async def extract_new_messages(self): 
         """
-        Extracts messages from group chat asynchronously and adds all messages without filtering to incoming_queue.
+        Extracts messages from group chat asynchronously and adds all messages without filtering to the work queue.
+
+        In 'observer' ingestion mode new messages are pushed from the page and
+        drained with a long-poll; polling is used until the observer is
+        installed and whenever it is lost. With more than one group the open
+        chat is polled and the browser moves between chats by unread activity.
         """
+        if len(self.groups) > 1:
+            return await self.monitor_groups()
+        observing = False
         while True:
             try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'div[id="main"]'))
-                )
+                if observing and self.group_name in self.rescan_groups:
+                    observing = False  # The observer only sees new messages; scrape the chat once
+                if observing:
+                    # The long-poll holds the driver thread, so sends wait at most long_poll_timeout
+                    pairs = await self.driver_actor.call("drain_message_observer", self.drain_message_observer,
+                                                         self.long_poll_timeout)
+                    if pairs is None:
+                        logger.warning("Message observer lost, falling back to polling.")
+                        observing = False
+                        continue
+                    await self.queue_scraped_messages(pairs)
+                    continue
 
-                # Scroll to bottom to load latest messages
-                try:
-                    scroll_to_bottom_button = self.driver.find_element(By.XPATH, '//div[@aria-label="Scroll to bottom"]')
-                    scroll_to_bottom_button.click()
-                except NoSuchElementException:
-                    pass
+                # Install before scraping so nothing arriving in between is missed;
+                # anything seen twice is dropped by the processed_messages check
+                if self.ingestion_mode == "observer" and await self.driver_actor.call(
+                        "install_message_observer", self.install_message_observer):
+                    observing = True
+                    logger.info("Message observer installed.")
 
-                messages = self.driver.find_elements(By.CSS_SELECTOR, "div.message-in")  # Collect the most recent messages by scrolling to bottom
+                with registry.timer("pipeline_stage_seconds", stage="scrape"):
+                    if self.extraction_mode == "script":
+                        pairs = await self.driver_actor.call("scrape_new_message_pairs", self.scrape_new_message_pairs)
+                    else:
+                        pairs = await self.driver_actor.call("scrape_message_pairs", self.scrape_message_pairs)
+                await self.queue_scraped_messages(pairs)
+                self.rescan_groups.discard(self.group_name)
 
-                for message in messages:
-                    try:
-                        # A message = metadata + message_text, so extract both separately
-                        metadata = message.find_element(By.XPATH, './/div[contains(@class, "copyable-text")]').get_attribute('data-pre-plain-text')
-                        message_text = message.find_element(By.CSS_SELECTOR, 'span.selectable-text').text
-
-                        # Extract contact details and timestamp from metadata using predefined functions
-                        contact = self.extract_contact_details_from_metadata(metadata)
-                        timestamp = self.extract_timestamp_from_metadata(metadata)
-
-                        # Generate unique message ID
-                        message_id = self.generate_unique_message_id(contact, timestamp, message_text)
-
-                        if not await self.database_client.is_message_processed(message_id):
-                            # Get the next unique number from the sequence
-                            unique_number = await self.database_client.get_next_unique_number()
-
-                            # Insert the processed message into the database since its unique number is made so it can't be reprocessed 
-                            await self.database_client.insert_processed_message(message_id, unique_number)
-
-                            # Queue the message for further processing into incoming_queue 
-                            await self.incoming_queue.put((contact, message_text, unique_number))
-                            logger.info(f"Queued new message: '{message_text}' with Unique Number: {unique_number}")
-                    except StaleElementReferenceException:
-                        continue  # Message no longer in DOM
-                    except NoSuchElementException:
-                        continue  # Required elements not found
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
-                await asyncio.sleep(5)  # Polling interval
+                if not observing:
+                    await asyncio.sleep(self.poll_interval)  # Polling interval
             except Exception as e:
                 logger.error(f"Error extracting new messages: {e}")
-                await asyncio.sleep(5)
+                registry.inc("pipeline_errors_total", stage="extract")
+                observing = False
+                await asyncio.sleep(self.poll_interval)
+
+    async def monitor_groups(self):
+        """
+        Polls the open chat, then lets the chat scheduler decide from the
+        sidebar unread badges whether to stay or move to another group.
+        """
+        while True:
+            try:
+                with registry.timer("pipeline_stage_seconds", stage="scrape"):
+                    group_name, pairs = await self.driver_actor.call("scrape_current_chat", self.scrape_current_chat)
+                self.chat_scheduler.record_visit(group_name)
+                await self.queue_scraped_messages(pairs, group_name)
+                self.rescan_groups.discard(group_name)
+
+                unread = await self.driver_actor.call("read_unread_counts", self.read_unread_counts)
+                next_group = self.chat_scheduler.choose(group_name, unread)
+                if next_group != group_name:
+                    await self.driver_actor.call("open_chat", self.open_chat, next_group)
+                else:
+                    await asyncio.sleep(self.poll_interval)
+            except Exception as e:
+                logger.error(f"Error monitoring groups: {e}")
+                registry.inc("pipeline_errors_total", stage="extract")
+                await asyncio.sleep(self.poll_interval)
 
     async def process_incoming_messages(self): 
         """
-        Processes messages from incoming_queue: checks if the message indicates a product need and, if so, queues it for response.
+        Processes queued messages: checks if the message indicates a product need and, if so, queues it for response.
+
+        Everything already waiting in the queue (up to the Groq batch size) is
+        claimed at once and classified concurrently so the GroqClient can
+        batch it into one request. Messages that could not be classified
+        because Groq is unavailable go back to the queue, and the loop waits
+        as long as Groq asked before claiming again.
         """
         while True:
             try:
-                contact, message_text, unique_number = await self.incoming_queue.get()
-                await self.log_user_need(contact, message_text, unique_number)
-
-                is_product_need = await self.groq_client.is_product_need_async(message_text)
-                if is_product_need:
-                    await self.response_queue.put((unique_number,contact, message_text))
-                    logger.info(f"Message categorized as product need: '{message_text}'")
-                
-                self.incoming_queue.task_done()
+                if self.queue_full_policy == BLOCK:
+                    await self.work_queue.wait_for_room(AWAITING_RESPONSE, self.response_queue_size)
+                messages = await self.work_queue.get(QUEUED, CLASSIFYING, self.groq_client.batch_size)
+                results = await asyncio.gather(*(
+                    self.classify_incoming_message(contact, message_text, unique_number, group_name)
+                    for unique_number, contact, message_text, group_name in messages
+                ), return_exceptions=True)
+                needs = [message[0] for message, result in zip(messages, results) if result is True]
+                others = [message[0] for message, result in zip(messages, results) if result is False]
+                await self.work_queue.advance(CLASSIFYING, {AWAITING_RESPONSE: needs, DONE: others})
+                if needs:
+                    await self.work_queue.shed(AWAITING_RESPONSE, self.response_queue_size, self.queue_full_policy)
+                errors = [result for result in results if isinstance(result, BaseException)]
+                if errors:
+                    await self.defer_work(CLASSIFYING, [message[0] for message, result in zip(messages, results)
+                                                        if isinstance(result, BaseException)], errors)
             except Exception as e:
                 logger.error(f"Error processing incoming message: {e}")
+                registry.inc("pipeline_errors_total", stage="classify")
+                await asyncio.sleep(self.work_queue.poll_interval)
+
+    async def classify_incoming_message(self, contact: str, message_text: str, unique_number: int,
+        group_name: str = None) -> bool:
+        """
+        Classifies the message and logs it as a user need.
+
+        Returns:
+            bool: True if the message needs a product recommendation.
+
+        Raises:
+            UpstreamUnavailable: Groq is unavailable; the message was not logged and can be retried.
+        """
+        try:
+            with registry.timer("pipeline_stage_seconds", stage="classify"):
+                decision = self.prefilter.classify(message_text) if self.prefilter else None
+                if decision is None:
+                    is_product_need = await self.groq_client.is_product_need_async(message_text)
+                else:
+                    is_product_need = decision
+                    logger.info(f"Prefilter classified '{message_text}' as {'a' if decision else 'not a'} product need "
+                                f"({self.prefilter.calls_saved} Groq calls saved so far)")
+                await self.log_user_need(contact, message_text, unique_number, group_name)
+            registry.inc("messages_classified_total", result="need" if is_product_need else "other",
+                         source="groq" if decision is None else "prefilter")
+            if is_product_need:
+                logger.info(f"Message categorized as product need: '{message_text}'")
+            return is_product_need
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing incoming message: {e}")
+            registry.inc("pipeline_errors_total", stage="classify")
+            return False
+
+    async def defer_work(self, claimed_state: str, unique_numbers: list, errors: list):
+        """
+        Puts claimed items back in the work queue because an API was
+        unavailable, then waits as long as the API or its circuit breaker
+        asked (at least the queue's poll interval) so the loop does not spin.
+        """
+        stage = "classify" if claimed_state == CLASSIFYING else "respond"
+        try:
+            deferred = await self.work_queue.defer(claimed_state, unique_numbers)
+            registry.inc("work_deferred_total", deferred, stage=stage)
+        except Exception as e:
+            logger.error(f"Error deferring work items {unique_numbers}: {e}")
+        delay = max([getattr(error, "retry_after", None) or 0 for error in errors] + [self.work_queue.poll_interval])
+        logger.warning(f"Deferred {len(unique_numbers)} work items at stage {stage} for {delay:.1f}s: {errors[0]}")
+        await asyncio.sleep(delay)
 
     async def give_product_need_response_to_user(self): 
         """
-        Processes responses from response_queue: gets a response from Perplexity and sends it to the group chat.
+        Processes product needs awaiting a response: gets a response from Perplexity and sends it to the group chat.
+
+        An item is only marked done once it has been handled; if the worker
+        is cancelled first, its lease is released on shutdown and the item is
+        picked up again. While Perplexity is unavailable items are deferred
+        rather than answered with an apology.
         """
         while True:
             try:
-                unique_number, contact, message_text = await self.response_queue.get()
-                response = await self.perplexity_client.get_response_async(message_text, contact,unique_number)
-                await self.send_response(response)
+                [(unique_number, contact, message_text, group_name)] = await self.work_queue.get(
+                    AWAITING_RESPONSE, RESPONDING, 1)
+            except Exception as e:
+                logger.error(f"Error claiming product need: {e}")
+                registry.inc("pipeline_errors_total", stage="respond")
+                await asyncio.sleep(self.work_queue.poll_interval)
+                continue
+            try:
+                # The acknowledgement can wait behind a long outbound queue; keep the item from being reclaimed
+                async with self.work_queue.keep_leased(RESPONDING, [unique_number]):
+                    with registry.timer("pipeline_stage_seconds", stage="respond"):
+                        response = await self.perplexity_client.get_response_async(message_text, contact,
+                                                                                   unique_number, group_name)
+                        await self.send_response(response, priority=PRIORITY_ACKNOWLEDGEMENT, group_name=group_name)
                 logger.info(f"Developer Log - Response for unique number {unique_number}: {response}")
-                self.response_queue.task_done()
+            except UpstreamUnavailable as e:
+                await self.defer_work(RESPONDING, [unique_number], [e])
+                continue
             except Exception as e:
                 logger.error(f"Error giving product need response: {e}")
+                registry.inc("pipeline_errors_total", stage="respond")
+            try:
+                await self.work_queue.advance(RESPONDING, {DONE: [unique_number]})
+            except Exception as e:
+                logger.error(f"Error completing work item {unique_number}: {e}")
 
-    async def send_response(self, response: str):
+    def type_message(self, text: str):
         """
-        Sends the response to the WhatsApp group chat.
+        Types a message into the chat input and sends it.
+
+        Raises:
+            MessageNotSent: If the input box could not be found, so nothing was typed.
         """
         try:
             input_box = self.driver.find_element(By.XPATH, '//div[@aria-placeholder="Type a message"]')
-            input_box.send_keys(response + Keys.ENTER)
+        except Exception as e:
+            raise MessageNotSent(f"Chat input not found: {e}") from e
+        input_box.send_keys(text + Keys.ENTER)
+
+    def send_to_chat(self, text: str, group_name: str):
+        """
+        Opens the given chat if it is not the open one and sends the text there.
+
+        Raises:
+            MessageNotSent: If the chat could not be opened or had no input box.
+        """
+        try:
+            self.open_chat(group_name)
+        except Exception as e:
+            raise MessageNotSent(f"Could not open chat '{group_name}': {e}") from e
+        self.type_message(text)
+
+    async def deliver_message(self, text: str, group_name: str):
+        """
+        Types one outgoing message on the driver thread. Used by the outbound
+        scheduler, which decides when messages go out.
+        """
+        await self.driver_actor.call("send_message", self.send_to_chat, text, group_name)
+
+    async def send_response(self, response: str, priority: int = PRIORITY_RECOMMENDATION, group_name: str = None) -> bool:
+        """
+        Sends the response to a WhatsApp group chat through the outbound
+        scheduler and waits until it has been delivered.
+
+        Args:
+            response (str): Text to send.
+            priority (int): Outbound priority, higher is sent first.
+            group_name (str): Group to send to. Defaults to the first monitored group,
+                which is also where rows recorded without a group came from.
+
+        Returns:
+            bool: True if the response was delivered.
+        """
+        try:
+            await self.outbound.submit(response, group=group_name or self.groups[0], priority=priority)
             logger.info(f"Sent response: {response}")
-            await asyncio.sleep(2)
+            registry.inc("responses_sent_total", outcome="delivered")
+            return True
         except Exception as e:
             logger.error(f"Error sending response: {e}")
+            registry.inc("responses_sent_total", outcome="failed")
+            return False
             
-    async def log_user_need(self, contact: str, message_text: str, unique_number: int):
+    async def log_user_need(self, contact: str, message_text: str, unique_number: int, group_name: str = None):
         """
         Logs the user's need into the database.
         """
         try:
-            await self.database_client.insert_user_need(message_text, contact, unique_number)
+            await self.database_client.insert_user_need(message_text, contact, unique_number, group_name)
             logger.info(f"Logged user need: '{message_text}','{contact}','{unique_number}'")
         except Exception as e:
             logger.error(f"Error logging user need for '{message_text}','{contact}','{unique_number}': {e}")
                        
     async def send_final_responses(self):
+        """
+        Sends responses whose affiliate link has been added. Rows are claimed
+        atomically together with everything needed to send them, and the loop
+        sleeps until the admin app signals a new link or the database changes.
+        """
+        try:
+            unconfirmed = await self.database_client.count_unconfirmed_sends(self.instance_id if self.shard else None)
+            if unconfirmed:
+                logger.warning(f"{unconfirmed} final responses were claimed but not confirmed sent by a previous run; "
+                               f"leaving them alone so nothing is sent twice")
+        except Exception as e:
+            logger.error(f"Error checking unconfirmed sends: {e}")
+        signal = DeliverySignal(self.database_client.db_path, port=Config.DELIVERY_NOTIFY_PORT,
+                                check_interval=Config.DELIVERY_CHECK_SECONDS)
+        async with signal:
+            while True:
+                try:
+                    claimed = await self.database_client.claim_affiliate_responses(
+                        Config.DELIVERY_BATCH_SIZE, owner=self.instance_id,
+                        groups=self.shard.owned_groups if self.shard else None)
+                    # Hand the whole batch to the scheduler at once so it can pace and merge it
+                    await asyncio.gather(*(self.send_final_response(*row) for row in claimed))
+                    if len(claimed) == Config.DELIVERY_BATCH_SIZE:
+                        continue  # More may be waiting
+                except Exception as e:
+                    logger.error(f"Error sending final responses: {e}")
+                    registry.inc("pipeline_errors_total", stage="deliver")
+                await signal.wait()
+
+    async def send_final_response(self, unique_number: int, contact: str, generated_response: str,
+        affiliate_link: str, group_name: str = None):
+        processed_generated_response = self.remove_urls(generated_response).strip()
+        final_response = f"{processed_generated_response}\nProduct Link: {affiliate_link}"
+
+        with registry.timer("pipeline_stage_seconds", stage="deliver"):
+            try:
+                await self.outbound.submit(final_response, group=group_name or self.groups[0])
+            except MessageNotSent as e:
+                # Nothing was typed, so it is safe to send again later
+                logger.warning(f"Final response for unique number {unique_number} was not sent, requeueing: {e}")
+                registry.inc("responses_sent_total", outcome="failed")
+                await self.database_client.release_claimed_response(unique_number, owner=self.instance_id)
+                return
+            except Exception as e:
+                # It may have gone out, so it stays claimed rather than risk a duplicate send
+                logger.error(f"Error sending final response for unique number {unique_number}, "
+                             f"left for an operator to check: {e}")
+                registry.inc("responses_sent_total", outcome="failed")
+                return
+            registry.inc("responses_sent_total", outcome="delivered")
+            if await self.database_client.mark_as_sent(unique_number, owner=self.instance_id):
+                logger.info(f"Sent final response for unique number: {unique_number}")
+
+    async def log_queue_stats(self):
+        """
+        Periodically logs queue depth, drop counts, WebDriver command timings and send latency.
+        """
         while True:
+            await asyncio.sleep(Config.QUEUE_STATS_INTERVAL_SECONDS)
             try:
-                pending_responses = await self.database_client.fetch_pending_affiliates()
-                for entry in pending_responses:
-                    unique_number, generated_response = entry
- 
-                    async with aiosqlite.connect(self.database_client.db_path) as db:
-                        cursor = await db.execute("""
-                            SELECT affiliate_link, contact
-                            FROM final_response_table
-                            WHERE unique_number = ?;
-                        """, (unique_number,))
-                        row = await cursor.fetchone()
-
-                        if row:
-                            affiliate_link, contact = row
-
-                            processed_generated_response = self.remove_urls(generated_response).strip()
-                            final_response = f"{processed_generated_response}\nProduct Link: {affiliate_link}"
-
-                            await self.send_response(final_response)
-                            await self.database_client.mark_as_sent(unique_number)
-                            logger.info(f"Sent final response for unique number: {unique_number}")
-
-                await asyncio.sleep(10)
+                logger.info(f"Work queue stats: {await self.work_queue.stats()}")
+                logger.info(f"WebDriver command timings: {self.driver_actor.stats()}")
+                logger.info(f"Outbound stats: {self.outbound.stats()}")
+                if len(self.groups) > 1:
+                    logger.info(f"Chat visits: {self.chat_scheduler.stats()}")
+                if self.shard is not None:
+                    logger.info(f"Shard stats: {self.shard.stats()}")
             except Exception as e:
-                logger.error(f"Error sending final responses: {e}")
-                await asyncio.sleep(10)
+                logger.error(f"Error reading work queue stats: {e}")
+
+    async def collect_metrics(self):
+        """
+        Updates queue depth gauges and mirrors the counters kept by the
+        pipeline's components into the metrics registry. Run by the metrics
+        sink before each write.
+        """
+        counts = await self.work_queue.counts()
+        for state in ACTIVE_STATES:
+            registry.set("work_queue_depth", counts.get(state, 0), state=state)
+
+        outbound = self.outbound.stats()
+        registry.set("outbound_queue_depth", outbound["queued"])
+        registry.set("outbound_interval_seconds", outbound["interval"])
+        for outcome in ("sent", "delivered", "merged", "failures"):
+            registry.set("outbound_messages_total", outbound[outcome], kind=COUNTER, outcome=outcome)
+
+        caches = {"dedup": (self.deduplicator.cache_hits, self.deduplicator.db_lookups)}
+        if self.classification_cache is not None:
+            cache = self.classification_cache
+            caches["classification"] = (cache.memory_hits + cache.db_hits, cache.misses)
+        if self.recommendation_coalescer is not None:
+            coalescer = self.recommendation_coalescer
+            caches["recommendation"] = (coalescer.coalesced, coalescer.leaders)
+        for name, (hits, misses) in caches.items():
+            registry.set("cache_lookups_total", hits, kind=COUNTER, cache=name, result="hit")
+            registry.set("cache_lookups_total", misses, kind=COUNTER, cache=name, result="miss")
+            registry.set("cache_hit_ratio", hits / (hits + misses) if hits + misses else 0.0, cache=name)
+
+        for api, limiter in (("groq", self.groq_rate_limiter), ("perplexity", self.perplexity_rate_limiter)):
+            registry.set("api_throttled_seconds_total", limiter.throttled_seconds, kind=COUNTER, api=api)
+
+        for command, timing in list(self.driver_actor.timings.items()):
+            registry.set("driver_commands_total", timing.count, kind=COUNTER, command=command)
+            registry.set("driver_command_errors_total", timing.errors, kind=COUNTER, command=command)
+            registry.set("driver_command_seconds_total", timing.total_seconds, kind=COUNTER, command=command)
+
+    def apply_group_ownership(self, owned: set):
+        """
+        Limits the work queue, deliveries and chat visits to the groups this
+        instance owns. Groups gained since the last call lose their
+        high-water mark: their messages were scraped but not queued while
+        another instance owned them, so the next scrape rereads the whole
+        chat and the deduplicator drops what the owner already queued.
+        """
+        gained = set(owned) - self.owned_groups if self.owned_groups is not None else set()
+        for group in gained:
+            self.last_seen_messages.pop(group, None)
+            self.rescan_groups.add(group)
+        if gained:
+            logger.info(f"Took over groups {sorted(gained)}; rescanning their chats")
+        self.owned_groups = set(owned)
+        self.work_queue.groups = owned
+        self.chat_scheduler.set_groups([group for group in self.groups if group in owned])
+
+    async def maintain_shard(self):
+        """
+        Heartbeats for this instance, follows changes in group ownership and
+        hands back the work claimed by instances that stopped heartbeating.
+        """
+        while True:
+            await asyncio.sleep(self.shard.heartbeat_interval)
+            try:
+                self.apply_group_ownership(await self.shard.heartbeat())
+                for instance_id in await self.shard.reap_dead_instances():
+                    await self.work_queue.release_leases(instance_id)
+                    # Whether these went out is unknown, so they are reported rather than resent
+                    unconfirmed = await self.database_client.count_unconfirmed_sends(instance_id)
+                    if unconfirmed:
+                        logger.warning(f"Instance '{instance_id}' left {unconfirmed} final responses claimed "
+                                       f"but not confirmed sent")
+            except Exception as e:
+                logger.error(f"Error maintaining shard membership: {e}")
+
+    async def shutdown(self, producers, workers):
+        """
+        Stops the pipeline: producers are cancelled first, workers get up to
+        shutdown_grace_period seconds to drain what is already queued, and
+        are then cancelled. Waits until every task has finished and hands
+        unfinished leases back to the work queue for the next run.
+        """
+        for task in producers:
+            task.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+        if any(not task.done() for task in workers):
+            try:
+                await asyncio.wait_for(self._drain_queues(), self.shutdown_grace_period)
+            except asyncio.TimeoutError:
+                logger.warning("Shutting down with work still queued; it will resume on the next run")
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        try:
+            await self.work_queue.release_leases()
+        except Exception as e:
+            logger.error(f"Error releasing work item leases: {e}")
+        logger.info("All pipeline tasks stopped.")
+
+    async def _drain_queues(self):
+        await self.work_queue.wait_until_idle()
 
     async def run(self):
             try:
-                # Open WhatsApp Web and select the group
-                self.open_whatsapp_web()
-                self.select_group()
+                # Keep pooled database connections open for the lifetime of the bot
+                await self.database_client.open()
+                await self.perplexity_client.open()
+                await self.deduplicator.warm()
+                if self.shard is not None:
+                    self.apply_group_ownership(await self.shard.register())
+                    # Other instances are running, so only leases held under this instance ID are recovered
+                    await self.work_queue.release_leases()
+                else:
+                    await self.work_queue.recover()
+                await self.work_queue.purge_finished(Config.WORK_QUEUE_RETENTION_SECONDS)
+                if self.metrics_sink is not None:
+                    self.metrics_sink.start()
+                if self.classification_cache:
+                    await self.classification_cache.purge_expired()
+                    await self.classification_cache.warm_from_logs()
+                if self.prefilter and Config.PREFILTER_TRAIN_FROM_LOGS:
+                    await self.prefilter.train_from_logs(self.database_client)
+
+                # Open WhatsApp Web and select the group on the driver thread
+                self.driver_actor.start()
+                await self.driver_actor.call("open_whatsapp_web", self.open_whatsapp_web)
+                await self.driver_actor.call("select_group", self.select_group)
+                self.outbound.start()
 
                 # Start asynchronous tasks
-                tasks = [
+                producers = [
                     # Extract new messages from the queue
                     asyncio.create_task(self.extract_new_messages()),
 
-                    # Process incoming messages and send them to the response queue
-                    asyncio.create_task(self.process_incoming_messages()),
+                    # Periodically check and send final responses with affiliate links
+                    asyncio.create_task(self.send_final_responses()),
 
+                    # Report queue depth and drops
+                    asyncio.create_task(self.log_queue_stats())
+                ]
+                if self.shard is not None:
+                    # Keep this instance's group leases alive and take over those of dead instances
+                    producers.append(asyncio.create_task(self.maintain_shard()))
+                workers = [
+                    # Process incoming messages and send them to the response queue
+                    asyncio.create_task(self.process_incoming_messages())
+                    for _ in range(self.classifier_workers)
+                ] + [
                     # Generate product need responses and send to the group chat
-                    asyncio.create_task(self.give_product_need_response_to_user()),
-
-                    # Periodically check and send final responses with affiliate links
-                    asyncio.create_task(self.send_final_responses())
+                    asyncio.create_task(self.give_product_need_response_to_user())
+                    for _ in range(self.responder_workers)
                 ]
+                logger.info(f"Started {self.classifier_workers} classifier and {self.responder_workers} responder workers")
 
                 # Run all tasks concurrently
-                await asyncio.gather(*tasks)
+                # asyncio.wait (unlike gather) leaves the tasks running when cancelled, so shutdown can drain them
+                try:
+                    done, _ = await asyncio.wait(producers + workers, return_when=asyncio.FIRST_EXCEPTION)
+                    for task in done:
+                        task.result()
+                finally:
+                    await self.shutdown(producers, workers)
 
             except Exception as e:
                 logger.error(f"Error in run method: {e}")
-                self.driver.quit()
+                await self.driver_actor.call("quit", self.driver.quit)
                 raise
+            finally:
+                await self.outbound.stop()
+                await self.driver_actor.stop()
+                await self.groq_client.close()
+                await self.perplexity_client.close()
+                if self.shard is not None:
+                    try:
+                        await self.shard.deregister()
+                    except Exception as e:
+                        logger.error(f"Error deregistering bot instance: {e}")
+                if self.metrics_sink is not None:
+                    await self.metrics_sink.stop()
+                await self.database_client.close()
 
 
 if __name__ == "__main__":
-    group_name = "affbot"  
-    bot = WhatsAppBot(group_name)
+    bot = WhatsAppBot(Config.MONITORED_GROUPS)
     asyncio.run(bot.run())
@@ -0,0 +1,428 @@
+# work_queue.py
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Pipeline states of a message in 'work_items'
+QUEUED = "queued"                        # waiting for a classifier
+CLASSIFYING = "classifying"              # leased by a classifier
+AWAITING_RESPONSE = "awaiting_response"  # product need waiting for a responder
+RESPONDING = "responding"                # leased by a responder
+DONE = "done"
+EXPIRED = "expired"                      # shed because the queue was full or the item went stale
+FAILED = "failed"                        # leases kept expiring, given up on
+
+# State an item returns to when the lease on a claimed state is lost
+READY_STATE = {CLASSIFYING: QUEUED, RESPONDING: AWAITING_RESPONSE}
+ACTIVE_STATES = (QUEUED, CLASSIFYING, AWAITING_RESPONSE, RESPONDING)
+
+# What happens when a stage holds more than its bound: producers wait for
+# room, the oldest lowest-priority items are expired, or the items older than
+# max_age are expired before the oldest
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_EXPIRED = "drop_expired"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_EXPIRED)
+
+WORK_ITEM_INSERT = """
+    INSERT OR IGNORE INTO work_items (unique_number, contact, message_text, priority, group_name, state,
+                                      created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# Restricts a query to the groups passed as a JSON array; a NULL parameter matches every group
+GROUP_FILTER = "(? IS NULL OR group_name IN (SELECT value FROM json_each(?)))"
+
+def groups_param(groups):
+    """
+    Encodes a collection of group names for GROUP_FILTER; None matches every group.
+    """
+    return None if groups is None else json.dumps(sorted(groups))
+
+class DurableWorkQueue:
+    def __init__(self, db_client, lease_seconds: float = 300, max_age: float = None, max_attempts: int = 3,
+        poll_interval: float = 1.0, worker_id: str = None):
+        """
+        Work queue kept in the 'work_items' table, so messages that were
+        scraped but not yet classified or answered survive a restart.
+
+        Items move queued -> classifying -> awaiting_response -> responding
+        -> done. A worker claims a batch with one UPDATE ... RETURNING, which
+        moves it to the leased state; if the worker dies, the lease expires
+        and the item is handed out again. Delivery is at-least-once.
+
+        Args:
+            db_client (DatabaseClient): Database holding 'work_items'.
+            lease_seconds (float): How long a claimed item stays with its worker.
+            max_age (float): Seconds an item may wait in a ready state before it expires, None to keep it.
+            max_attempts (int): Claims after which an item whose leases keep expiring is marked failed.
+            poll_interval (float): Seconds between checks for work added by other processes.
+            worker_id (str): Lease owner name. Defaults to host, pid and a random suffix.
+
+        Set `groups` to limit claims, counts and shedding to items from
+        those groups, as a sharded instance does for the groups it owns.
+        """
+        self.db_client = db_client
+        self.lease_seconds = lease_seconds
+        self.max_age = max_age or None
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.groups = None
+        self._wakeups = {}
+        self._last_reclaim = 0.0
+
+        self.enqueued = 0
+        self.claimed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.reclaimed = 0
+        self.deferred = 0
+
+    def _wakeup(self, state: str) -> asyncio.Event:
+        return self._wakeups.setdefault(state, asyncio.Event())
+
+    def notify(self, state: str, added: int = 0):
+        """
+        Wakes local workers waiting for items in `state`, counting `added`
+        items that were inserted outside enqueue().
+        """
+        self.enqueued += added
+        self._wakeup(state).set()
+
+    async def enqueue(self, items, state: str = QUEUED, group_name: str = None) -> int:
+        """
+        Adds (unique_number, contact, message_text, priority) items from
+        `group_name`. Items whose unique_number is already queued are ignored.
+
+        Returns:
+            int: The number of items added.
+        """
+        now = time.time()
+        added = 0
+        async with self.db_client.transaction() as db:
+            for unique_number, contact, message_text, priority in items:
+                cursor = await db.execute(WORK_ITEM_INSERT, (unique_number, contact, message_text, priority,
+                                                             group_name, state, now, now))
+                added += cursor.rowcount
+        self.notify(state, added)
+        return added
+
+    async def claim(self, state: str, claimed_state: str, limit: int) -> list:
+        """
+        Leases up to `limit` items in `state`, highest priority and oldest
+        first, moving them to `claimed_state`.
+
+        Returns:
+            list: (unique_number, contact, message_text, group_name) tuples.
+        """
+        now = time.time()
+        if now - self._last_reclaim > min(self.lease_seconds, 60) / 2:
+            self._last_reclaim = now
+            await self.reclaim_expired_leases()
+        groups = groups_param(self.groups)
+        async with self.db_client.transaction() as db:
+            if self.max_age is not None:
+                cursor = await db.execute(f"""
+                    UPDATE work_items SET state = ?, updated_at = ?
+                    WHERE state = ? AND updated_at < ? AND {GROUP_FILTER};
+                """, (EXPIRED, now, state, now - self.max_age, groups, groups))
+                if cursor.rowcount:
+                    self.expired += cursor.rowcount
+                    logger.warning(f"Expired {cursor.rowcount} stale '{state}' work items")
+            cursor = await db.execute(f"""
+                UPDATE work_items
+                SET state = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                WHERE unique_number IN (
+                    SELECT unique_number FROM work_items WHERE state = ? AND {GROUP_FILTER}
+                    ORDER BY priority DESC, unique_number LIMIT ?
+                )
+                RETURNING unique_number, contact, message_text, group_name, priority;
+            """, (claimed_state, self.worker_id, now + self.lease_seconds, now, state, groups, groups, limit))
+            rows = await cursor.fetchall()
+        self.claimed += len(rows)
+        rows.sort(key=lambda row: (-row[4], row[0]))
+        return [row[:4] for row in rows]
+
+    async def get(self, state: str, claimed_state: str, limit: int) -> list:
+        """
+        Like claim(), but waits until at least one item is available. Local
+        enqueues wake the caller immediately; work added by other processes
+        is picked up within poll_interval.
+        """
+        wakeup = self._wakeup(state)
+        while True:
+            wakeup.clear()
+            items = await self.claim(state, claimed_state, limit)
+            if items:
+                return items
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def advance(self, claimed_state: str, transitions: dict):
+        """
+        Moves claimed items on to their next state in one transaction.
+        Items whose lease was lost to another worker are left alone.
+
+        Args:
+            claimed_state (str): The state the items were claimed into.
+            transitions (dict): Next state -> unique numbers.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            await db.executemany("""
+                UPDATE work_items
+                SET state = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE unique_number = ? AND state = ? AND lease_owner = ?;
+            """, [(next_state, now, unique_number, claimed_state, self.worker_id)
+                  for next_state, unique_numbers in transitions.items() for unique_number in unique_numbers])
+        for next_state, unique_numbers in transitions.items():
+            if unique_numbers:
+                self.notify(next_state)
+
+    async def defer(self, claimed_state: str, unique_numbers) -> int:
+        """
+        Hands claimed items back to their ready state without counting an
+        attempt against them, for work that could not be done because an
+        upstream API was unavailable. Waiting workers are not woken; the
+        caller backs off before claiming again.
+
+        Returns:
+            int: The number of items deferred.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            cursor = await db.executemany("""
+                UPDATE work_items
+                SET state = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    attempts = MAX(attempts - 1, 0), updated_at = ?
+                WHERE unique_number = ? AND state = ? AND lease_owner = ?;
+            """, [(READY_STATE[claimed_state], now, unique_number, claimed_state, self.worker_id)
+                  for unique_number in unique_numbers])
+            deferred = cursor.rowcount
+        self.deferred += deferred
+        return deferred
+
+    async def renew(self, claimed_state: str, unique_numbers) -> int:
+        """
+        Extends the leases this worker holds on claimed items by
+        lease_seconds, for work that is still in progress.
+
+        Returns:
+            int: The number of leases renewed.
+        """
+        now = time.time()
+        async with self.db_client.transaction() as db:
+            cursor = await db.executemany("""
+                UPDATE work_items SET lease_expires_at = ?
+                WHERE unique_number = ? AND state = ? AND lease_owner = ?;
+            """, [(now + self.lease_seconds, unique_number, claimed_state, self.worker_id)
+                  for unique_number in unique_numbers])
+            return cursor.rowcount
+
+    @asynccontextmanager
+    async def keep_leased(self, claimed_state: str, unique_numbers):
+        """
+        Renews the leases on claimed items every third of lease_seconds while
+        the block runs, so work that waits on a slow API or a long outbound
+        queue is not reclaimed and handled twice.
+        """
+        async def renew_periodically():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    await self.renew(claimed_state, unique_numbers)
+                except Exception as e:
+                    logger.error(f"Error renewing leases on work items {unique_numbers}: {e}")
+
+        renewer = asyncio.create_task(renew_periodically())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+
+    async def reclaim_expired_leases(self) -> int:
+        """
+        Returns items whose lease has expired to their ready state, or marks
+        them failed once they have been claimed max_attempts times.
+
+        Returns:
+            int: The number of items reclaimed.
+        """
+        now = time.time()
+        reclaimed = 0
+        async with self.db_client.transaction() as db:
+            for claimed_state, ready_state in READY_STATE.items():
+                cursor = await db.execute("""
+                    UPDATE work_items
+                    SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                        lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                    WHERE state = ? AND lease_expires_at < ?;
+                """, (self.max_attempts, FAILED, ready_state, now, claimed_state, now))
+                reclaimed += cursor.rowcount
+        if reclaimed:
+            self.reclaimed += reclaimed
+            logger.warning(f"Reclaimed {reclaimed} work items with expired leases")
+            for ready_state in READY_STATE.values():
+                self.notify(ready_state)
+        return reclaimed
+
+    async def release_leases(self, owner: str = None) -> int:
+        """
+        Hands the items leased by `owner` (default: this queue's worker) back
+        to their ready state without counting an attempt against them.
+
+        Returns:
+            int: The number of items released.
+        """
+        now = time.time()
+        released = 0
+        async with self.db_client.transaction() as db:
+            for claimed_state, ready_state in READY_STATE.items():
+                cursor = await db.execute("""
+                    UPDATE work_items
+                    SET state = ?, lease_owner = NULL, lease_expires_at = NULL,
+                        attempts = MAX(attempts - 1, 0), updated_at = ?
+                    WHERE state = ? AND lease_owner = ?;
+                """, (ready_state, now, claimed_state, owner or self.worker_id))
+                released += cursor.rowcount
+        if released:
+            logger.info(f"Released {released} leased work items")
+        return released
+
+    async def recover(self) -> int:
+        """
+        Resumes work left unfinished by a previous run: every leased item is
+        returned to its ready state right away instead of waiting for the
+        lease to expire. Only call this while no other process is consuming
+        the queue; sharded instances release the leases of dead instances
+        with release_leases() instead.
+
+        Returns:
+            int: The number of items recovered.
+        """
+        now = time.time()
+        recovered = 0
+        async with self.db_client.transaction() as db:
+            for claimed_state, ready_state in READY_STATE.items():
+                cursor = await db.execute("""
+                    UPDATE work_items SET state = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                    WHERE state = ?;
+                """, (ready_state, now, claimed_state))
+                recovered += cursor.rowcount
+        counts = await self.counts()
+        logger.info(f"Recovered {recovered} in-flight work items; {counts.get(QUEUED, 0)} queued and "
+                    f"{counts.get(AWAITING_RESPONSE, 0)} awaiting response")
+        return recovered
+
+    async def wait_for_room(self, state: str, maxsize: int):
+        """
+        Blocks while `maxsize` or more items are in `state` (backpressure).
+        """
+        if maxsize <= 0:
+            return
+        while (await self.counts()).get(state, 0) >= maxsize:
+            await asyncio.sleep(self.poll_interval)
+
+    async def shed(self, state: str, maxsize: int, policy: str) -> int:
+        """
+        Applies a drop policy to the items in `state` beyond `maxsize`:
+        'drop_oldest' expires the oldest lowest-priority items; 'drop_expired'
+        expires the items that have waited longer than max_age, then the
+        oldest ones if the state is still over its bound. 'block' is handled
+        by wait_for_room().
+
+        Returns:
+            int: The number of items shed.
+
+        Raises:
+            ValueError: If the policy is not one of POLICIES.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {POLICIES}")
+        if maxsize <= 0 or policy == BLOCK:
+            return 0
+        excess = (await self.counts()).get(state, 0) - maxsize
+        if excess <= 0:
+            return 0
+        now = time.time()
+        groups = groups_param(self.groups)
+        stale = 0
+        async with self.db_client.transaction() as db:
+            if policy == DROP_EXPIRED and self.max_age is not None:
+                cursor = await db.execute(f"""
+                    UPDATE work_items SET state = ?, updated_at = ?
+                    WHERE state = ? AND updated_at < ? AND {GROUP_FILTER};
+                """, (EXPIRED, now, state, now - self.max_age, groups, groups))
+                stale = cursor.rowcount
+                excess -= stale
+            shed = 0
+            if excess > 0:
+                order = "priority ASC, unique_number ASC" if policy == DROP_OLDEST else "unique_number ASC"
+                cursor = await db.execute(f"""
+                    UPDATE work_items SET state = ?, updated_at = ?
+                    WHERE unique_number IN (
+                        SELECT unique_number FROM work_items WHERE state = ? AND {GROUP_FILTER}
+                        ORDER BY {order} LIMIT ?
+                    );
+                """, (EXPIRED, now, state, groups, groups, excess))
+                shed = cursor.rowcount
+        self.expired += stale
+        self.evicted += shed
+        logger.warning(f"Work queue '{state}' over {maxsize} items, shed {stale} stale and {shed} oldest ({policy})")
+        return stale + shed
+
+    async def counts(self) -> dict:
+        """
+        Returns the number of items per state, leaving out empty states.
+        """
+        groups = groups_param(self.groups)
+        async with self.db_client.connection() as db:
+            cursor = await db.execute(f"SELECT state, COUNT(*) FROM work_items WHERE {GROUP_FILTER} GROUP BY state;",
+                                      (groups, groups))
+            return dict(await cursor.fetchall())
+
+    async def wait_until_idle(self):
+        """
+        Waits until no item is queued or in flight.
+        """
+        while True:
+            counts = await self.counts()
+            if not any(counts.get(state) for state in ACTIVE_STATES):
+                return
+            await asyncio.sleep(min(self.poll_interval, 0.1))
+
+    async def purge_finished(self, older_than: float) -> int:
+        """
+        Deletes done, expired and failed items last updated more than
+        `older_than` seconds ago.
+        """
+        async with self.db_client.transaction() as db:
+            cursor = await db.execute("""
+                DELETE FROM work_items WHERE state IN (?, ?, ?) AND updated_at < ?;
+            """, (DONE, EXPIRED, FAILED, time.time() - older_than))
+            purged = cursor.rowcount
+        logger.info(f"Purged {purged} finished work items")
+        return purged
+
+    async def stats(self) -> dict:
+        return {
+            "states": await self.counts(),
+            "enqueued": self.enqueued,
+            "claimed": self.claimed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "reclaimed": self.reclaimed,
+            "deferred": self.deferred,
+        }